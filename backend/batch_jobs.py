@@ -0,0 +1,269 @@
+import os
+import time
+import queue
+import asyncio
+import logging
+import threading
+from datetime import datetime, timedelta
+import cv2
+from sqlalchemy import select, update, func
+from database import AsyncSessionLocal
+from models import BatchJob
+from gallery import get_gallery
+from storage import upload_snapshot
+from derivatives import store_derivatives
+from sightings import record_sighting, buffer_hits
+from resources import run_inference
+from matching import MatchFilter
+from config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+_DONE = object()
+_tasks: set[asyncio.Task] = set()
+
+
+def resolve_source(path: str) -> str:
+    """Absolute path of a video or image folder, refusing anything outside BATCH_INPUT_DIR."""
+    root = os.path.realpath(settings.BATCH_INPUT_DIR)
+    full = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, full]) != root or not os.path.exists(full):
+        raise ValueError(f"Source not found under {settings.BATCH_INPUT_DIR}: {path}")
+    return full
+
+
+def _put(out: queue.Queue, item, stop: threading.Event) -> bool:
+    while not stop.is_set():
+        try:
+            out.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _decode_video(path: str, start: int, end: int, step: int, fps: float, out: queue.Queue, stop: threading.Event):
+    """Decode frames [start, end), keeping every `step`-th; grab() skips the rest without a full decode."""
+    name = os.path.basename(path)
+    cap = cv2.VideoCapture(path)
+    try:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        idx = start
+        while idx < end and not stop.is_set():
+            if not cap.grab():
+                break
+            if idx % step == 0:
+                ok, frame = cap.retrieve()
+                if ok and not _put(out, (name, idx / fps, frame), stop):
+                    break
+            idx += 1
+    finally:
+        cap.release()
+        _put(out, _DONE, stop)
+
+
+def _decode_images(paths: list[str], out: queue.Queue, stop: threading.Event):
+    for path in paths:
+        if stop.is_set():
+            break
+        frame = cv2.imread(path, cv2.IMREAD_COLOR)
+        if frame is not None and not _put(out, (os.path.basename(path), None, frame), stop):
+            break
+    _put(out, _DONE, stop)
+
+
+def _plan_decoders(path: str, sample_every_s: float, out: queue.Queue, stop: threading.Event) -> tuple[int, list[threading.Thread]]:
+    """Split the source across BATCH_DECODE_WORKERS threads; returns (frames to process, threads)."""
+    workers = max(1, settings.BATCH_DECODE_WORKERS)
+    if os.path.isdir(path):
+        files = sorted(os.path.join(path, f) for f in os.listdir(path) if os.path.splitext(f)[1].lower() in IMAGE_EXTS)
+        chunks = [files[i::workers] for i in range(workers)]
+        threads = [threading.Thread(target=_decode_images, args=(c, out, stop), daemon=True) for c in chunks if c]
+        return len(files), threads
+
+    cap = cv2.VideoCapture(path)
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    cap.release()
+    if frame_count <= 0:
+        raise ValueError(f"Could not read video: {os.path.basename(path)}")
+    step = max(1, int(round(sample_every_s * fps)))
+    bounds = [frame_count * i // workers for i in range(workers + 1)]
+    threads = [
+        threading.Thread(target=_decode_video, args=(path, bounds[i], bounds[i + 1], step, fps, out, stop), daemon=True)
+        for i in range(workers) if bounds[i + 1] > bounds[i]
+    ]
+    return (frame_count + step - 1) // step, threads
+
+
+def _search_frames(frames: list[tuple], gallery, flt: MatchFilter | None = None) -> tuple[int, list[dict]]:
+    """
+    Detect in every frame, embed all faces from the batch in one pass and match
+    them. Keeps only the best hit per person in the batch.
+    """
+    from face_utils import detect_faces, embed_faces
+    from quality import select_faces
+
+    crops, owners, scores = [], [], []
+    for i, (_, _, frame) in enumerate(frames):
+        # Blurry, tiny or badly exposed faces are dropped before the embedder
+        for _, _, q, crop in select_faces(frame, detect_faces(frame, min_size=20)):
+            crops.append(crop)
+            owners.append(i)
+            scores.append(q["score"])
+    if not crops or len(gallery) == 0:
+        return len(crops), []
+
+    best: dict[int, dict] = {}
+    vecs = embed_faces(crops)
+    for vec, i, q, (row, dist) in zip(vecs, owners, scores, gallery.best_matches(vecs, flt)):
+        if row is None:
+            continue
+        confidence = max(0.0, 1.0 - dist)
+        if row not in best or confidence > best[row]["confidence"]:
+            source, offset, frame = frames[i]
+            best[row] = {"row": row, "confidence": confidence, "source": source, "offset": offset, "frame": frame, "encoding": vec.tolist(), "quality": q}
+    return len(crops), list(best.values())
+
+
+async def _write_matches(db, job: BatchJob, gallery, matches: list[dict],
+                         recorded_at: datetime | None, latitude: float | None, longitude: float | None) -> list[dict | None]:
+    """Record every match as a sighting; returns the sampled hits to buffer once the caller has committed."""
+    hits = []
+    for m in matches:
+        row = m["row"]
+        ok, buf = cv2.imencode(".jpg", m["frame"])
+
+        async def snapshot():
+            return await upload_snapshot(buf.tobytes(), gallery.case_ids[row]) if ok else None
+
+        timestamp = recorded_at + timedelta(seconds=m["offset"]) if recorded_at and m["offset"] is not None else datetime.utcnow()
+        det, snapshot_changed, hit = await record_sighting(
+            db, gallery.ids[row], gallery.names[row], gallery.case_ids[row],
+            job.camera_id or f"BATCH-{job.id[:8]}", m["confidence"], snapshot, timestamp,
+            latitude=latitude,
+            longitude=longitude,
+            location=f"Lat {latitude:.2f}, Lon {longitude:.2f}" if latitude is not None and longitude is not None else "Batch Search",
+            source=m["source"],
+            frame_offset=m["offset"],
+            encoding=m["encoding"],
+            quality=m["quality"],
+        )
+        if snapshot_changed:
+            for key, url in (await store_derivatives(det.snapshot_url, buf.tobytes())).items():
+                setattr(det, key, url)
+        hits.append(hit)
+    return hits
+
+
+async def run_batch_job(job_id: str, recorded_at: datetime | None = None,
+                        latitude: float | None = None, longitude: float | None = None):
+    """Stream a video or image folder through detection, embedding and matching, recording progress on the job row."""
+    stop = threading.Event()
+    frames_q: queue.Queue = queue.Queue(maxsize=settings.BATCH_FRAMES * 4)
+    async with AsyncSessionLocal() as db:
+        job = (await db.execute(select(BatchJob).where(BatchJob.id == job_id))).scalar_one()
+        try:
+            # Snapshot: the job keeps matching against the gallery it started with
+            gallery = await get_gallery()
+            flt = MatchFilter.from_settings(latitude, longitude)
+
+            total, decoders = _plan_decoders(job.source, job.sample_every_s, frames_q, stop)
+            job.total_frames = total
+            job.status = "running"
+            job.started_at = job.heartbeat_at = datetime.utcnow()
+            await db.commit()
+            for t in decoders:
+                t.start()
+
+            t0 = time.monotonic()
+            remaining = len(decoders)
+            batch, hits = [], []
+            while remaining:
+                item = await asyncio.to_thread(frames_q.get)
+                if item is _DONE:
+                    remaining -= 1
+                else:
+                    batch.append(item)
+                if len(batch) < settings.BATCH_FRAMES and remaining:
+                    continue
+                if batch:
+                    faces, matches = await run_inference(_search_frames, batch, gallery, flt)
+                    hits = await _write_matches(db, job, gallery, matches, recorded_at, latitude, longitude)
+                    job.processed_frames += len(batch)
+                    job.faces_found += faces
+                    job.matches += len(matches)
+                    job.frames_per_sec = round(job.processed_frames / max(time.monotonic() - t0, 1e-6), 2)
+                    batch = []
+                job.heartbeat_at = datetime.utcnow()
+                await db.commit()
+                buffer_hits(hits)
+                hits = []
+                # Cancellation is requested through the row, so any worker can ask for it
+                await db.refresh(job, ["status"])
+                if job.status == "cancelling":
+                    stop.set()
+                    break
+
+            job.status = "cancelled" if stop.is_set() else "completed"
+        except asyncio.CancelledError:
+            # Worker shutting down: nothing resumes the job, so record that rather than leave it running
+            stop.set()
+            await db.rollback()
+            job.status = "failed"
+            job.error = "Interrupted: the worker running it shut down"
+            job.finished_at = datetime.utcnow()
+            await db.commit()
+            raise
+        except Exception as e:
+            logger.error(f"Batch search {job_id} failed: {e}")
+            stop.set()
+            await db.rollback()
+            job.status = "failed"
+            job.error = str(e)
+        job.finished_at = datetime.utcnow()
+        await db.commit()
+
+
+def start_batch_job(job_id: str, **kwargs) -> asyncio.Task:
+    task = asyncio.create_task(run_batch_job(job_id, **kwargs))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return task
+
+
+async def stop_batch_jobs():
+    """Cancel this worker's jobs on shutdown; each marks itself failed."""
+    tasks = list(_tasks)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def reap_stale_jobs():
+    """
+    Fail unfinished jobs that have stopped reporting progress, from every API worker.
+    Jobs are in-process tasks, so a worker that crashed or was killed leaves its jobs
+    queued or running with nothing left to finish them.
+    """
+    while True:
+        try:
+            now = datetime.utcnow()
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    update(BatchJob)
+                    .where(
+                        BatchJob.status.in_(("queued", "running", "cancelling")),
+                        func.coalesce(BatchJob.heartbeat_at, BatchJob.created_at)
+                        < now - timedelta(seconds=settings.BATCH_JOB_STALE_SECONDS),
+                    )
+                    .values(status="failed", error="Interrupted: its worker stopped", finished_at=now)
+                )
+                await db.commit()
+            if result.rowcount:
+                logger.warning(f"Batch search: marked {result.rowcount} orphaned jobs failed")
+        except Exception as e:
+            logger.warning(f"Batch job reaping failed: {e}")
+        await asyncio.sleep(settings.BATCH_JOB_STALE_SECONDS / 2)
@@ -0,0 +1,54 @@
+import os
+import sys
+import asyncio
+import argparse
+from datetime import datetime
+
+# Add backend directory to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from resources import apply_thread_env
+apply_thread_env()
+
+from database import AsyncSessionLocal
+from models import BatchJob
+from batch_jobs import run_batch_job
+
+async def batch_search(args):
+    async with AsyncSessionLocal() as db:
+        job = BatchJob(source=os.path.abspath(args.source), camera_id=args.camera_id, sample_every_s=args.every)
+        db.add(job)
+        await db.commit()
+        job_id = job.id
+    print(f"Batch search {job_id} started on {args.source}")
+
+    task = asyncio.create_task(run_batch_job(
+        job_id,
+        recorded_at=datetime.fromisoformat(args.recorded_at) if args.recorded_at else None,
+        latitude=args.lat,
+        longitude=args.lon,
+    ))
+    while not task.done():
+        await asyncio.sleep(2)
+        async with AsyncSessionLocal() as db:
+            job = await db.get(BatchJob, job_id)
+            print(f"  [{job.status}] {job.processed_frames}/{job.total_frames or '?'} frames, "
+                  f"{job.faces_found} faces, {job.matches} matches, {job.frames_per_sec or 0} frames/s")
+    await task
+
+    async with AsyncSessionLocal() as db:
+        job = await db.get(BatchJob, job_id)
+        print(f"Finished: {job.status}. {job.matches} matches written as detections." + (f" Error: {job.error}" if job.error else ""))
+
+def main():
+    parser = argparse.ArgumentParser(description="Match a video file or image folder against the registry.")
+    parser.add_argument("source", help="video file or folder of images")
+    parser.add_argument("--every", type=float, default=1.0, help="seconds between sampled video frames")
+    parser.add_argument("--camera-id", default=None)
+    parser.add_argument("--lat", type=float, default=None)
+    parser.add_argument("--lon", type=float, default=None)
+    parser.add_argument("--recorded-at", default=None, help="ISO timestamp the footage starts at")
+    asyncio.run(batch_search(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Cost per frame vs. faces found for the single-pass and tiled detection modes.
+
+    python benchmarks/bench_detection_modes.py path/to/frames_or_video [--levels 1 2 3]
+
+Frames are read from an image directory or sampled from a video file.
+"""
+import os
+import sys
+import time
+import argparse
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import face_utils
+
+
+def _load_frames(path: str, limit: int) -> list[np.ndarray]:
+    frames = []
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            img = cv2.imread(os.path.join(path, name), cv2.IMREAD_COLOR)
+            if img is not None:
+                frames.append(img)
+            if len(frames) >= limit:
+                break
+    else:
+        cap = cv2.VideoCapture(path)
+        step = max(1, int(cap.get(cv2.CAP_PROP_FRAME_COUNT) // limit)) if cap.get(cv2.CAP_PROP_FRAME_COUNT) > 0 else 1
+        idx = 0
+        while len(frames) < limit:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            if idx % step == 0:
+                frames.append(frame)
+            idx += 1
+        cap.release()
+    return frames
+
+
+def _run(frames: list[np.ndarray]) -> tuple[float, float, float]:
+    timings, counts = [], []
+    for frame in frames:
+        t0 = time.perf_counter()
+        boxes = face_utils._detect_boxes(frame)
+        timings.append((time.perf_counter() - t0) * 1000)
+        counts.append(len(boxes))
+    return float(np.mean(timings)), float(np.percentile(timings, 95)), float(np.mean(counts))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("source")
+    parser.add_argument("--frames", type=int, default=50)
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 3])
+    args = parser.parse_args()
+
+    frames = _load_frames(args.source, args.frames)
+    if not frames:
+        print("No frames found.")
+        return
+    h, w = frames[0].shape[:2]
+    print(f"{len(frames)} frames at {w}x{h}")
+    print(f"{'mode':<12}{'tiles':>7}{'mean ms':>10}{'p95 ms':>10}{'faces/frame':>13}")
+
+    settings = face_utils.settings
+    settings.DETECTION_MODE = "single"
+    mean, p95, faces = _run(frames)
+    print(f"{'single':<12}{1:>7}{mean:>10.1f}{p95:>10.1f}{faces:>13.2f}")
+
+    settings.DETECTION_MODE = "tiled"
+    settings.DETECTION_TILE_MIN_SIDE = 0
+    for levels in args.levels:
+        settings.DETECTION_TILE_LEVELS = levels
+        tiles = len(face_utils._tile_grid(w, h))
+        mean, p95, faces = _run(frames)
+        print(f"{f'tiled L{levels}':<12}{tiles:>7}{mean:>10.1f}{p95:>10.1f}{faces:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
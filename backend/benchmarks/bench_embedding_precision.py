@@ -0,0 +1,65 @@
+"""
+Memory / recall / latency of the compact first-pass representations against
+the exact float32 scan, on a synthetic gallery of unit-length 128-D vectors
+(OpenFace encodings are L2-normalised).
+
+    python benchmarks/bench_embedding_precision.py --size 1000000 --queries 200
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from matching import Gallery
+
+
+def _unit(x: np.ndarray) -> np.ndarray:
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=200_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rerank", type=int, default=32)
+    parser.add_argument("--noise", type=float, default=0.05, help="perturbation applied to gallery rows to form queries")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = _unit(rng.standard_normal((args.size, 128)).astype(np.float32))
+    picks = rng.choice(args.size, args.queries, replace=False)
+    queries = _unit(vectors[picks] + args.noise * rng.standard_normal((args.queries, 128)).astype(np.float32))
+    ids = [str(i) for i in range(args.size)]
+
+    # Reference: float64 per-comparison arrays, as the old live-scan loop built them
+    float64_bytes = args.size * 128 * 8
+    print(f"gallery={args.size} queries={args.queries} k={args.k} rerank={args.rerank}")
+    print(f"{'mode':<10}{'first-pass MB':>15}{'p50 ms':>10}{'p95 ms':>10}{'recall@1':>10}{'recall@k':>10}")
+    print(f"{'float64':<10}{float64_bytes / 1e6:>15.1f}{'-':>10}{'-':>10}{'-':>10}{'-':>10}")
+
+    truth = None
+    for precision in ("float32", "float16", "int8"):
+        gallery = Gallery(ids, ids, ids, vectors, precision=precision, rerank=args.rerank)
+        first_pass = gallery.nbytes().get(precision, gallery.nbytes()["exact_float32"])
+
+        timings, results = [], []
+        for q in queries:
+            t0 = time.perf_counter()
+            hits = gallery.search(q, k=args.k)
+            timings.append((time.perf_counter() - t0) * 1000)
+            results.append([row for row, _ in hits])
+
+        if truth is None:
+            truth = results
+        r1 = np.mean([res[0] == ref[0] for res, ref in zip(results, truth)])
+        rk = np.mean([len(set(res) & set(ref)) / len(ref) for res, ref in zip(results, truth)])
+        print(f"{precision:<10}{first_pass / 1e6:>15.1f}{np.percentile(timings, 50):>10.2f}"
+              f"{np.percentile(timings, 95):>10.2f}{r1:>10.3f}{rk:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Latency and agreement of the inference backends on plain CPU.
+
+    python benchmarks/bench_inference_backends.py path/to/images [--threads 4]
+
+Every backend is checked against OpenCV DNN on the same images: detection
+boxes must overlap (IoU) and embeddings must stay within --tol L2 distance.
+"""
+import os
+import sys
+import time
+import argparse
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import face_utils
+from inference import load_nets
+
+
+def _iou(a, b) -> float:
+    ix = max(0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union else 0.0
+
+
+def _run(detector, embedder, images):
+    face_utils._local.nets = (detector, embedder)
+    results, det_ms, emb_ms = [], [], []
+    for img in images:
+        t0 = time.perf_counter()
+        boxes = face_utils._detect_boxes(img)
+        t1 = time.perf_counter()
+        vecs = []
+        for (x0, y0, x1, y1), _ in boxes:
+            face = img[y0:y1, x0:x1]
+            if face.shape[0] < 10 or face.shape[1] < 10:
+                continue
+            blob = cv2.dnn.blobFromImage(cv2.resize(face, (96, 96)), 1.0 / 255, (96, 96), (0, 0, 0), swapRB=True, crop=False)
+            vecs.append(embedder.run(blob).flatten())
+        t2 = time.perf_counter()
+        det_ms.append((t1 - t0) * 1000)
+        emb_ms.append((t2 - t1) * 1000 / max(1, len(vecs)))
+        results.append((boxes, vecs))
+    return results, float(np.mean(det_ms)), float(np.mean(emb_ms))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("images")
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--tol", type=float, default=0.02)
+    parser.add_argument("--backends", nargs="+", default=["opencv", "openvino"])
+    args = parser.parse_args()
+
+    images = [cv2.imread(os.path.join(args.images, n)) for n in sorted(os.listdir(args.images))]
+    images = [img for img in images if img is not None]
+    if not images:
+        print("No images found.")
+        return
+
+    print(f"{len(images)} images, threads={args.threads or 'default'}")
+    print(f"{'backend':<14}{'detect ms':>11}{'embed ms/face':>15}{'min IoU':>10}{'max emb dist':>14}{'ok':>5}")
+    face_utils.ensure_models()
+    baseline = None
+    for name in args.backends:
+        detector, embedder = load_nets(name, args.threads, face_utils.DETECTOR_CFG, face_utils.DETECTOR_WEIGHTS,
+                                       face_utils.EMBEDDED_MODEL)
+        if detector.backend != name:
+            print(f"{name:<14}{'unavailable':>11}")
+            continue
+        results, det_ms, emb_ms = _run(detector, embedder, images)
+        if baseline is None:
+            baseline = results
+        ious, dists = [], []
+        for (boxes, vecs), (ref_boxes, ref_vecs) in zip(results, baseline):
+            for (box, _), (ref, _) in zip(boxes, ref_boxes):
+                ious.append(_iou(box, ref))
+            for v, r in zip(vecs, ref_vecs):
+                dists.append(float(np.linalg.norm(v - r)))
+        counts_match = all(len(a[0]) == len(b[0]) for a, b in zip(results, baseline))
+        min_iou = min(ious) if ious else 1.0
+        max_dist = max(dists) if dists else 0.0
+        ok = counts_match and min_iou > 0.9 and max_dist <= args.tol
+        print(f"{name:<14}{det_ms:>11.1f}{emb_ms:>15.2f}{min_iou:>10.3f}{max_dist:>14.4f}{'yes' if ok else 'NO':>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Time from spawning an API worker to its first successful request (GET /), for
+the boot configurations below, with the per-phase breakdown the worker logs.
+
+    python benchmarks/bench_startup.py [--runs 5] [--configs versioned lazy migrate-eager]
+
+Needs the database from DATABASE_URL, migrated (python migrate.py). uvicorn only
+opens its socket once the lifespan has finished, so the first 200 marks the
+worker as ready. Models are downloaded by the first run that needs them; that
+run is a warm-up and isn't counted.
+"""
+import os
+import re
+import sys
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+import urllib.request
+
+BACKEND = os.path.join(os.path.dirname(__file__), "..")
+
+CONFIGS = {
+    # Close to the old boot: DDL and functions on every start, models loaded before serving
+    "migrate-eager": {"SCHEMA_AUTO_MIGRATE": "true", "MODEL_WARMUP": "eager"},
+    "versioned": {"SCHEMA_AUTO_MIGRATE": "false", "MODEL_WARMUP": "background"},
+    "lazy": {"SCHEMA_AUTO_MIGRATE": "false", "MODEL_WARMUP": "lazy"},
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _boot(env: dict, timeout: float) -> tuple[float, str]:
+    """Seconds until GET / answers 200, and the worker's startup log line."""
+    port = _free_port()
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=BACKEND, env={**os.environ, **env}, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+    )
+    try:
+        while True:
+            if proc.poll() is not None:
+                raise SystemExit(f"worker exited with {proc.returncode}:\n{proc.stderr.read()}")
+            if time.perf_counter() - t0 > timeout:
+                raise SystemExit("worker did not become ready in time")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1) as r:
+                    if r.status == 200:
+                        ready = time.perf_counter() - t0
+                        break
+            except OSError:
+                time.sleep(0.01)
+    finally:
+        proc.terminate()
+        _, err = proc.communicate(timeout=30)
+    lines = re.findall(r"Startup: .*", err)
+    return ready, lines[0] if lines else ""
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--configs", nargs="+", choices=list(CONFIGS), default=list(CONFIGS))
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    _boot(CONFIGS["migrate-eager"], args.timeout)
+    print(f"{args.runs} boots per configuration")
+    print(f"{'config':<16}{'median ms':>11}{'min ms':>9}{'max ms':>9}")
+    breakdown = {}
+    for name in args.configs:
+        times = []
+        for _ in range(args.runs):
+            ready, line = _boot(CONFIGS[name], args.timeout)
+            times.append(ready * 1000)
+        breakdown[name] = line
+        print(f"{name:<16}{statistics.median(times):>11.0f}{min(times):>9.0f}{max(times):>9.0f}")
+    print()
+    for name, line in breakdown.items():
+        print(f"{name:<16}{line}")
+
+
+if __name__ == "__main__":
+    main()
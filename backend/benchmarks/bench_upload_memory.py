@@ -0,0 +1,138 @@
+"""
+Peak RSS while a batch of large photo uploads is handled concurrently, reading
+them whole (`await photo.read()` + copies) vs. through uploads.read_upload.
+
+    python benchmarks/bench_upload_memory.py [--size-mb 8] [--concurrency 16]
+
+Each mode runs in its own process, since peak RSS never goes down. Bodies are
+streamed in 64 KB chunks by the client so it holds none of them itself. Besides
+total peak RSS, peak anonymous RSS is sampled from /proc: memory-mapped spool
+files show up in RSS as clean page cache the kernel can drop, heap copies don't.
+"""
+import os
+import sys
+import asyncio
+import argparse
+import resource
+import subprocess
+import tempfile
+import threading
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+_CHUNK = 64 * 1024
+_BOUNDARY = "benchboundary"
+
+
+def _build_app(mode: str):
+    from fastapi import FastAPI, File, UploadFile
+    from uploads import BodyLimitMiddleware, BufferReader, read_upload, settings
+
+    app = FastAPI()
+    app.add_middleware(BodyLimitMiddleware, default=settings.UPLOAD_MAX_BYTES)
+    sink = tempfile.TemporaryFile()
+
+    @app.post("/upload")
+    async def upload(photo: UploadFile = File(...)):
+        if mode == "naive":
+            data = await photo.read()
+            pixels = np.frombuffer(data, np.uint8).copy()   # decoder's copy
+            stored = bytes(data)                             # BytesIO / uploader copy
+            sink.write(stored)
+        else:
+            data = read_upload(photo)
+            pixels = np.frombuffer(data, np.uint8)
+            reader = BufferReader(data)
+            while chunk := reader.read(_CHUNK):
+                sink.write(chunk)
+        await asyncio.sleep(0.05)   # hold the buffers while the others are in flight, like a detector call would
+        sink.seek(0)
+        sink.truncate()
+        return {"bytes": int(pixels.size)}
+
+    return app
+
+
+async def _body(size: int):
+    yield (f'--{_BOUNDARY}\r\nContent-Disposition: form-data; name="photo"; filename="p.jpg"\r\n'
+           f"Content-Type: image/jpeg\r\n\r\n").encode()
+    chunk = os.urandom(_CHUNK)
+    sent = 0
+    while sent < size:
+        n = min(_CHUNK, size - sent)
+        yield chunk[:n]
+        sent += n
+    yield f"\r\n--{_BOUNDARY}--\r\n".encode()
+
+
+def _anon_kb() -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("RssAnon:"):
+                return int(line.split()[1])
+    return 0
+
+
+class _AnonPeak(threading.Thread):
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.peak = 0
+        self.stop = threading.Event()
+
+    def run(self):
+        while not self.stop.is_set():
+            self.peak = max(self.peak, _anon_kb())
+            time.sleep(0.002)
+
+
+async def _run(mode: str, size: int, concurrency: int) -> int:
+    import httpx
+
+    app = _build_app(mode)
+    transport = httpx.ASGITransport(app=app)
+    headers = {"Content-Type": f"multipart/form-data; boundary={_BOUNDARY}"}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        resps = await asyncio.gather(*[
+            client.post("/upload", content=_body(size), headers=headers) for _ in range(concurrency)
+        ])
+    bad = [r.status_code for r in resps if r.status_code != 200]
+    if bad:
+        raise SystemExit(f"{mode}: unexpected responses {bad[:5]}")
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=float, default=8)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--mode", choices=["naive", "bounded"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    size = int(args.size_mb * 1024 * 1024)
+
+    if args.mode:
+        os.environ.setdefault("UPLOAD_MAX_BYTES", str(size + _CHUNK))
+        import fastapi, httpx  # noqa: F401  (count import cost in the baseline)
+        baseline, anon_baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, _anon_kb()
+        sampler = _AnonPeak()
+        sampler.start()
+        peak = asyncio.run(_run(args.mode, size, args.concurrency))
+        sampler.stop.set()
+        sampler.join()
+        print(peak - baseline, sampler.peak - anon_baseline)
+        return
+
+    print(f"{args.concurrency} concurrent uploads of {args.size_mb:g} MB")
+    print(f"{'mode':<10}{'peak RSS growth MB':>20}{'peak anon RSS growth MB':>26}")
+    for mode in ("naive", "bounded"):
+        out = subprocess.run(
+            [sys.executable, __file__, "--mode", mode, "--size-mb", str(args.size_mb), "--concurrency", str(args.concurrency)],
+            capture_output=True, text=True, check=True,
+        )
+        rss, anon = (int(v) / 1024 for v in out.stdout.split())
+        print(f"{mode:<10}{rss:>20.1f}{anon:>26.1f}")
+
+
+if __name__ == "__main__":
+    main()
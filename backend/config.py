@@ -18,6 +18,13 @@ class Settings(BaseSettings):
     AZURE_STORAGE_CONNECTION_STRING: str = ""
     AZURE_CONTAINER_NAME: str = "missing-persons"
 
+    # Photo derivatives — longest side in px; content-addressed, so cached for MEDIA_CACHE_MAX_AGE seconds
+    THUMBNAIL_SIZE: int = 160
+    MEDIUM_SIZE: int = 640
+    FACE_CROP_SIZE: int = 224
+    DERIVATIVE_JPEG_QUALITY: int = 80
+    MEDIA_CACHE_MAX_AGE: int = 31536000
+
     # Twilio
     TWILIO_SID: str = ""
     TWILIO_AUTH_TOKEN: str = ""
@@ -27,6 +34,139 @@ class Settings(BaseSettings):
     # CORS
     FRONTEND_URL: str = "http://localhost:5173"
 
+    # Startup — workers only check schema_version against this build; migrations run out of band (python migrate.py)
+    # unless SCHEMA_AUTO_MIGRATE. MODEL_WARMUP: "background" loads models/nets while the rest of startup runs,
+    # "eager" also waits for them before serving, "lazy" leaves it to the first request that needs them
+    SCHEMA_AUTO_MIGRATE: bool = False
+    MODEL_WARMUP: str = "background"
+
+    # Embedding cache — content-hash → faces; size 0 disables, empty dir disables the disk tier
+    EMBEDDING_CACHE_SIZE: int = 2048
+    EMBEDDING_CACHE_DIR: str = ""
+
+    # Matching — first-pass precision ("float32" exact, "float16"/halfvec or "int8"), re-ranked in float32
+    EMBEDDING_PRECISION: str = "float32"
+    RERANK_CANDIDATES: int = 32
+    REVERSE_SEARCH_LIMIT: int = 200
+    GALLERY_CACHE_ENABLED: bool = True
+    GALLERY_VERSION_CHECK_SECONDS: int = 30
+    DEDUP_THRESHOLD: float = 0.4
+    DEDUP_NEIGHBORS: int = 10
+
+    # Sharded gallery — 0/1 keeps it in-process; shards by "hash", "priority" or "region"
+    GALLERY_SHARDS: int = 0
+    GALLERY_SHARD_BY: str = "hash"
+    GALLERY_SHARD_DIR: str = "gallery_shards"
+    GALLERY_SHARD_DEADLINE_MS: int = 250
+
+    # Edge scanners — the API writes snapshots under GALLERY_SNAPSHOT_DIR; local_scanner syncs from EDGE_API_URL
+    # (empty: read Postgres directly) into EDGE_SNAPSHOT_PATH and polls for deltas every EDGE_SYNC_SECONDS
+    GALLERY_SNAPSHOT_DIR: str = "gallery_snapshots"
+    EDGE_API_URL: str = ""
+    EDGE_USERNAME: str = ""
+    EDGE_PASSWORD: str = ""
+    EDGE_SNAPSHOT_PATH: str = "edge_gallery.snap"
+    EDGE_SYNC_SECONDS: int = 30
+
+    # Match pre-filter — try nearby / high-priority / recently registered people first; 0/False disables each
+    MATCH_REGION_RADIUS_KM: float = 0.0
+    MATCH_HIGH_PRIORITY_FIRST: bool = False
+    MATCH_REGISTERED_WITHIN_DAYS: int = 0
+    MATCH_GLOBAL_FALLBACK: bool = True
+
+    # Inference backend — "opencv" or "openvino" (OpenCV + Inference Engine)
+    INFERENCE_BACKEND: str = "opencv"
+
+    # CPU budget — 0 means derive from the cores available and the uvicorn worker count
+    WEB_CONCURRENCY: int = 1
+    CPU_CORES: int = 0
+    INFERENCE_POOL_SIZE: int = 0
+    INFERENCE_THREADS: int = 0
+    BLAS_THREADS: int = 1
+
+    # Detection — "single" squashes the frame to 300x300; "tiled" adds overlapping pyramid tiles for large frames
+    DETECTION_MODE: str = "single"
+    DETECTION_TILE_LEVELS: int = 2
+    DETECTION_TILE_OVERLAP: float = 0.25
+    DETECTION_TILE_MIN_SIDE: int = 1280
+    DETECTION_NMS_THRESHOLD: float = 0.4
+
+    # Face quality gate — scan crops below these are not embedded; QUALITY_ALIGN levels the eyes first (Haar)
+    QUALITY_MIN_SCORE: float = 0.35
+    QUALITY_MIN_FACE_PX: int = 24
+    QUALITY_BLUR_REF: float = 150.0
+    QUALITY_SIZE_REF: int = 96
+    QUALITY_ALIGN: bool = False
+
+    # Sighting aggregation — repeat matches of one person on one camera within the window update one row
+    SIGHTING_AGGREGATION_ENABLED: bool = True
+    SIGHTING_WINDOW_SECONDS: int = 300
+    SIGHTING_HIT_SAMPLE_RATE: float = 0.1
+
+    # Detection write-behind — insert-only rows are batched; the spill dir keeps buffered rows across a crash (empty disables)
+    DETECTION_WRITE_BEHIND: bool = True
+    DETECTION_WRITE_BATCH: int = 200
+    DETECTION_WRITE_INTERVAL_MS: int = 500
+    DETECTION_SPILL_DIR: str = "detection_spill"
+    DETECTION_SPILL_FSYNC: bool = False
+
+    # Detection retention — monthly partitions (API workers keep the months ahead created); dismissed rows older than
+    # the retention window are moved to gzipped JSONL + snapshot tar archives (on Azure when configured, else under
+    # DETECTION_ARCHIVE_DIR). 0 keeps everything
+    DETECTION_PARTITIONING: bool = True
+    DETECTION_PARTITION_MONTHS_AHEAD: int = 3
+    DETECTION_RETENTION_DAYS: int = 180
+    DETECTION_ARCHIVE_DIR: str = "archive"
+    DETECTION_ARCHIVE_BATCH: int = 5000
+    RETENTION_INTERVAL_SECONDS: int = 86400
+
+    # Dashboard rollups — geohash length of the map cells (5 ≈ 4.9 km); truncate detection_rollups and rerun migrate.py after changing it
+    ROLLUP_GEOHASH_PRECISION: int = 5
+
+    # Bulk export — rows fetched per server-side cursor round trip
+    EXPORT_BATCH_SIZE: int = 1000
+
+    # Uploads — request bodies over UPLOAD_MAX_BYTES are cut off while streaming; file parts over
+    # UPLOAD_SPOOL_BYTES are spooled to disk and memory-mapped rather than held on the heap
+    UPLOAD_MAX_BYTES: int = 15_000_000
+    UPLOAD_SPOOL_BYTES: int = 1_048_576
+
+    # Live frames — what clients are asked to send, and hard limits checked from the image header before decoding
+    FRAME_TARGET_SIDE: int = 640
+    FRAME_QUALITY: float = 0.8
+    FRAME_MAX_BYTES: int = 2_000_000
+    FRAME_MAX_PIXELS: int = 3840 * 2160
+
+    # Motion gating — skip the detector on unchanged frames from a tagged camera feed; per-worker state is kept
+    # for the MOTION_MAX_CAMERAS most recently seen camera ids
+    MOTION_GATING_ENABLED: bool = True
+    MOTION_PIXEL_THRESHOLD: int = 25
+    MOTION_MIN_AREA_PCT: float = 0.002
+    MOTION_REFRESH_FRAMES: int = 30
+    MOTION_MAX_CAMERAS: int = 256
+
+    # External registry sync (sync_worker.py) — empty URL disables it
+    EXTERNAL_FEED_URL: str = ""
+    SYNC_INTERVAL_SECONDS: int = 3600
+    SYNC_PAGE_SIZE: int = 500
+    SYNC_DOWNLOAD_CONCURRENCY: int = 8
+
+    # Batch offline search — footage is read from under BATCH_INPUT_DIR
+    BATCH_INPUT_DIR: str = "batch_inputs"
+    BATCH_DECODE_WORKERS: int = 2
+    BATCH_FRAMES: int = 16
+    # Jobs run inside an API worker; one that hasn't reported progress for this long is marked failed
+    BATCH_JOB_STALE_SECONDS: int = 300
+
+    # Profiling — sampled stacks for slow requests (off by default, zero overhead when off)
+    PROFILER_ENABLED: bool = False
+    PROFILER_THRESHOLD_MS: float = 1000.0
+    PROFILER_SAMPLE_RATE: float = 0.0
+    PROFILER_INTERVAL_MS: float = 5.0
+    PROFILER_BUFFER_SECONDS: float = 60.0
+    PROFILER_DIR: str = "profiles"
+    PROFILER_MAX_PER_ENDPOINT: int = 50
+
 @lru_cache
 def get_settings() -> Settings:
     return Settings()
@@ -1,10 +1,17 @@
 import os
+import asyncio
+import logging
+from datetime import date, datetime
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import DeclarativeBase
 from config import get_settings
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# How often each API worker checks that the months ahead exist
+_PARTITION_CHECK_SECONDS = 6 * 3600
 
 DB_URL = settings.DATABASE_URL
 if not DB_URL or not DB_URL.startswith("postgresql"):
@@ -31,9 +38,72 @@ async def get_db() -> AsyncSession:
         finally:
             await session.close()
 
-async def init_db():
-    """Create all tables and run basic migrations."""
-    async with engine.begin() as conn:
-        # Create extension if not exists
-        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector;"))
-        await conn.run_sync(Base.metadata.create_all)
+def _month(dt: datetime) -> date:
+    return date(dt.year, dt.month, 1)
+
+
+def _next_month(d: date) -> date:
+    return date(d.year + d.month // 12, d.month % 12 + 1, 1)
+
+
+async def _is_partitioned(conn, table: str) -> bool:
+    kind = (await conn.execute(text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:t)"), {"t": table})).scalar()
+    return kind == "p"
+
+
+async def _create_month_partition(conn, month: date):
+    """
+    Create one month's partition. Rows for that month that already landed in
+    detections_default (its partition was missing when they arrived) would make the
+    CREATE fail, so they are taken out of the default partition first and put back
+    through the parent once the month exists. Going through the parent both ways
+    keeps detection_rollups even: the delete trigger subtracts what the insert adds.
+    """
+    name, nxt = f"detections_{month:%Y_%m}", _next_month(month)
+    bounds = {"lo": month, "hi": nxt}
+    stranded = await conn.scalar(text("SELECT to_regclass('detections_default') IS NOT NULL")) and await conn.scalar(
+        text("SELECT EXISTS (SELECT 1 FROM detections_default WHERE timestamp >= :lo AND timestamp < :hi)"), bounds
+    )
+    if stranded:
+        # No new rows for this month may reach the default partition until the move is done
+        await conn.execute(text("LOCK TABLE detections IN EXCLUSIVE MODE;"))
+        await conn.execute(text(
+            "CREATE TEMP TABLE stranded_detections ON COMMIT DROP AS "
+            "SELECT * FROM detections_default WHERE timestamp >= :lo AND timestamp < :hi"
+        ), bounds)
+        await conn.execute(text("DELETE FROM detections WHERE timestamp >= :lo AND timestamp < :hi"), bounds)
+    await conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF detections "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{nxt.isoformat()}');"
+    ))
+    if stranded:
+        moved = await conn.execute(text("INSERT INTO detections SELECT * FROM stranded_detections"))
+        await conn.execute(text("DROP TABLE stranded_detections;"))
+        logger.info(f"Created partition {name}, moving {moved.rowcount} rows out of detections_default")
+
+
+async def ensure_detection_partitions(conn, start: date | None = None):
+    """Create the monthly detections partitions from `start` (default: this month) to DETECTION_PARTITION_MONTHS_AHEAD ahead."""
+    if not await _is_partitioned(conn, "detections"):
+        return
+    month = start or _month(datetime.utcnow())
+    last = _month(datetime.utcnow())
+    for _ in range(settings.DETECTION_PARTITION_MONTHS_AHEAD):
+        last = _next_month(last)
+    while month <= last:
+        if not await conn.scalar(text("SELECT to_regclass(:t) IS NOT NULL"), {"t": f"detections_{month:%Y_%m}"}):
+            await _create_month_partition(conn, month)
+        month = _next_month(month)
+
+
+async def maintain_detection_partitions():
+    """Keep the months ahead created from every API worker (a few catalog lookups when nothing is missing)."""
+    while True:
+        try:
+            async with engine.begin() as conn:
+                # One worker at a time; the others find the partitions there
+                await conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('detection_partitions'))"))
+                await ensure_detection_partitions(conn)
+        except Exception as e:
+            logger.warning(f"Detection partition maintenance failed: {e}")
+        await asyncio.sleep(_PARTITION_CHECK_SECONDS)
@@ -0,0 +1,161 @@
+import time
+import logging
+from datetime import datetime
+from sqlalchemy import select, text, update, delete
+from database import AsyncSessionLocal
+from models import MissingPerson, Detection, DuplicateCluster
+from storage import delete_blob
+from config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# One HNSW probe per registry row: each outer row's LATERAL subquery is an
+# index-ordered LIMIT k scan, so the whole graph costs ~N·log N, not N².
+_KNN_SQL = text("""
+    SELECT a.id AS src, n.id AS dst, n.dist AS dist
+    FROM missing_persons a
+    CROSS JOIN LATERAL (
+        SELECT b.id, b.encoding <-> a.encoding AS dist
+        FROM missing_persons b
+        WHERE b.encoding IS NOT NULL
+        ORDER BY b.encoding <-> a.encoding
+        LIMIT :k
+    ) n
+    WHERE a.encoding IS NOT NULL AND a.id > :after AND n.id <> a.id
+    ORDER BY a.id
+    LIMIT :page
+""")
+
+
+class _UnionFind:
+    def __init__(self):
+        self.parent: dict[str, str] = {}
+
+    def find(self, x: str) -> str:
+        self.parent.setdefault(x, x)
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, a: str, b: str):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[rb] = ra
+
+
+async def find_duplicate_clusters(db, threshold: float | None = None, k: int | None = None) -> list[dict]:
+    """
+    Group registry entries whose encodings sit within `threshold` of each other,
+    using the k-nearest-neighbour graph from the HNSW index on missing_persons.encoding.
+    """
+    threshold = threshold if threshold is not None else settings.DEDUP_THRESHOLD
+    k = (k or settings.DEDUP_NEIGHBORS) + 1  # +1: every row is its own nearest neighbour
+    await db.execute(text(f"SET LOCAL hnsw.ef_search = {max(40, k)}"))
+
+    uf = _UnionFind()
+    edges: list[tuple[str, float]] = []
+    after = ""
+    page = 1000 * k
+    while True:
+        rows = (await db.execute(_KNN_SQL, {"k": k, "after": after, "page": page})).all()
+        if not rows:
+            break
+        # Finish the last outer row on the next page so its neighbour list isn't split
+        last_src = rows[-1].src if len(rows) == page else None
+        for src, dst, dist in rows:
+            if src == last_src:
+                continue
+            if dist < threshold:
+                uf.union(src, dst)
+                edges.append((src, dist))
+            after = src
+        if last_src is None:
+            break
+
+    clusters: dict[str, list[str]] = {}
+    for node in list(uf.parent):
+        clusters.setdefault(uf.find(node), []).append(node)
+    # Both ends of an edge share a root, so one pass gives every cluster's widest edge
+    spread: dict[str, float] = {}
+    for src, dist in edges:
+        root = uf.find(src)
+        spread[root] = max(spread.get(root, 0.0), dist)
+
+    return [
+        {"member_ids": sorted(members), "max_distance": float(spread.get(root, 0.0))}
+        for root, members in clusters.items() if len(members) >= 2
+    ]
+
+
+async def run_dedup_scan():
+    """
+    Rebuild the open duplicate clusters; merged/dismissed history is kept, and a
+    cluster whose members all sit in one dismissed cluster isn't raised again.
+    """
+    t0 = time.monotonic()
+    async with AsyncSessionLocal() as db:
+        clusters = await find_duplicate_clusters(db)
+        dismissed = [
+            set(m) for m in (await db.execute(
+                select(DuplicateCluster.member_ids).where(DuplicateCluster.status == "dismissed")
+            )).scalars().all()
+        ]
+        clusters = [c for c in clusters if not any(set(c["member_ids"]) <= d for d in dismissed)]
+        await db.execute(delete(DuplicateCluster).where(DuplicateCluster.status == "open"))
+        for c in clusters:
+            db.add(DuplicateCluster(member_ids=c["member_ids"], max_distance=c["max_distance"]))
+        await db.commit()
+    logger.info(f"Dedup scan: {len(clusters)} duplicate clusters found in {time.monotonic() - t0:.1f}s")
+    return len(clusters)
+
+
+async def merge_cluster(db, cluster: DuplicateCluster, keep_id: str) -> MissingPerson | None:
+    """
+    Fold every other member of the cluster into `keep_id`: move their detections, fill gaps, delete them.
+    None if `keep_id` no longer exists.
+    """
+    result = await db.execute(select(MissingPerson).where(MissingPerson.id.in_(cluster.member_ids)))
+    members = {p.id: p for p in result.scalars().all()}
+    keep = members.pop(keep_id, None)
+    if keep is None:
+        return None
+
+    for dup in members.values():
+        if keep.photo_url is None and dup.photo_url is not None:
+            keep.thumb_url, keep.medium_url, keep.face_url = dup.thumb_url, dup.medium_url, dup.face_url
+        for field in ("age", "contact", "latitude", "longitude", "photo_url"):
+            if getattr(keep, field) is None and getattr(dup, field) is not None:
+                setattr(keep, field, getattr(dup, field))
+        if keep.priority != "high" and dup.priority == "high":
+            keep.priority = "high"
+
+    if members:
+        await db.execute(
+            update(Detection)
+            .where(Detection.person_id.in_(list(members)))
+            .values(person_id=keep.id, person_name=keep.name, case_id=keep.case_id)
+        )
+        for dup in members.values():
+            if dup.photo_url and dup.photo_url != keep.photo_url:
+                for url in (dup.photo_url, dup.thumb_url, dup.medium_url, dup.face_url):
+                    if url:
+                        delete_blob(url)
+            await db.delete(dup)
+
+    # Other open clusters naming the deleted people are stale now; the next scan rebuilds what's left of them
+    merged = {cluster.id}
+    if members:
+        others = await db.execute(
+            select(DuplicateCluster).where(DuplicateCluster.status == "open", DuplicateCluster.id != cluster.id)
+        )
+        merged |= {c.id for c in others.scalars().all() if set(c.member_ids) & members.keys()}
+    await db.execute(
+        update(DuplicateCluster)
+        .where(DuplicateCluster.id.in_(merged))
+        .values(status="merged", merged_into_id=keep.id, resolved_at=datetime.utcnow())
+    )
+    await db.commit()
+    await db.refresh(keep)
+    return keep
@@ -0,0 +1,93 @@
+import hashlib
+import logging
+import cv2
+import numpy as np
+from sqlalchemy import update
+from database import AsyncSessionLocal
+from models import MissingPerson, Detection
+from storage import upload_derivative
+from resources import run_inference
+from config import get_settings
+
+try:
+    from face_utils import best_face_box
+    FR_AVAILABLE = True
+except ImportError as e:
+    print(f"Face crops unavailable: {e}")
+    FR_AVAILABLE = False
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Extra context kept around the detector box in the face crop, as a fraction of the box side
+FACE_MARGIN = 0.3
+
+
+def _fit(image: np.ndarray, longest: int) -> np.ndarray:
+    h, w = image.shape[:2]
+    scale = longest / max(h, w)
+    if scale >= 1.0:
+        return image
+    return cv2.resize(image, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+
+
+def _jpeg(image: np.ndarray) -> bytes:
+    ok, buf = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, settings.DERIVATIVE_JPEG_QUALITY, cv2.IMWRITE_JPEG_OPTIMIZE, 1])
+    return buf.tobytes() if ok else b""
+
+
+def _face_crop(image: np.ndarray, box: list[int]) -> np.ndarray:
+    """Square crop around the face box with some margin, clamped to the image."""
+    x0, y0, x1, y1 = box
+    side = int(max(x1 - x0, y1 - y0) * (1 + 2 * FACE_MARGIN))
+    cx, cy = (x0 + x1) // 2, (y0 + y1) // 2
+    h, w = image.shape[:2]
+    left, top = max(0, cx - side // 2), max(0, cy - side // 2)
+    crop = image[top:min(h, top + side), left:min(w, left + side)]
+    return cv2.resize(crop, (settings.FACE_CROP_SIZE, settings.FACE_CROP_SIZE), interpolation=cv2.INTER_AREA)
+
+
+def render_derivatives(image_bytes: bytes) -> dict[str, bytes]:
+    """JPEG thumb / medium renditions and, when a face is found, a face crop."""
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return {}
+    out = {
+        "thumb": _jpeg(_fit(image, settings.THUMBNAIL_SIZE)),
+        "medium": _jpeg(_fit(image, settings.MEDIUM_SIZE)),
+    }
+    box = best_face_box(image_bytes) if FR_AVAILABLE else None
+    if box is not None:
+        out["face"] = _jpeg(_face_crop(image, box))
+    return {kind: data for kind, data in out.items() if data}
+
+
+async def store_derivatives(original_url: str, image_bytes: bytes) -> dict[str, str | None]:
+    """Render and upload every derivative of one original; returns the thumb_url/medium_url/face_url columns."""
+    rendered = await run_inference(render_derivatives, image_bytes)
+    digest = hashlib.sha256(image_bytes).hexdigest()[:12]
+    urls = {}
+    for kind in ("thumb", "medium", "face"):
+        data = rendered.get(kind)
+        urls[f"{kind}_url"] = await upload_derivative(original_url, kind, digest, data) if data else None
+    return urls
+
+
+async def _derive(model, row_id: str, original_url: str, image_bytes: bytes):
+    try:
+        urls = await store_derivatives(original_url, image_bytes)
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(model).where(model.id == row_id).values(**urls))
+            await db.commit()
+    except Exception as e:
+        logger.error(f"Derivatives for {model.__tablename__} {row_id} failed: {e}")
+
+
+async def derive_person_photo(person_id: str, photo_url: str, image_bytes: bytes):
+    """Background task: thumbnails and face crop for a registered person's photo."""
+    await _derive(MissingPerson, person_id, photo_url, image_bytes)
+
+
+async def derive_detection_snapshot(detection_id: str, snapshot_url: str, image_bytes: bytes):
+    """Background task: thumbnails and face crop for a detection snapshot."""
+    await _derive(Detection, detection_id, snapshot_url, image_bytes)
@@ -0,0 +1,314 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime
+from sqlalchemy import DateTime
+from sqlalchemy.exc import IntegrityError, DataError
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from database import engine
+from models import Detection, DetectionHit
+from config import get_settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, so spill dirs of dead processes aren't adopted
+    fcntl = None
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+_MODELS = {m.__tablename__: m for m in (Detection, DetectionHit)}
+
+
+def _materialize(model, fields: dict) -> dict:
+    """Full column dict for one row, with Python-side defaults (ids, timestamps) filled in now."""
+    row = {}
+    for col in model.__table__.columns:
+        if col.key in fields:
+            row[col.key] = fields[col.key]
+        elif col.default is not None and col.default.is_scalar:
+            row[col.key] = col.default.arg
+        elif col.default is not None and col.default.is_callable:
+            row[col.key] = col.default.arg(None)
+        elif not (col.primary_key and col.autoincrement in (True, "auto")):
+            row[col.key] = None
+    return row
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return value
+
+
+def _decode(model, row: dict) -> dict:
+    for col in model.__table__.columns:
+        if isinstance(col.type, DateTime) and isinstance(row.get(col.key), str):
+            row[col.key] = datetime.fromisoformat(row[col.key])
+    # Segments spilled before detection_hits had client-side ids carry none
+    return _materialize(model, row)
+
+
+class DetectionWriter:
+    """
+    Write-behind buffer for insert-only detection rows. Rows are acknowledged as soon
+    as they are buffered (and appended to the spill segment when DETECTION_SPILL_DIR is
+    set) and reach Postgres as multi-row INSERTs once DETECTION_WRITE_BATCH rows are
+    waiting or DETECTION_WRITE_INTERVAL_MS has passed. Inserts are idempotent on the
+    primary key, so spill segments left behind by a crash are replayed on start.
+
+    Every process spills into its own subdirectory of DETECTION_SPILL_DIR, held under an
+    flock for as long as the process lives. On start, a writer adopts the directories of
+    processes that are gone (the ones whose lock it can take) and replays their segments.
+    """
+
+    def __init__(self, spill_dir: str = ""):
+        self.spill_root = spill_dir
+        self.spill_dir = ""
+        self._dir_lock = None
+        self._rows: list[tuple[int, str, dict]] = []
+        self.seq = 0              # sequence number of the last buffered row
+        self._done_seq = 0        # every row up to this one has been written (or given up on)
+        self._segment = 0
+        self._spill = None
+        self._wake = asyncio.Event()
+        self._flushed = asyncio.Condition()
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+        self._latencies: deque[float] = deque(maxlen=256)
+        self.metrics = {"buffered": 0, "written": 0, "flushes": 0, "failed_rows": 0, "replayed": 0, "last_flush_ms": 0.0}
+
+    # ── Spill segments ──────────────────────
+    def _segment_path(self, n: int) -> str:
+        return os.path.join(self.spill_dir, f"seg-{n:08d}.jsonl")
+
+    def _sealed_segments(self) -> list[str]:
+        if not self.spill_dir or not os.path.isdir(self.spill_dir):
+            return []
+        return sorted(
+            os.path.join(self.spill_dir, name) for name in os.listdir(self.spill_dir)
+            if name.startswith("seg-") and name.endswith(".jsonl")
+        )
+
+    def _open_segment(self):
+        self._segment += 1
+        self._spill = open(self._segment_path(self._segment), "a", encoding="utf-8")
+
+    def _seal_segment(self) -> int:
+        """Close the current segment so rows added from now on land in a new one. Returns the sealed number."""
+        sealed = self._segment
+        if self._spill is not None:
+            self._spill.close()
+            self._open_segment()
+        return sealed
+
+    def _drop_segments(self, upto: int):
+        for path in self._sealed_segments():
+            if int(os.path.basename(path)[4:12]) <= upto:
+                os.remove(path)
+
+    @staticmethod
+    def _try_lock(path: str):
+        """Exclusive, non-blocking flock on `path`/.lock; the open file while held, None if another process has it."""
+        f = open(os.path.join(path, ".lock"), "a")
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return None
+        return f
+
+    def _claim_spill_dir(self):
+        os.makedirs(self.spill_root, exist_ok=True)
+        self.spill_dir = os.path.join(self.spill_root, f"w-{os.getpid()}-{uuid.uuid4().hex[:8]}")
+        os.makedirs(self.spill_dir)
+        if fcntl is not None:
+            self._dir_lock = self._try_lock(self.spill_dir)
+
+    def _adopt_orphans(self):
+        """Move the segments of spill dirs no live process holds into ours, then remove those dirs."""
+        if fcntl is None:
+            return
+        for name in sorted(os.listdir(self.spill_root)):
+            path = os.path.join(self.spill_root, name)
+            if path == self.spill_dir or not name.startswith("w-") or not os.path.isdir(path):
+                continue
+            lock = self._try_lock(path)
+            if lock is None:
+                continue  # a running worker's own directory
+            try:
+                for seg in sorted(n for n in os.listdir(path) if n.startswith("seg-") and n.endswith(".jsonl")):
+                    self._segment += 1
+                    # Same filesystem, so the move is atomic: a crash mid-adoption leaves every segment in one dir
+                    os.replace(os.path.join(path, seg), self._segment_path(self._segment))
+                shutil.rmtree(path, ignore_errors=True)
+            finally:
+                lock.close()
+
+    # ── Public API ──────────────────────────
+    def add(self, model, **fields) -> dict:
+        """Buffer one row; returns it with its id and defaults filled in. Its sequence number is `self.seq` right after."""
+        row = _materialize(model, fields)
+        if self._spill is not None:
+            self._spill.write(json.dumps({"t": model.__tablename__, "r": {k: _encode(v) for k, v in row.items()}}) + "\n")
+            self._spill.flush()
+            if settings.DETECTION_SPILL_FSYNC:
+                os.fsync(self._spill.fileno())
+        self.seq += 1
+        self._rows.append((self.seq, model.__tablename__, row))
+        self.metrics["buffered"] = len(self._rows)
+        if len(self._rows) >= settings.DETECTION_WRITE_BATCH:
+            self._wake.set()
+        return row
+
+    async def wait(self, seq: int | None = None, timeout: float | None = None) -> bool:
+        """
+        Wait until a flush covering row `seq` (default: everything buffered so far) has
+        completed, i.e. the row was written or given up on. False if `timeout` seconds
+        pass first, e.g. while the database is unreachable.
+        """
+        seq = self.seq if seq is None else seq
+        if self._task is None:
+            await self.flush()
+            return self._done_seq >= seq
+        try:
+            async with self._flushed:
+                await asyncio.wait_for(self._flushed.wait_for(lambda: self._done_seq >= seq), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def flush(self):
+        async with self._lock:
+            rows, self._rows = self._rows, []
+            sealed = self._seal_segment()
+            if rows:
+                t0 = time.perf_counter()
+                ok = await self._insert(rows)
+                ms = (time.perf_counter() - t0) * 1000
+                self._latencies.append(ms)
+                self.metrics["last_flush_ms"] = round(ms, 2)
+                self.metrics["flushes"] += 1
+                if not ok:
+                    # Database unreachable: keep the rows (and their segments) for the next attempt
+                    self._rows = rows + self._rows
+            else:
+                ok = True
+            self.metrics["buffered"] = len(self._rows)
+            if ok:
+                self._drop_segments(sealed)
+                if rows:
+                    # Rows are buffered in sequence order and a flush takes all of them
+                    self._done_seq = max(self._done_seq, rows[-1][0])
+        async with self._flushed:
+            self._flushed.notify_all()
+
+    async def _insert(self, rows: list[tuple[int, str, dict]]) -> bool:
+        """Multi-row INSERT per table. A batch rejected by a constraint is retried row by row so one bad row doesn't sink the rest."""
+        by_table: dict[str, list[dict]] = {}
+        for _, table, row in rows:
+            by_table.setdefault(table, []).append(row)
+        try:
+            async with engine.begin() as conn:
+                for table, batch in by_table.items():
+                    await conn.execute(_insert_stmt(_MODELS[table]), batch)
+            self.metrics["written"] += len(rows)
+            return True
+        except (IntegrityError, DataError) as e:
+            logger.warning(f"Detection writer: batch of {len(rows)} rejected, retrying row by row. {e}")
+        except Exception as e:
+            logger.warning(f"Detection writer: database unavailable, {len(rows)} rows kept for retry. {e}")
+            return False
+        for _, table, row in rows:
+            try:
+                async with engine.begin() as conn:
+                    await conn.execute(_insert_stmt(_MODELS[table]), [row])
+                self.metrics["written"] += 1
+            except Exception as e:
+                self.metrics["failed_rows"] += 1
+                logger.error(f"Detection writer: dropped {table} row {row.get('id')}: {e}")
+        return True
+
+    async def _run(self):
+        interval = settings.DETECTION_WRITE_INTERVAL_MS / 1000
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Detection writer: flush failed: {e}")
+
+    def _load_spill(self):
+        """Buffer rows from the adopted spill segments; the first flush writes them and drops the segments."""
+        segments = self._sealed_segments()
+        for path in segments:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # torn last line from a crash mid-write
+                    self.seq += 1
+                    self._rows.append((self.seq, rec["t"], _decode(_MODELS[rec["t"]], rec["r"])))
+            self._segment = max(self._segment, int(os.path.basename(path)[4:12]))
+        if self._rows:
+            logger.info(f"Detection writer: replaying {len(self._rows)} spilled rows from {len(segments)} segments")
+            self.metrics["replayed"] += len(self._rows)
+            self.metrics["buffered"] = len(self._rows)
+
+    async def start(self):
+        if self.spill_root:
+            self._claim_spill_dir()
+            self._adopt_orphans()
+            self._load_spill()
+            self._open_segment()
+        self._task = asyncio.create_task(self._run())
+        if self._rows:
+            self._wake.set()
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+            if not self._rows:
+                # Clean shutdown: nothing left to replay, so the directory goes too
+                shutil.rmtree(self.spill_dir, ignore_errors=True)
+            if self._dir_lock is not None:
+                self._dir_lock.close()
+                self._dir_lock = None
+
+    def stats(self) -> dict:
+        lat = sorted(self._latencies)
+        return {
+            **self.metrics,
+            "avg_flush_ms": round(sum(lat) / len(lat), 2) if lat else 0.0,
+            "p95_flush_ms": round(lat[min(len(lat) - 1, int(len(lat) * 0.95))], 2) if lat else 0.0,
+            "max_flush_ms": round(lat[-1], 2) if lat else 0.0,
+        }
+
+
+def _insert_stmt(model):
+    # No conflict target: detections is partitioned, so its unique key is (id, timestamp)
+    return pg_insert(model.__table__).on_conflict_do_nothing()
+
+
+detection_writer = DetectionWriter(settings.DETECTION_SPILL_DIR)
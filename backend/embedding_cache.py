@@ -0,0 +1,106 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from config import get_settings
+
+settings = get_settings()
+
+
+def content_key(data: bytes, namespace: str = "") -> str:
+    """Content address for an image: sha256 of the raw bytes, scoped to a model namespace."""
+    digest = hashlib.sha256(data).hexdigest()
+    return f"{namespace}-{digest}" if namespace else digest
+
+
+class EmbeddingCache:
+    """
+    Maps image content keys to the faces found in them (boxes, confidences,
+    128-D encodings). Bounded LRU in memory, with an optional JSON-per-key
+    directory underneath that survives restarts and is shared by workers.
+    """
+
+    def __init__(self, max_entries: int = 2048, disk_dir: str = ""):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self._entries: OrderedDict[str, list[dict]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[-2:], f"{key}.json")
+
+    def get(self, key: str) -> list[dict] | None:
+        if not self.enabled:
+            return None
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(key)) as f:
+                    value = json.load(f)
+            except (OSError, ValueError):
+                value = None
+            if value is not None:
+                self._remember(key, value)
+                with self._lock:
+                    self.disk_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, value: list[dict]):
+        if not self.enabled:
+            return
+        self._remember(key, value)
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp = f"{path}.{os.getpid()}.tmp"
+                with open(tmp, "w") as f:
+                    json.dump(value, f)
+                os.replace(tmp, path)
+            except OSError as e:
+                print(f"[Embedding Cache] Warning: could not write disk entry. {e}")
+
+    def _remember(self, key: str, value: list[dict]):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+            }
+
+
+embedding_cache = EmbeddingCache(settings.EMBEDDING_CACHE_SIZE, settings.EMBEDDING_CACHE_DIR)
@@ -0,0 +1,90 @@
+import io
+import csv
+import json
+from datetime import datetime
+from typing import AsyncIterator, Literal
+from fastapi.responses import StreamingResponse
+from database import AsyncSessionLocal
+from config import get_settings
+
+settings = get_settings()
+
+ExportFormat = Literal["csv", "ndjson", "geojson"]
+
+DETECTION_COLUMNS = [
+    "id", "case_id", "person_id", "person_name", "status", "confidence", "quality",
+    "timestamp", "last_seen", "hit_count", "camera_id", "location", "latitude", "longitude",
+    "source", "frame_offset", "snapshot_url", "sms_sent",
+]
+PERSON_COLUMNS = [
+    "id", "case_id", "name", "age", "contact", "priority",
+    "latitude", "longitude", "photo_url", "registered_at",
+]
+
+_MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson", "geojson": "application/geo+json"}
+_CHUNK_BYTES = 64 * 1024
+
+
+def _value(v):
+    return v.isoformat() if isinstance(v, datetime) else v
+
+
+async def _rows(query, columns: list[str]) -> AsyncIterator[dict]:
+    # The session lives inside the generator: request-scoped dependencies are closed before the body streams
+    async with AsyncSessionLocal() as db:
+        result = await db.stream_scalars(query.execution_options(yield_per=settings.EXPORT_BATCH_SIZE))
+        async for obj in result:
+            yield {c: _value(getattr(obj, c)) for c in columns}
+            db.expunge(obj)
+
+
+def _csv_line(values: list) -> str:
+    buf = io.StringIO()
+    csv.writer(buf).writerow(values)
+    return buf.getvalue()
+
+
+def _geojson_feature(row: dict, columns: list[str]) -> str:
+    lat, lon = row.get("latitude"), row.get("longitude")
+    geometry = {"type": "Point", "coordinates": [lon, lat]} if lat is not None and lon is not None else None
+    props = {c: row[c] for c in columns if c not in ("latitude", "longitude")}
+    return json.dumps({"type": "Feature", "geometry": geometry, "properties": props})
+
+
+async def _encode(query, columns: list[str], fmt: ExportFormat) -> AsyncIterator[bytes]:
+    """Rows of `query` rendered as `fmt`, batched into ~64 KB chunks."""
+    chunk: list[str] = []
+    size = 0
+    if fmt == "csv":
+        chunk.append(_csv_line(columns))
+    elif fmt == "geojson":
+        chunk.append('{"type": "FeatureCollection", "features": [\n')
+    first = True
+    async for row in _rows(query, columns):
+        if fmt == "csv":
+            line = _csv_line([row[c] for c in columns])
+        elif fmt == "ndjson":
+            line = json.dumps({c: row[c] for c in columns}) + "\n"
+        else:
+            line = ("" if first else ",\n") + _geojson_feature(row, columns)
+        first = False
+        chunk.append(line)
+        size += len(line)
+        if size >= _CHUNK_BYTES:
+            yield "".join(chunk).encode()
+            chunk, size = [], 0
+    if fmt == "geojson":
+        chunk.append("\n]}\n")
+    if chunk:
+        yield "".join(chunk).encode()
+
+
+def export_response(query, columns: list[str], fmt: ExportFormat, name: str) -> StreamingResponse:
+    """Stream an ORM query as CSV, NDJSON or GeoJSON through a server-side cursor; memory stays flat with row count."""
+    ext = {"csv": "csv", "ndjson": "ndjson", "geojson": "geojson"}[fmt]
+    filename = f"{name}_{datetime.utcnow():%Y%m%d_%H%M%S}.{ext}"
+    return StreamingResponse(
+        _encode(query, columns, fmt),
+        media_type=_MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -4,6 +4,16 @@ import numpy as np
 import requests
 import io
 from PIL import Image
+import time
+import threading
+from embedding_cache import embedding_cache, content_key
+from motion import gate_for
+from quality import select_faces
+from config import get_settings
+from inference import load_nets
+from resources import plan as resource_plan
+
+settings = get_settings()
 
 MODEL_DIR = os.path.join(os.path.dirname(__file__), "models")
 os.makedirs(MODEL_DIR, exist_ok=True)
@@ -15,109 +25,243 @@ DETECTOR_WEIGHTS = os.path.join(MODEL_DIR, "res10_300x300_ssd_iter_140000.caffem
 # OpenFace 128-D Embedding Model (Torch format supported by OpenCV DNN)
 EMBEDDED_MODEL = os.path.join(MODEL_DIR, "openface.nn4.small2.v1.t7")
 
+_MODEL_URLS = [
+    ("https://raw.githubusercontent.com/opencv/opencv/master/samples/dnn/face_detector/deploy.prototxt", DETECTOR_CFG),
+    ("https://raw.githubusercontent.com/opencv/opencv_3rdparty/dnn_samples_face_detector_20180205_fp16/res10_300x300_ssd_iter_140000_fp16.caffemodel", DETECTOR_WEIGHTS),
+    # We use a reliable source for the openface model
+    ("https://storage.cmusatyalab.org/openface-models/nn4.small2.v1.t7", EMBEDDED_MODEL),
+]
+
+_models_lock = threading.Lock()
+
 def _download_file(url, path):
     if not os.path.exists(path):
         print(f"Downloading {os.path.basename(path)}...")
         r = requests.get(url, stream=True)
         r.raise_for_status()
-        with open(path, 'wb') as f:
+        # Written aside and renamed, so an interrupted download isn't mistaken for the model next time
+        tmp = f"{path}.part"
+        with open(tmp, 'wb') as f:
             for chunk in r.iter_content(chunk_size=8192):
                 f.write(chunk)
+        os.replace(tmp, path)
 
-# Download necessary files to run native OpenCV DNN
-_download_file("https://raw.githubusercontent.com/opencv/opencv/master/samples/dnn/face_detector/deploy.prototxt", DETECTOR_CFG)
-_download_file("https://raw.githubusercontent.com/opencv/opencv_3rdparty/dnn_samples_face_detector_20180205_fp16/res10_300x300_ssd_iter_140000_fp16.caffemodel", DETECTOR_WEIGHTS)
-# We use a reliable source for the openface model
-_download_file("https://storage.cmusatyalab.org/openface-models/nn4.small2.v1.t7", EMBEDDED_MODEL)
+def ensure_models():
+    """Download the model files on first use rather than at import."""
+    with _models_lock:
+        for url, path in _MODEL_URLS:
+            _download_file(url, path)
 
-# Load networks globally
-detector = cv2.dnn.readNetFromCaffe(DETECTOR_CFG, DETECTOR_WEIGHTS)
-embedder = cv2.dnn.readNetFromTorch(EMBEDDED_MODEL)
+# cv2.dnn nets aren't safe to share between threads, so every inference-pool thread gets its own pair
+_local = threading.local()
 
-def get_face_encoding(image_bytes: bytes) -> list[float] | None:
+def _nets():
+    nets = getattr(_local, "nets", None)
+    if nets is None:
+        ensure_models()
+        nets = load_nets(
+            settings.INFERENCE_BACKEND, resource_plan["inference_threads"],
+            DETECTOR_CFG, DETECTOR_WEIGHTS, EMBEDDED_MODEL,
+        )
+        _local.nets = nets
+    return nets
+
+def warm_up() -> str:
+    """
+    Download the models and build this thread's nets ahead of the first request
+    (main.lifespan runs it on an inference-pool thread). Returns the backend in use.
+    """
+    detector, _ = _nets()
+    return detector.backend
+
+_cache_namespace = None
+
+def cache_namespace() -> str:
+    """Bump when the detector/embedder or their pre-processing change, so cached results are not reused."""
+    global _cache_namespace
+    if _cache_namespace is None:
+        # The backend actually loaded, which can differ from INFERENCE_BACKEND after a fallback
+        detector, _ = _nets()
+        _cache_namespace = (
+            f"ssd300-openface-v1-{detector.backend}-{settings.DETECTION_MODE}"
+            f"-q{settings.QUALITY_MIN_SCORE}-{settings.QUALITY_MIN_FACE_PX}{'-aligned' if settings.QUALITY_ALIGN else ''}"
+        )
+    return _cache_namespace
+
+_SSD_SIZE = (300, 300)
+_SSD_MEAN = (104.0, 177.0, 123.0)
+
+def _tile_grid(w: int, h: int) -> list[tuple[int, int, int, int]]:
+    """
+    Square, overlapping crops covering the frame at DETECTION_TILE_LEVELS
+    pyramid levels, plus the whole frame itself as level 0.
+    Level l uses tiles of side min(w, h) / l.
+    """
+    tiles = [(0, 0, w, h)]
+    overlap = settings.DETECTION_TILE_OVERLAP
+    for level in range(1, settings.DETECTION_TILE_LEVELS + 1):
+        side = max(1, int(min(w, h) / level))
+        step = max(1, int(side * (1 - overlap)))
+        nx = int(np.ceil(max(0, w - side) / step)) + 1
+        ny = int(np.ceil(max(0, h - side) / step)) + 1
+        for y0 in np.linspace(0, h - side, ny).astype(int):
+            for x0 in np.linspace(0, w - side, nx).astype(int):
+                tiles.append((int(x0), int(y0), int(x0) + side, int(y0) + side))
+    return tiles
+
+def _detect_boxes(image: np.ndarray) -> list[tuple[list[int], float]]:
+    """
+    (box, confidence) for every face above 0.3. In "tiled" mode, frames whose
+    long side reaches DETECTION_TILE_MIN_SIDE are cut into pyramid tiles that
+    go through the detector as one batch; duplicates across tiles are merged with NMS.
+    """
+    (h, w) = image.shape[:2]
+    if settings.DETECTION_MODE == "tiled" and max(h, w) >= settings.DETECTION_TILE_MIN_SIDE:
+        tiles = _tile_grid(w, h)
+    else:
+        tiles = [(0, 0, w, h)]
+
+    crops = [cv2.resize(image[y0:y1, x0:x1], _SSD_SIZE) for (x0, y0, x1, y1) in tiles]
+    blob = cv2.dnn.blobFromImages(crops, 1.0, _SSD_SIZE, _SSD_MEAN)
+    detector, _ = _nets()
+    detections = detector.run(blob)
+
+    boxes, scores = [], []
+    for i in range(0, detections.shape[2]):
+        confidence = float(detections[0, 0, i, 2])
+        if confidence > 0.3:
+            # Column 0 is the index of the tile in the batch
+            x0, y0, x1, y1 = tiles[int(detections[0, 0, i, 0])]
+            box = detections[0, 0, i, 3:7] * np.array([x1 - x0, y1 - y0, x1 - x0, y1 - y0]) + np.array([x0, y0, x0, y0])
+            (startX, startY, endX, endY) = box.astype("int")
+            startX = max(0, startX)
+            startY = max(0, startY)
+            endX = max(0, min(w, endX))
+            endY = max(0, min(h, endY))
+            boxes.append([int(startX), int(startY), int(endX), int(endY)])
+            scores.append(confidence)
+
+    if len(tiles) > 1 and boxes:
+        keep = cv2.dnn.NMSBoxes([[b[0], b[1], b[2] - b[0], b[3] - b[1]] for b in boxes], scores, 0.3, settings.DETECTION_NMS_THRESHOLD)
+        keep = sorted(int(k) for k in np.array(keep).flatten())
+        boxes = [boxes[k] for k in keep]
+        scores = [scores[k] for k in keep]
+    return list(zip(boxes, scores))
+
+def embed_faces(faces: list[np.ndarray]) -> np.ndarray:
+    """128-D encodings for a list of BGR face crops, as one batched embedder pass."""
+    if not faces:
+        return np.empty((0, 128), dtype=np.float32)
+    _, embedder = _nets()
+    # OpenFace expects 96x96 images
+    crops = [cv2.resize(face, (96, 96)) for face in faces]
+    blob = cv2.dnn.blobFromImages(crops, 1.0 / 255, (96, 96), (0, 0, 0), swapRB=True, crop=False)
     try:
-        # 1. Decode image bytes into an OpenCV matrix (BGR format)
+        vecs = embedder.run(blob)
+        vecs = vecs.reshape(vecs.shape[0], -1)
+    except cv2.error:
+        vecs = None
+    if vecs is None or vecs.shape[0] != len(crops):
+        # Backend can't batch this model; fall back to one pass per face
+        vecs = np.stack([embedder.run(blob[i:i + 1]).flatten() for i in range(len(crops))])
+    return vecs
+
+def detect_faces(image: np.ndarray, min_size: int = 10) -> list[tuple[list[int], float]]:
+    """Confident face boxes with both sides at least min_size pixels."""
+    return [
+        (box, confidence) for (box, confidence) in _detect_boxes(image)
+        if box[3] - box[1] >= min_size and box[2] - box[0] >= min_size
+    ]
+
+def _detect_and_embed(image: np.ndarray, min_size: int = 10, gate: bool = True) -> list[dict]:
+    """Detect faces in the image and embed every one that passes the quality gate (all of them with gate off)."""
+    kept = select_faces(image, detect_faces(image, min_size), gate)
+    vecs = embed_faces([crop for *_, crop in kept])
+    return [
+        {"box": box, "confidence": confidence, "quality": q["score"], "encoding": vec.tolist()}
+        for (box, confidence, q, _), vec in zip(kept, vecs)
+    ]
+
+def _analyze(image_bytes: bytes, gate: bool = False) -> list[dict]:
+    """Faces in an encoded image, served from the content-hash cache when these bytes were seen before."""
+    key = content_key(image_bytes, f"{cache_namespace()}-{'gated' if gate else 'all'}")
+    faces = embedding_cache.get(key)
+    if faces is None:
         np_arr = np.frombuffer(image_bytes, np.uint8)
         image = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
         if image is None:
-            return None
-
-        (h, w) = image.shape[:2]
+            return []
+        faces = _detect_and_embed(image, gate=gate)
+        embedding_cache.put(key, faces)
+    # Callers get their own dicts so they can't corrupt cached entries
+    return [dict(f) for f in faces]
 
-        # 2. Detect Face
-        # construct a blob from the image
-        blob = cv2.dnn.blobFromImage(cv2.resize(image, (300, 300)), 1.0, (300, 300), (104.0, 177.0, 123.0))
-        detector.setInput(blob)
-        detections = detector.forward()
+def analyze_face(image_bytes: bytes, gate: bool = True) -> dict | None:
+    """Most confident face in a scan image that passes the quality gate: box, confidence, quality, encoding."""
+    try:
+        faces = _analyze(image_bytes, gate)
+        return max(faces, key=lambda f: f["confidence"]) if faces else None
+    except Exception as e:
+        print(f"[OpenCV Face] Warning: Could not extract face. {e}")
+        return None
 
-        # Check if at least one face was found
-        if detections.shape[2] == 0:
+def get_face_encoding(image_bytes: bytes) -> list[float] | None:
+    """128-D encoding of the most confident face in the image, or None. Not quality-gated: used for registry photos."""
+    try:
+        faces = _analyze(image_bytes)
+        if not faces:
             return None
-
-        # Find the detection with the highest confidence
-        i = np.argmax(detections[0, 0, :, 2])
-        confidence = detections[0, 0, i, 2]
-
-        if confidence < 0.3:
-            return None # Face not confident enough
-
-        # Compute bounding box
-        box = detections[0, 0, i, 3:7] * np.array([w, h, w, h])
-        (startX, startY, endX, endY) = box.astype("int")
-
-        # Clamp bounding box to image dimensions
-        startX = max(0, startX)
-        startY = max(0, startY)
-        endX = max(0, min(w, endX))
-        endY = max(0, min(h, endY))
-
-        # Extract the face ROI (Region of Interest)
-        face = image[startY:endY, startX:endX]
-        if face.shape[0] < 10 or face.shape[1] < 10:
-            return None # Face too small
-
-        # 3. Get 128-d Embedding using OpenFace via OpenCV
-        # OpenFace expects 96x96 images
-        faceBlob = cv2.dnn.blobFromImage(face, 1.0 / 255, (96, 96), (0, 0, 0), swapRB=True, crop=False)
-        embedder.setInput(faceBlob)
-        vec = embedder.forward()
-        
-        # Flatten and return as a list of 128 floats
-        return vec.flatten().tolist()
+        best = max(faces, key=lambda f: f["confidence"])
+        return list(best["encoding"])
     except Exception as e:
         print(f"[OpenCV Face] Warning: Could not extract face. {e}")
         return None
 
-def scan_frame(image_bytes: bytes) -> list[dict]:
-    faces_data = []
+def best_face_box(image_bytes: bytes) -> list[int] | None:
+    """Box of the most confident face (cached alongside the encoding), or None."""
+    faces = _analyze(image_bytes)
+    if not faces:
+        return None
+    return list(max(faces, key=lambda f: f["confidence"])["box"])
+
+def scan_image(image: np.ndarray, camera_id: str | None = None, min_size: int = 10) -> list[dict]:
+    """
+    Faces in a decoded BGR frame. Frames tagged with a camera_id go through that
+    camera's motion gate first: unchanged frames reuse the previous result and
+    frames with localized motion only run the detector over the moving regions.
+    """
+    if not camera_id or not settings.MOTION_GATING_ENABLED:
+        return _detect_and_embed(image, min_size)
+
+    gate = gate_for(camera_id)
+    with gate.lock:
+        regions = gate.check(image)
+        if regions is None:
+            return [dict(f) for f in gate.last_faces]
+
+        t0 = time.perf_counter()
+        if not regions:
+            faces = _detect_and_embed(image, min_size)
+        else:
+            faces = []
+            for (x0, y0, x1, y1) in regions:
+                for f in _detect_and_embed(image[y0:y1, x0:x1], min_size):
+                    bx0, by0, bx1, by1 = f["box"]
+                    f["box"] = [bx0 + x0, by0 + y0, bx1 + x0, by1 + y0]
+                    faces.append(f)
+        # Faces outside the moving regions are carried over from the previous result
+        faces = gate.record(faces, (time.perf_counter() - t0) * 1000, full_frame=not regions, regions=regions)
+        return [dict(f) for f in faces]
+
+def scan_frame(image_bytes: bytes, camera_id: str | None = None) -> list[dict]:
     try:
-        np_arr = np.frombuffer(image_bytes, np.uint8)
-        image = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-        if image is None: return faces_data
-        (h, w) = image.shape[:2]
-        blob = cv2.dnn.blobFromImage(cv2.resize(image, (300, 300)), 1.0, (300, 300), (104.0, 177.0, 123.0))
-        detector.setInput(blob)
-        detections = detector.forward()
-        for i in range(0, detections.shape[2]):
-            confidence = detections[0, 0, i, 2]
-            if confidence > 0.3:
-                box = detections[0, 0, i, 3:7] * np.array([w, h, w, h])
-                (startX, startY, endX, endY) = box.astype("int")
-                startX = max(0, startX)
-                startY = max(0, startY)
-                endX = max(0, min(w, endX))
-                endY = max(0, min(h, endY))
-                face = image[startY:endY, startX:endX]
-                if face.shape[0] < 10 or face.shape[1] < 10: continue
-                faceBlob = cv2.dnn.blobFromImage(cv2.resize(face, (96, 96)), 1.0 / 255, (96, 96), (0, 0, 0), swapRB=True, crop=False)
-                embedder.setInput(faceBlob)
-                vec = embedder.forward().flatten()
-                faces_data.append({
-                    "box": [int(startX), int(startY), int(endX), int(endY)],
-                    "confidence": float(confidence),
-                    "encoding": vec.tolist()
-                })
-        return faces_data
+        if camera_id and settings.MOTION_GATING_ENABLED:
+            # Consecutive frames of one feed never repeat byte-for-byte; gate on pixels instead
+            image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                return []
+            return scan_image(image, camera_id)
+        return _analyze(image_bytes, gate=True)
     except Exception as e:
         print(f"[OpenCV Scan Frame] Warning: {e}")
-        return faces_data
+        return []
@@ -0,0 +1,117 @@
+"""
+Local stand-in for an external humanitarian registry feed, for exercising sync_worker.py.
+
+    python fake_feed_server.py --records 5000 --photos ../test_faces
+    EXTERNAL_FEED_URL=http://localhost:8765/records python sync_worker.py --once
+
+GET /records?cursor=<seq>&limit=<n> returns records with seq > cursor in order:
+    {"records": [...], "next_cursor": "<last seq>", "has_more": bool}
+with an ETag; a matching If-None-Match gets 304. POST /touch?n=<k> re-publishes
+k random records (new seq) to simulate upstream edits.
+"""
+import os
+import json
+import random
+import hashlib
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+_lock = threading.Lock()
+_records: list[dict] = []
+_photos: list[str] = []
+
+
+def _build(n: int, photo_dir: str | None, port: int):
+    global _photos
+    if photo_dir and os.path.isdir(photo_dir):
+        _photos = sorted(os.path.join(photo_dir, f) for f in os.listdir(photo_dir) if f.lower().endswith((".jpg", ".jpeg", ".png")))
+    rng = random.Random(0)
+    for seq in range(1, n + 1):
+        rec = {
+            "seq": seq,
+            "case_id": f"EXT-{seq:06d}",
+            "name": f"External Record {seq}",
+            "age": rng.choice(["10-20", "20-30", "30-40", "40-60"]),
+            "priority": rng.choice(["normal", "normal", "high"]),
+            "latitude": 34.0522 + rng.uniform(-1, 1),
+            "longitude": -118.2437 + rng.uniform(-1, 1),
+            "contact": "external_api@example.com",
+        }
+        if _photos:
+            rec["photo_url"] = f"http://localhost:{port}/photos/{(seq - 1) % len(_photos)}.jpg"
+        _records.append(rec)
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+    def _json(self, status: int, body: dict, etag: str | None = None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if etag:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.startswith("/photos/"):
+            idx = int(url.path.rsplit("/", 1)[-1].split(".")[0])
+            with open(_photos[idx], "rb") as f:
+                data = f.read()
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        if url.path != "/records":
+            return self._json(404, {"detail": "not found"})
+
+        qs = parse_qs(url.query)
+        cursor = int(qs.get("cursor", ["0"])[0] or 0)
+        limit = int(qs.get("limit", ["500"])[0])
+        with _lock:
+            newer = sorted((r for r in _records if r["seq"] > cursor), key=lambda r: r["seq"])
+            head = max((r["seq"] for r in _records), default=0)
+        page = newer[:limit]
+        etag = '"' + hashlib.sha1(f"{cursor}:{head}".encode()).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        next_cursor = str(page[-1]["seq"]) if page else str(cursor)
+        self._json(200, {"records": page, "next_cursor": next_cursor, "has_more": len(newer) > limit}, etag)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/touch":
+            return self._json(404, {"detail": "not found"})
+        n = int(parse_qs(url.query).get("n", ["10"])[0])
+        with _lock:
+            head = max((r["seq"] for r in _records), default=0)
+            for i, rec in enumerate(random.sample(_records, min(n, len(_records)))):
+                rec["seq"] = head + i + 1
+                rec["priority"] = random.choice(["normal", "high"])
+        self._json(200, {"touched": n})
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--records", type=int, default=1000)
+    parser.add_argument("--photos", default=None, help="folder of face images to attach as photo_url")
+    args = parser.parse_args()
+    _build(args.records, args.photos, args.port)
+    print(f"Fake feed serving {len(_records)} records on http://localhost:{args.port}/records")
+    ThreadingHTTPServer(("", args.port), FeedHandler).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import mmap
+from fastapi import HTTPException, UploadFile
+from PIL import Image, UnidentifiedImageError
+from uploads import read_upload, BufferReader
+from config import get_settings
+
+settings = get_settings()
+
+# Formats accepted for scan frames (PIL format name -> MIME); the first two are what clients are asked for
+FRAME_FORMATS = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+# Per-worker counters for /dashboard/health
+frame_stats = {"accepted": 0, "rejected": 0, "bytes": 0}
+
+
+def frame_spec() -> dict:
+    """What the detector needs from a client frame. Tiled detection only kicks in on large frames, so ask for those."""
+    max_side = settings.FRAME_TARGET_SIDE
+    if settings.DETECTION_MODE == "tiled":
+        max_side = max(max_side, settings.DETECTION_TILE_MIN_SIDE)
+    return {
+        "max_side": max_side,
+        "mime_types": ["image/jpeg", "image/webp"],
+        "quality": settings.FRAME_QUALITY,
+        "max_bytes": settings.FRAME_MAX_BYTES,
+        "max_pixels": settings.FRAME_MAX_PIXELS,
+    }
+
+
+def _reject(status: int, detail: str):
+    frame_stats["rejected"] += 1
+    raise HTTPException(status_code=status, detail=detail)
+
+
+async def read_frame(photo: UploadFile) -> tuple[bytes | mmap.mmap, str]:
+    """
+    Read an uploaded scan frame (see uploads.read_upload) and its sniffed MIME type, refusing it before
+    any pixel decode if it is over FRAME_MAX_BYTES, over FRAME_MAX_PIXELS, or not a supported format.
+    PIL only parses the header here; the detector does the one real decode.
+    """
+    if photo.size is not None and photo.size > settings.FRAME_MAX_BYTES:
+        _reject(413, f"Frame exceeds {settings.FRAME_MAX_BYTES} bytes")
+    data = read_upload(photo, settings.FRAME_MAX_BYTES)
+    try:
+        with Image.open(BufferReader(data)) as im:
+            fmt, (w, h) = im.format, im.size
+    except Image.DecompressionBombError:
+        # PIL refuses headers claiming over twice its own pixel limit before we get to compare
+        _reject(413, f"Frame exceeds {settings.FRAME_MAX_PIXELS} pixels")
+    except (UnidentifiedImageError, OSError):
+        fmt, w, h = None, 0, 0
+    if fmt not in FRAME_FORMATS:
+        _reject(415, f"Unsupported frame format; send one of {', '.join(FRAME_FORMATS.values())}")
+    if w * h > settings.FRAME_MAX_PIXELS:
+        _reject(413, f"Frame is {w}x{h}; at most {settings.FRAME_MAX_PIXELS} pixels allowed")
+    frame_stats["accepted"] += 1
+    frame_stats["bytes"] += len(data)
+    return data, FRAME_FORMATS[fmt]
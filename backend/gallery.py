@@ -0,0 +1,247 @@
+import os
+import json
+import asyncio
+import logging
+import asyncpg
+import numpy as np
+from sqlalchemy import select
+from database import AsyncSessionLocal, DB_URL
+from models import MissingPerson, GalleryState, GalleryChange
+from matching import Gallery, EMBEDDING_DIM, person_attrs, prefilter_stats
+from shards import ShardedGallery, shutdown_pool
+from gallery_snapshot import write_snapshot, snapshot_info, person_record
+from config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+CHANNEL = "gallery_changes"
+
+
+class SharedGallery:
+    """
+    Per-worker copy of the registry encodings, kept current by the
+    missing_persons trigger: NOTIFYs wake the worker, which reads the
+    gallery_changes log from its own version onward and patches the gallery.
+    A gap in the log (pruned history) or a lost listener connection falls
+    back to a full reload. A periodic version check covers dropped notifications.
+
+    With GALLERY_SHARDS > 1 the gallery is a ShardedGallery saved per version
+    under GALLERY_SHARD_DIR; a restart at an already-saved version maps those
+    files back in instead of reading the registry.
+    """
+
+    def __init__(self):
+        self.gallery = Gallery([], [], [], np.empty((0, EMBEDDING_DIM), np.float32))
+        self.version = 0
+        self.loaded = False
+        self.reloads = 0
+        self.changes_applied = 0
+        self._lock = asyncio.Lock()
+        self._wake = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+
+    def current(self) -> Gallery:
+        return self.gallery
+
+    async def reload(self):
+        async with self._lock:
+            await self._reload()
+
+    async def _reload(self):
+        sharded = settings.GALLERY_SHARDS > 1
+        async with AsyncSessionLocal() as db:
+            # Version first: anything committed after this read is re-applied by catch_up, which is idempotent
+            version = (await db.execute(select(GalleryState.version).where(GalleryState.id == 1))).scalar() or 0
+            gallery = await asyncio.to_thread(ShardedGallery.load, version) if sharded else None
+            if gallery is not None:
+                await asyncio.to_thread(gallery.warm)
+                logger.info(f"Gallery: mapped {len(gallery)} encodings from shard files at version {version}")
+            else:
+                result = await db.execute(select(MissingPerson).where(MissingPerson.encoding != None).order_by(MissingPerson.id))
+                persons = result.scalars().all()
+                if sharded:
+                    gallery = ShardedGallery.from_persons(persons)
+                    await asyncio.to_thread(gallery.save, version)
+                else:
+                    gallery = Gallery.from_persons(persons)
+                logger.info(f"Gallery: full reload, {len(gallery)} encodings at version {version}")
+        self.gallery, self.version, self.loaded = gallery, version, True
+        self.reloads += 1
+
+    async def catch_up(self):
+        async with self._lock:
+            if not self.loaded:
+                return await self._reload()
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    select(GalleryChange).where(GalleryChange.version > self.version).order_by(GalleryChange.version)
+                )
+                changes = result.scalars().all()
+                if not changes:
+                    return
+                if changes[0].version != self.version + 1:
+                    logger.warning(f"Gallery: change log gap after version {self.version}, reloading")
+                    return await self._reload()
+                ids = {c.person_id for c in changes}
+                result = await db.execute(select(MissingPerson).where(MissingPerson.id.in_(ids)))
+                persons = {p.id: p for p in result.scalars().all()}
+
+            upserts = [p for p in persons.values() if p.encoding is not None]
+            removed = [pid for pid in ids if pid not in persons or persons[pid].encoding is None]
+            gallery = self.gallery.apply(upserts, removed)
+            if isinstance(gallery, ShardedGallery):
+                await asyncio.to_thread(gallery.save, changes[-1].version)
+            self.gallery, self.version = gallery, changes[-1].version
+            self.changes_applied += len(changes)
+
+    def _on_notify(self, conn, pid, channel, payload):
+        try:
+            version = json.loads(payload)["version"]
+        except (ValueError, KeyError):
+            version = None
+        if version is None or version > self.version:
+            self._wake.set()
+
+    async def _listen(self):
+        dsn = DB_URL.replace("postgresql+asyncpg://", "postgresql://")
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(dsn)
+                await conn.add_listener(CHANNEL, self._on_notify)
+                # Anything committed while we weren't listening is picked up from the log
+                self._wake.set()
+                while not conn.is_closed():
+                    await asyncio.sleep(settings.GALLERY_VERSION_CHECK_SECONDS)
+                    self._wake.set()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Gallery: listener error: {e}")
+            finally:
+                if conn is not None and not conn.is_closed():
+                    await conn.close()
+            await asyncio.sleep(5)
+
+    async def _apply_loop(self):
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            try:
+                await self.catch_up()
+            except Exception as e:
+                logger.error(f"Gallery: catch-up failed, reloading: {e}")
+                try:
+                    await self.reload()
+                except Exception as e2:
+                    logger.error(f"Gallery: reload failed: {e2}")
+
+    async def start(self):
+        await self.reload()
+        self._tasks = [asyncio.create_task(self._listen()), asyncio.create_task(self._apply_loop())]
+
+    async def stop(self):
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        shutdown_pool()
+
+    def stats(self) -> dict:
+        out = {
+            "size": len(self.gallery),
+            "version": self.version,
+            "reloads": self.reloads,
+            "changes_applied": self.changes_applied,
+            "prefilter": dict(prefilter_stats),
+        }
+        if isinstance(self.gallery, ShardedGallery):
+            out.update(self.gallery.stats())
+        return out
+
+
+shared_gallery = SharedGallery()
+
+
+async def get_gallery() -> Gallery | ShardedGallery:
+    """The worker's live gallery, or a one-off load from Postgres when caching is off or not started."""
+    if settings.GALLERY_CACHE_ENABLED and shared_gallery.loaded:
+        return shared_gallery.current()
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(MissingPerson).where(MissingPerson.encoding != None))
+        return Gallery.from_persons(result.scalars().all())
+
+
+_snapshot_lock = asyncio.Lock()
+
+
+def _write_person_snapshot(path: str, version: int, persons) -> dict:
+    persons = [p for p in persons if p.encoding is not None]
+    vectors = np.array([np.asarray(p.encoding, dtype=np.float32) for p in persons], dtype=np.float32).reshape(len(persons), EMBEDDING_DIM)
+    write_snapshot(path, version, [p.id for p in persons], [p.name for p in persons], [p.case_id for p in persons],
+                   vectors, person_attrs(persons))
+    return snapshot_info(path)
+
+
+def _prune_snapshots(keep: int = 2):
+    """
+    Remove all but the `keep` newest snapshot versions. The previous version stays,
+    since another worker may have just handed it out and not yet opened it.
+    """
+    versions = []
+    for name in os.listdir(settings.GALLERY_SNAPSHOT_DIR):
+        parts = name.split(".")
+        if len(parts) == 3 and parts[0] == "gallery" and parts[2] == "snap" and parts[1].isdigit():
+            versions.append(int(parts[1]))
+    for version in sorted(versions)[:-keep]:
+        try:
+            os.remove(os.path.join(settings.GALLERY_SNAPSHOT_DIR, f"gallery.{version}.snap"))
+        except OSError:
+            pass
+
+
+async def build_snapshot() -> tuple[str, dict]:
+    """Path and header of the edge snapshot at the current gallery version, written on first request per version."""
+    async with _snapshot_lock:
+        os.makedirs(settings.GALLERY_SNAPSHOT_DIR, exist_ok=True)
+        async with AsyncSessionLocal() as db:
+            # Version first, as in SharedGallery._reload: later changes reach the edge as deltas
+            version = (await db.execute(select(GalleryState.version).where(GalleryState.id == 1))).scalar() or 0
+            path = os.path.join(settings.GALLERY_SNAPSHOT_DIR, f"gallery.{version}.snap")
+            if os.path.exists(path):
+                return path, await asyncio.to_thread(snapshot_info, path)
+            # Id order, so every worker writes the same bytes for a version
+            result = await db.execute(select(MissingPerson).where(MissingPerson.encoding != None).order_by(MissingPerson.id))
+            persons = result.scalars().all()
+        info = await asyncio.to_thread(_write_person_snapshot, path, version, persons)
+        await asyncio.to_thread(_prune_snapshots)
+        logger.info(f"Gallery: wrote edge snapshot of {info['count']} encodings at version {version}")
+        return path, info
+
+
+async def gallery_delta(since: int) -> dict:
+    """
+    Registry changes after version `since` as person records and removed ids.
+    `reset` means the change log no longer reaches back that far: fetch a new snapshot.
+    """
+    async with AsyncSessionLocal() as db:
+        version = (await db.execute(select(GalleryState.version).where(GalleryState.id == 1))).scalar() or 0
+        if since >= version:
+            return {"version": version, "reset": since > version, "upserts": [], "removed": []}
+        result = await db.execute(
+            select(GalleryChange).where(GalleryChange.version > since, GalleryChange.version <= version)
+            .order_by(GalleryChange.version)
+        )
+        changes = result.scalars().all()
+        if not changes or changes[0].version != since + 1:
+            return {"version": version, "reset": True, "upserts": [], "removed": []}
+        ids = {c.person_id for c in changes}
+        result = await db.execute(select(MissingPerson).where(MissingPerson.id.in_(ids)))
+        persons = {p.id: p for p in result.scalars().all()}
+    return {
+        "version": changes[-1].version,
+        "reset": False,
+        "upserts": [person_record(p) for p in persons.values() if p.encoding is not None],
+        "removed": [pid for pid in ids if pid not in persons or persons[pid].encoding is None],
+    }
@@ -0,0 +1,143 @@
+"""
+Binary gallery snapshots for edge scanners, and the delta records that keep them current.
+
+Layout (little-endian), version 1:
+
+    0    header   magic "MPGSNAP1", format, dim, count, gallery version, meta offset, meta length
+    64   matrix   count x dim float32, C order (64-byte aligned, so it can be memory-mapped as is)
+    ...  meta     UTF-8 JSON: ids, names, case_ids and the pre-filter attributes
+    -32  sha256   of everything before it
+
+This module only needs numpy, so edge boxes can use it without database access.
+"""
+import os
+import json
+import base64
+import struct
+import hashlib
+import tempfile
+from datetime import datetime
+from types import SimpleNamespace
+import numpy as np
+from matching import Gallery, EMBEDDING_DIM
+
+MAGIC = b"MPGSNAP1"
+FORMAT = 1
+_HEADER = struct.Struct("<8sHHIQQQQ")
+_MATRIX_OFFSET = 64
+_DIGEST_LEN = 32
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+def write_snapshot(path: str, version: int, ids, names, case_ids, vectors: np.ndarray, attrs: dict) -> str:
+    """
+    Write a snapshot atomically and return its sha256 hex digest. The temp file is
+    unique, so workers building the same version at once each rename a complete file.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype="<f4").reshape(len(ids), EMBEDDING_DIM)
+    meta = json.dumps({
+        "ids": list(ids), "names": list(names), "case_ids": list(case_ids),
+        "attrs": {
+            "high": attrs["high"].astype(bool).tolist(),
+            "lat": [None if np.isnan(v) else float(v) for v in attrs["lat"]],
+            "lon": [None if np.isnan(v) else float(v) for v in attrs["lon"]],
+            "registered": [None if np.isnan(v) else float(v) for v in attrs["registered"]],
+        },
+    }).encode()
+    meta_offset = _MATRIX_OFFSET + vectors.nbytes
+    header = _HEADER.pack(MAGIC, FORMAT, EMBEDDING_DIM, 0, len(ids), version, meta_offset, len(meta))
+
+    digest = hashlib.sha256()
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            # tobytes for an empty registry: a (0, dim) array can't be cast to a byte view
+            matrix = memoryview(vectors).cast("B") if len(vectors) else vectors.tobytes()
+            for part in (header.ljust(_MATRIX_OFFSET, b"\0"), matrix, meta):
+                f.write(part)
+                digest.update(part)
+            f.write(digest.digest())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    return digest.hexdigest()
+
+
+def snapshot_info(path: str) -> dict:
+    """Header fields and the stored checksum, without reading the matrix."""
+    with open(path, "rb") as f:
+        magic, fmt, dim, _, count, version, meta_offset, meta_len = _HEADER.unpack(f.read(_HEADER.size))
+        f.seek(-_DIGEST_LEN, os.SEEK_END)
+        checksum = f.read(_DIGEST_LEN).hex()
+    if magic != MAGIC or fmt != FORMAT or dim != EMBEDDING_DIM:
+        raise SnapshotError(f"{path}: not a format {FORMAT} gallery snapshot")
+    return {"version": version, "count": count, "meta_offset": meta_offset, "meta_len": meta_len, "checksum": checksum}
+
+
+def verify_snapshot(path: str) -> str:
+    """Check the trailing sha256; returns it, raises SnapshotError on mismatch."""
+    size = os.path.getsize(path)
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        left = size - _DIGEST_LEN
+        while left > 0:
+            chunk = f.read(min(1 << 20, left))
+            digest.update(chunk)
+            left -= len(chunk)
+        stored = f.read(_DIGEST_LEN)
+    if digest.digest() != stored:
+        raise SnapshotError(f"{path}: checksum mismatch")
+    return stored.hex()
+
+
+def load_snapshot(path: str, verify: bool = False) -> tuple[Gallery, int]:
+    """
+    (Gallery, version) over a memory-mapped snapshot: the matrix is paged in on
+    first search rather than read, so loading costs about as much as parsing the metadata.
+    """
+    if verify:
+        verify_snapshot(path)
+    info = snapshot_info(path)
+    count = info["count"]
+    vectors = np.memmap(path, dtype="<f4", mode="r", offset=_MATRIX_OFFSET, shape=(count, EMBEDDING_DIM)) \
+        if count else np.empty((0, EMBEDDING_DIM), np.float32)
+    with open(path, "rb") as f:
+        f.seek(info["meta_offset"])
+        meta = json.loads(f.read(info["meta_len"]))
+    a = meta["attrs"]
+    attrs = {
+        "high": np.array(a["high"], dtype=bool),
+        "lat": np.array([np.nan if v is None else v for v in a["lat"]], dtype=np.float32),
+        "lon": np.array([np.nan if v is None else v for v in a["lon"]], dtype=np.float32),
+        "registered": np.array([np.nan if v is None else v for v in a["registered"]], dtype=np.float64),
+    }
+    return Gallery(meta["ids"], meta["names"], meta["case_ids"], vectors, attrs=attrs), info["version"]
+
+
+def person_record(p) -> dict:
+    """Delta record for one person: the fields a Gallery row is built from, encoding as base64 float32."""
+    return {
+        "id": p.id, "name": p.name, "case_id": p.case_id, "priority": p.priority,
+        "latitude": p.latitude, "longitude": p.longitude,
+        "registered_at": p.registered_at.isoformat() if p.registered_at else None,
+        "encoding": base64.b64encode(np.asarray(p.encoding, dtype="<f4").tobytes()).decode(),
+    }
+
+
+def from_record(rec: dict) -> SimpleNamespace:
+    """A person-like object Gallery.apply accepts, from a delta record."""
+    return SimpleNamespace(
+        id=rec["id"], name=rec["name"], case_id=rec["case_id"], priority=rec["priority"],
+        latitude=rec["latitude"], longitude=rec["longitude"],
+        registered_at=datetime.fromisoformat(rec["registered_at"]) if rec["registered_at"] else None,
+        encoding=np.frombuffer(base64.b64decode(rec["encoding"]), dtype="<f4"),
+    )
@@ -0,0 +1,62 @@
+from abc import ABC, abstractmethod
+import cv2
+import numpy as np
+
+
+class Net(ABC):
+    """Minimal interface face_utils needs from a network: NCHW float32 blob in, raw output out."""
+    backend = "base"
+
+    @abstractmethod
+    def run(self, blob: np.ndarray) -> np.ndarray:
+        ...
+
+
+class OpenCVNet(Net):
+    backend = "opencv"
+
+    def __init__(self, net, dnn_backend: int = cv2.dnn.DNN_BACKEND_OPENCV, dnn_target: int = cv2.dnn.DNN_TARGET_CPU):
+        self.net = net
+        self.net.setPreferableBackend(dnn_backend)
+        self.net.setPreferableTarget(dnn_target)
+
+    def run(self, blob: np.ndarray) -> np.ndarray:
+        self.net.setInput(blob)
+        return self.net.forward()
+
+
+class OpenVINONet(OpenCVNet):
+    """OpenCV DNN dispatching to the OpenVINO Inference Engine (needs an OpenVINO-enabled OpenCV build)."""
+    backend = "openvino"
+
+    def __init__(self, net):
+        super().__init__(net, cv2.dnn.DNN_BACKEND_INFERENCE_ENGINE, cv2.dnn.DNN_TARGET_CPU)
+
+
+def _opencv_nets(detector_cfg: str, detector_weights: str, embedder_model: str):
+    return cv2.dnn.readNetFromCaffe(detector_cfg, detector_weights), cv2.dnn.readNetFromTorch(embedder_model)
+
+
+def _openvino_usable() -> bool:
+    try:
+        return cv2.dnn.DNN_BACKEND_INFERENCE_ENGINE in [b for b, _ in cv2.dnn.getAvailableBackends()]
+    except Exception:
+        return False
+
+
+def load_nets(backend: str, threads: int, detector_cfg: str, detector_weights: str, embedder_model: str) -> tuple[Net, Net]:
+    """
+    Build the (detector, embedder) pair for the requested backend, falling back
+    to plain OpenCV DNN when the requested one isn't available in this build.
+    """
+    if threads > 0:
+        cv2.setNumThreads(threads)
+
+    if backend == "openvino":
+        if _openvino_usable():
+            det, emb = _opencv_nets(detector_cfg, detector_weights, embedder_model)
+            return OpenVINONet(det), OpenVINONet(emb)
+        print("[Inference] Warning: OpenCV was built without the Inference Engine backend, using OpenCV DNN.")
+
+    det, emb = _opencv_nets(detector_cfg, detector_weights, embedder_model)
+    return OpenCVNet(det), OpenCVNet(emb)
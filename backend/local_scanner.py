@@ -1,32 +1,127 @@
 import os
 import sys
+import time
 import asyncio
+import threading
 import cv2
-import numpy as np
+import httpx
 
 # Add backend directory to path
 sys.path.insert(0, os.path.dirname(__file__))
 
-from database import AsyncSessionLocal
-from models import MissingPerson
-from sqlalchemy import select
-from face_utils import detector, embedder
+from face_utils import scan_image
+from matching import Gallery
+from motion import gate_for
+from quality import quality_stats
+from gallery_snapshot import SnapshotError, load_snapshot, snapshot_info, verify_snapshot, from_record
+from config import get_settings
+
+settings = get_settings()
+
+CAMERA_ID = "LOCAL-0"
 
 async def load_known_faces():
     """Load all registered persons and their encodings from DB."""
+    # Imported here so edge boxes syncing through the API never need Postgres settings
+    from database import AsyncSessionLocal
+    from models import MissingPerson
+    from sqlalchemy import select
     async with AsyncSessionLocal() as db:
         result = await db.execute(select(MissingPerson).where(MissingPerson.encoding != None))
         persons = result.scalars().all()
         return persons
 
+class EdgeSync(threading.Thread):
+    """
+    Keeps this box's gallery current from the API: the memory-mapped snapshot at
+    EDGE_SNAPSHOT_PATH is used as-is on start, then deltas are polled and applied
+    in memory. A fresh snapshot is only downloaded on first run or when the API
+    says the change log no longer reaches back to our version.
+    """
+
+    def __init__(self, api_url: str, username: str, password: str, path: str):
+        super().__init__(daemon=True)
+        self.client = httpx.Client(base_url=api_url.rstrip("/"), timeout=60)
+        self.username, self.password, self.path = username, password, path
+        self.token = None
+        self.gallery: Gallery | None = None
+        self.version = 0
+        self.stop_event = threading.Event()
+        if os.path.exists(path):
+            try:
+                self.gallery, self.version = load_snapshot(path)
+            except (SnapshotError, OSError, ValueError) as e:
+                print(f"Ignoring unreadable gallery snapshot {path}: {e}")
+
+    def _get(self, url: str, **kwargs) -> httpx.Response:
+        for attempt in (0, 1):
+            if self.token is None:
+                r = self.client.post("/auth/login", json={"username": self.username, "password": self.password})
+                r.raise_for_status()
+                self.token = r.json()["access_token"]
+            headers = {**kwargs.pop("headers", {}), "Authorization": f"Bearer {self.token}"}
+            r = self.client.get(url, headers=headers, **kwargs)
+            if r.status_code != 401 or attempt:
+                return r
+            self.token = None  # expired: log in again once
+        return r
+
+    def fetch_snapshot(self):
+        headers = {}
+        if self.gallery is not None and os.path.exists(self.path):
+            headers["If-None-Match"] = f'"{snapshot_info(self.path)["checksum"]}"'
+        r = self._get("/gallery/snapshot", headers=headers)
+        if r.status_code == 304:
+            return
+        r.raise_for_status()
+        tmp = f"{self.path}.download"
+        with open(tmp, "wb") as f:
+            f.write(r.content)
+        verify_snapshot(tmp)
+        # The old gallery keeps its mapping of the replaced file until it is dropped
+        os.replace(tmp, self.path)
+        self.gallery, self.version = load_snapshot(self.path)
+        print(f"Gallery snapshot: {len(self.gallery)} persons at version {self.version} ({len(r.content) / 1e6:.1f} MB)")
+
+    def sync_once(self):
+        if self.gallery is None:
+            return self.fetch_snapshot()
+        r = self._get("/gallery/delta", params={"since": self.version})
+        r.raise_for_status()
+        delta = r.json()
+        if delta["reset"]:
+            return self.fetch_snapshot()
+        if delta["upserts"] or delta["removed"]:
+            self.gallery = self.gallery.apply([from_record(rec) for rec in delta["upserts"]], delta["removed"])
+            print(f"Gallery delta: +{len(delta['upserts'])} -{len(delta['removed'])} -> version {delta['version']}")
+        self.version = delta["version"]
+
+    def run(self):
+        while not self.stop_event.wait(settings.EDGE_SYNC_SECONDS):
+            try:
+                self.sync_once()
+            except Exception as e:
+                print(f"Gallery sync failed, retrying in {settings.EDGE_SYNC_SECONDS}s: {e}")
+
 def main():
-    print("Loading registry database...")
-    persons = asyncio.run(load_known_faces())
-    if not persons:
+    sync = None
+    t0 = time.perf_counter()
+    if settings.EDGE_API_URL:
+        print(f"Loading gallery snapshot from {settings.EDGE_SNAPSHOT_PATH} (syncing with {settings.EDGE_API_URL})...")
+        sync = EdgeSync(settings.EDGE_API_URL, settings.EDGE_USERNAME, settings.EDGE_PASSWORD, settings.EDGE_SNAPSHOT_PATH)
+        if sync.gallery is None:
+            sync.sync_once()
+        sync.start()
+        gallery = sync.gallery
+    else:
+        print("Loading registry database...")
+        persons = asyncio.run(load_known_faces())
+        gallery = Gallery.from_persons(persons)
+    if not len(gallery):
         print("No registered persons with face encodings found in the database. Please register someone first.")
         return
         
-    print(f"Loaded {len(persons)} persons from the database.")
+    print(f"Loaded {len(gallery)} persons in {(time.perf_counter() - t0) * 1000:.0f} ms.")
     
     cap = cv2.VideoCapture(0)
     if not cap.isOpened():
@@ -40,63 +135,34 @@ def main():
         if not ret:
             break
             
-        (h, w) = frame.shape[:2]
-        
-        # Detect Face using OpenCV DNN
-        blob = cv2.dnn.blobFromImage(cv2.resize(frame, (300, 300)), 1.0, (300, 300), (104.0, 177.0, 123.0))
-        detector.setInput(blob)
-        detections = detector.forward()
+        # Detect faces with OpenCV DNN, gated on motion so static scenes skip the detector
+        faces = scan_image(frame, camera_id=CAMERA_ID, min_size=20)
         
+        if sync is not None:
+            gallery = sync.gallery
+
         # Loop over all detected faces
-        for i in range(0, detections.shape[2]):
-            confidence = detections[0, 0, i, 2]
-            
-            # Confidence threshold to confirm it's actually a face
-            if confidence > 0.3:
-                box = detections[0, 0, i, 3:7] * np.array([w, h, w, h])
-                (startX, startY, endX, endY) = box.astype("int")
-                
-                # Clamp coordinates to frame geometry
-                startX = max(0, startX)
-                startY = max(0, startY)
-                endX = max(0, min(w, endX))
-                endY = max(0, min(h, endY))
-                
-                face = frame[startY:endY, startX:endX]
-                if face.shape[0] < 20 or face.shape[1] < 20:
-                    continue
-                    
-                # Get the 128-D embedding using OpenFace via OpenCV
-                faceBlob = cv2.dnn.blobFromImage(cv2.resize(face, (96, 96)), 1.0 / 255, (96, 96), (0, 0, 0), swapRB=True, crop=False)
-                embedder.setInput(faceBlob)
-                vec = embedder.forward().flatten()
-                
-                # Compare against all known people using L2 Euclidean Distance
-                best_distance = float('inf')
-                best_match = None
-                
-                for p in persons:
-                    known_vec = np.array(p.encoding)
-                    dist = np.linalg.norm(known_vec - vec)
-                    if dist < best_distance:
-                        best_distance = dist
-                        best_match = p
+        for face in faces:
+            (startX, startY, endX, endY) = face["box"]
                 
-                conf_pct = max(0.0, 1.0 - best_distance) * 100
-                color = (0, 0, 255) # Red for unknown
-                label = "Unknown"
-                
-                # Match Threshold Check
-                if best_distance < 0.6 and best_match is not None:
-                    color = (0, 255, 0) # Green for Match
-                    label = f"MATCH: {best_match.name} ({conf_pct:.1f}%)"
-                    
-                # Draw Box and Display Label
-                cv2.rectangle(frame, (startX, startY), (endX, endY), color, 2)
+            # Compare against all known people using L2 Euclidean Distance
+            row, best_distance = gallery.best_match(face["encoding"])
+            
+            conf_pct = max(0.0, 1.0 - best_distance) * 100
+            color = (0, 0, 255) # Red for unknown
+            label = "Unknown"
+            
+            # Match Threshold Check
+            if row is not None:
+                color = (0, 255, 0) # Green for Match
+                label = f"MATCH: {gallery.names[row]} ({conf_pct:.1f}%)"
                 
-                (label_w, label_h), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.45, 1)
-                cv2.rectangle(frame, (startX, startY - 20), (max(endX, startX + label_w), startY), color, -1)
-                cv2.putText(frame, label, (startX + 5, startY - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1)
+            # Draw Box and Display Label
+            cv2.rectangle(frame, (startX, startY), (endX, endY), color, 2)
+            
+            (label_w, label_h), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.45, 1)
+            cv2.rectangle(frame, (startX, startY - 20), (max(endX, startX + label_w), startY), color, -1)
+            cv2.putText(frame, label, (startX + 5, startY - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1)
 
         # Show Output Stream
         cv2.imshow("Live Native OpenCV Scanner", frame)
@@ -106,6 +172,10 @@ def main():
 
     cap.release()
     cv2.destroyAllWindows()
+    if sync is not None:
+        sync.stop_event.set()
+    print(f"Motion gating: {gate_for(CAMERA_ID).stats()}")
+    print(f"Face quality: {quality_stats}")
 
 if __name__ == "__main__":
     main()
@@ -1,45 +1,90 @@
-import sys, os
+import sys, os, time
 sys.path.insert(0, os.path.dirname(__file__))
 
+_IMPORT_T0 = time.perf_counter()
+
+# Thread budget has to be in the environment before NumPy/OpenCV start their pools
+from resources import apply_thread_env
+apply_thread_env()
+
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 
 from config import get_settings
-from database import init_db, AsyncSessionLocal
-from models import User
-from auth import hash_password
-from sqlalchemy import select
-from tasks import fetch_external_databases
-import asyncio
+from database import maintain_detection_partitions
+from migrations import check_schema, migrate
+
+from routers import auth, persons, detections, dashboard, admin, jobs, edge
+from profiling import ProfilerMiddleware
+from gallery import shared_gallery
+from detection_writer import detection_writer
+from batch_jobs import reap_stale_jobs, stop_batch_jobs
+from storage import CachedStaticFiles
+from uploads import BodyLimitMiddleware
+from resources import run_inference
+from startup import phase, record, log_phases, logger
 
-from routers import auth, persons, detections, dashboard
+try:
+    import face_utils
+    FR_AVAILABLE = True
+except ImportError:
+    FR_AVAILABLE = False
 
 settings = get_settings()
 
+async def _warm_models():
+    t0 = time.perf_counter()
+    try:
+        backend = await run_inference(face_utils.warm_up)
+    except Exception:
+        # Requests retry the load on first use; only "eager" warm-up fails the boot
+        logger.exception("Model warm-up failed")
+        if settings.MODEL_WARMUP == "eager":
+            raise
+        return
+    record(f"models ({backend})", t0)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Init DB tables
-    await init_db()
-    # Seed default admin
-    async with AsyncSessionLocal() as db:
-        result = await db.execute(select(User).where(User.username == "admin"))
-        if not result.scalar_one_or_none():
-            admin = User(
-                username="admin",
-                password_hash=await hash_password("admin123"),
-                role="admin",
-                clearance_level=5,
-            )
-            db.add(admin)
-            await db.commit()
-            
-    # Start external DB background worker
-    asyncio.create_task(fetch_external_databases())
-    
+    record("imports", _IMPORT_T0)
+    # Model download / net construction runs on an inference thread while the DB phases below proceed
+    warm = None
+    if FR_AVAILABLE and settings.MODEL_WARMUP != "lazy":
+        warm = asyncio.create_task(_warm_models())
+    # One query against schema_version; migrations and the admin seed run out of band (migrate.py)
+    with phase("schema"):
+        if settings.SCHEMA_AUTO_MIGRATE:
+            await migrate()
+        await check_schema()
+    # Per-worker gallery, kept in sync with the other workers through Postgres NOTIFY
+    if settings.GALLERY_CACHE_ENABLED:
+        with phase("gallery"):
+            await shared_gallery.start()
+    # Batched detection inserts; replays rows spilled by a previous crash
+    with phase("detection writer"):
+        await detection_writer.start()
+    # Months ahead of now, checked in the background so a long-lived deployment never runs out of partitions
+    partitions = asyncio.create_task(maintain_detection_partitions()) if settings.DETECTION_PARTITIONING else None
+    # Batch jobs left unfinished by a worker that died (in-process tasks don't survive it)
+    reaper = asyncio.create_task(reap_stale_jobs())
+    if warm and settings.MODEL_WARMUP == "eager":
+        await warm
+    record("ready", _IMPORT_T0)
+    log_phases()
+    if warm and not warm.done():
+        warm.add_done_callback(lambda _: log_phases("Startup, after background model warm-up"))
+
     yield
 
+    if partitions:
+        partitions.cancel()
+    reaper.cancel()
+    await stop_batch_jobs()
+    await detection_writer.stop()
+    await shared_gallery.stop()
+
 app = FastAPI(
     title="Bureau of Identification API",
     description="Missing Person Face Recognition System",
@@ -47,6 +92,14 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
+# Body size caps, enforced as the bytes arrive (inside CORS so a 413 still carries CORS headers)
+app.add_middleware(
+    BodyLimitMiddleware,
+    default=settings.UPLOAD_MAX_BYTES,
+    # Scan frames: the frame itself plus a little room for the other form fields
+    limits={"/detections": settings.FRAME_MAX_BYTES + 64 * 1024},
+)
+
 # CORS — allow React frontend
 app.add_middleware(
     CORSMiddleware,
@@ -56,15 +109,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Opt-in sampling profiler for slow requests
+if settings.PROFILER_ENABLED:
+    app.add_middleware(ProfilerMiddleware)
+
 # Serve local uploads if Azure not configured
 os.makedirs("uploads", exist_ok=True)
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+app.mount("/uploads", CachedStaticFiles(directory="uploads"), name="uploads")
 
 # Routers
 app.include_router(auth.router)
 app.include_router(persons.router)
 app.include_router(detections.router)
 app.include_router(dashboard.router)
+app.include_router(admin.router)
+app.include_router(jobs.router)
+app.include_router(edge.router)
 
 @app.get("/", tags=["root"])
 async def root():
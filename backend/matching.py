@@ -0,0 +1,356 @@
+import math
+import numpy as np
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from config import get_settings
+
+settings = get_settings()
+
+# OpenFace nn4.small2 embedding size
+EMBEDDING_DIM = 128
+
+# L2 distance under which two OpenFace encodings are treated as the same person
+MATCH_THRESHOLD = 0.6
+
+# Rows scored per step in the compact first pass, to bound temporaries on large galleries
+_CHUNK_ROWS = 65536
+
+# Largest hnsw.ef_search pgvector accepts
+_MAX_EF_SEARCH = 1000
+
+
+EARTH_RADIUS_KM = 6371.0
+
+# How often a pre-filtered match had to fall back to the whole registry (this worker)
+prefilter_stats = {"filtered": 0, "filtered_hits": 0, "fallbacks": 0}
+
+
+@dataclass
+class MatchFilter:
+    """Candidate restriction tried before a full search: radius around the sighting, priority, registration window."""
+    latitude: float | None = None
+    longitude: float | None = None
+    radius_km: float = 0.0
+    high_priority_only: bool = False
+    registered_after: datetime | None = None
+
+    @classmethod
+    def from_settings(cls, latitude: float | None = None, longitude: float | None = None) -> "MatchFilter | None":
+        days = settings.MATCH_REGISTERED_WITHIN_DAYS
+        flt = cls(
+            latitude=latitude,
+            longitude=longitude,
+            radius_km=settings.MATCH_REGION_RADIUS_KM if latitude is not None and longitude is not None else 0.0,
+            high_priority_only=settings.MATCH_HIGH_PRIORITY_FIRST,
+            registered_after=datetime.utcnow() - timedelta(days=days) if days > 0 else None,
+        )
+        return flt if flt.active else None
+
+    @property
+    def active(self) -> bool:
+        return self.radius_km > 0 or self.high_priority_only or self.registered_after is not None
+
+    def bbox(self) -> tuple[float, float, float, float]:
+        """(lat_min, lat_max, lon_min, lon_max) enclosing the radius, for index-friendly range predicates."""
+        dlat = math.degrees(self.radius_km / EARTH_RADIUS_KM)
+        dlon = dlat / max(math.cos(math.radians(self.latitude)), 1e-6)
+        return self.latitude - dlat, self.latitude + dlat, self.longitude - dlon, self.longitude + dlon
+
+
+def person_attrs(persons) -> dict[str, np.ndarray]:
+    """Per-row filter attributes, aligned with the gallery rows built from `persons`."""
+    return {
+        "high": np.array([p.priority == "high" for p in persons], dtype=bool),
+        "lat": np.array([np.nan if p.latitude is None else p.latitude for p in persons], dtype=np.float32),
+        "lon": np.array([np.nan if p.longitude is None else p.longitude for p in persons], dtype=np.float32),
+        "registered": np.array([np.nan if p.registered_at is None else p.registered_at.timestamp() for p in persons], dtype=np.float64),
+    }
+
+
+def attribute_mask(attrs: dict[str, np.ndarray], flt: MatchFilter) -> np.ndarray:
+    """Rows passing every active part of the filter; rows with no location never pass a radius filter."""
+    mask = np.ones(len(attrs["high"]), dtype=bool)
+    if flt.high_priority_only:
+        mask &= attrs["high"]
+    if flt.registered_after is not None:
+        with np.errstate(invalid="ignore"):
+            mask &= attrs["registered"] >= flt.registered_after.timestamp()
+    if flt.radius_km > 0:
+        lat1, lon1 = np.radians(flt.latitude), np.radians(flt.longitude)
+        lat2, lon2 = np.radians(attrs["lat"].astype(np.float64)), np.radians(attrs["lon"].astype(np.float64))
+        a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+        with np.errstate(invalid="ignore"):
+            mask &= 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a)) <= flt.radius_km
+    return mask
+
+
+def match_with_fallback(gallery, encodings, flt: MatchFilter | None = None) -> list[tuple[int | None, float]]:
+    """
+    (row, distance) per encoding, row None unless within MATCH_THRESHOLD.
+    With a filter, only its candidates are searched first; misses are retried
+    against the whole gallery when MATCH_GLOBAL_FALLBACK is on.
+    """
+    encodings = list(encodings)
+    mask = attribute_mask(gallery.attrs, flt) if flt is not None and flt.active and len(gallery) else None
+    hits = gallery.search_many(encodings, 1, mask)
+    best = [h[0] if h else (None, float("inf")) for h in hits]
+    if mask is not None:
+        misses = [i for i, (_, d) in enumerate(best) if d >= MATCH_THRESHOLD]
+        prefilter_stats["filtered"] += len(encodings)
+        prefilter_stats["filtered_hits"] += len(encodings) - len(misses)
+        if misses and settings.MATCH_GLOBAL_FALLBACK:
+            prefilter_stats["fallbacks"] += len(misses)
+            for i, h in zip(misses, gallery.search_many([encodings[i] for i in misses], 1)):
+                if h:
+                    best[i] = h[0]
+    return [((row if dist < MATCH_THRESHOLD else None), dist) for row, dist in best]
+
+
+def quantize_int8(vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-dimension scalar quantization: vectors ≈ codes * scale."""
+    scale = np.abs(vectors).max(axis=0) / 127.0 if len(vectors) else np.ones(vectors.shape[1], np.float32)
+    scale = np.where(scale == 0, 1.0, scale).astype(np.float32)
+    codes = np.clip(np.rint(vectors / scale), -127, 127).astype(np.int8)
+    return codes, scale
+
+
+def dequantize_int8(codes: np.ndarray, scale: np.ndarray) -> np.ndarray:
+    return codes.astype(np.float32) * scale
+
+
+class Gallery:
+    """
+    In-memory registry encodings for brute-force matching.
+
+    `vectors` holds the exact float32 encodings. With a compact `precision`
+    ("float16" or "int8") the first pass scans the smaller copy instead and
+    only the top `rerank` candidates are re-scored against the exact vectors.
+    """
+
+    def __init__(self, ids: list[str], names: list[str], case_ids: list[str], vectors: np.ndarray,
+                 precision: str | None = None, rerank: int | None = None, attrs: dict | None = None):
+        self.ids = list(ids)
+        self.names = list(names)
+        self.case_ids = list(case_ids)
+        n = len(self.ids)
+        self.attrs = attrs if attrs is not None else {
+            "high": np.zeros(n, bool), "lat": np.full(n, np.nan, np.float32),
+            "lon": np.full(n, np.nan, np.float32), "registered": np.full(n, np.nan),
+        }
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(len(self.ids), EMBEDDING_DIM)
+        self.precision = precision or settings.EMBEDDING_PRECISION
+        self.rerank = rerank or settings.RERANK_CANDIDATES
+        self._rows = {pid: i for i, pid in enumerate(self.ids)}
+        self._build_compact()
+
+    @classmethod
+    def from_persons(cls, persons, **kwargs) -> "Gallery":
+        persons = [p for p in persons if p.encoding is not None]
+        vectors = np.array([np.asarray(p.encoding, dtype=np.float32) for p in persons], dtype=np.float32).reshape(len(persons), EMBEDDING_DIM)
+        return cls([p.id for p in persons], [p.name for p in persons], [p.case_id for p in persons], vectors,
+                   attrs=person_attrs(persons), **kwargs)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def row_of(self, person_id: str) -> int | None:
+        return self._rows.get(person_id)
+
+    # Galleries are swapped whole by their owners, so edits return a new instance
+    # and threads still searching the old one are never disturbed.
+    def apply(self, upserts=(), removed=()) -> "Gallery":
+        """Copy with `upserts` (MissingPerson rows) added or overwritten and `removed` ids dropped."""
+        upserts = [p for p in upserts if p.encoding is not None]
+        drop = set(removed) | {p.id for p in upserts}
+        keep = [i for i, pid in enumerate(self.ids) if pid not in drop]
+        ids = [self.ids[i] for i in keep] + [p.id for p in upserts]
+        names = [self.names[i] for i in keep] + [p.name for p in upserts]
+        case_ids = [self.case_ids[i] for i in keep] + [p.case_id for p in upserts]
+        added = np.array([np.asarray(p.encoding, dtype=np.float32) for p in upserts], dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+        vectors = np.vstack([self.vectors[keep], added])
+        new_attrs = person_attrs(upserts)
+        attrs = {key: np.concatenate([col[keep], new_attrs[key]]) for key, col in self.attrs.items()}
+        return Gallery(ids, names, case_ids, vectors, precision=self.precision, rerank=self.rerank, attrs=attrs)
+
+    def _build_compact(self):
+        self.codes = None
+        self.scale = None
+        self.half = None
+        self.compact_norms = None
+        if self.precision == "int8":
+            self.codes, self.scale = quantize_int8(self.vectors)
+            deq = dequantize_int8(self.codes, self.scale)
+            self.compact_norms = np.einsum("ij,ij->i", deq, deq)
+        elif self.precision == "float16":
+            self.half = self.vectors.astype(np.float16)
+            h = self.half.astype(np.float32)
+            self.compact_norms = np.einsum("ij,ij->i", h, h)
+
+    def nbytes(self) -> dict:
+        """Bytes held per representation (first-pass index vs. exact copy)."""
+        out = {"exact_float32": int(self.vectors.nbytes)}
+        if self.codes is not None:
+            out["int8"] = int(self.codes.nbytes + self.scale.nbytes + self.compact_norms.nbytes)
+        if self.half is not None:
+            out["float16"] = int(self.half.nbytes + self.compact_norms.nbytes)
+        return out
+
+    def _approx_sq_dists(self, query: np.ndarray) -> np.ndarray:
+        # ||x||² - 2·x·q (+ ||q||², constant per query and irrelevant for ranking)
+        out = np.empty(len(self), dtype=np.float32)
+        if self.codes is not None:
+            q = query * self.scale
+            for s in range(0, len(self), _CHUNK_ROWS):
+                out[s:s + _CHUNK_ROWS] = self.compact_norms[s:s + _CHUNK_ROWS] - 2.0 * (self.codes[s:s + _CHUNK_ROWS].astype(np.float32) @ q)
+        else:
+            for s in range(0, len(self), _CHUNK_ROWS):
+                out[s:s + _CHUNK_ROWS] = self.compact_norms[s:s + _CHUNK_ROWS] - 2.0 * (self.half[s:s + _CHUNK_ROWS].astype(np.float32) @ query)
+        return out
+
+    def _exact_dists(self, query: np.ndarray, rows: np.ndarray | None = None) -> np.ndarray:
+        vecs = self.vectors if rows is None else self.vectors[rows]
+        return np.linalg.norm(vecs - query, axis=1)
+
+    def search(self, encoding, k: int = 1, mask: np.ndarray | None = None) -> list[tuple[int, float]]:
+        """Top-k (row index, exact L2 distance) pairs, nearest first, optionally only over rows in `mask`."""
+        if len(self) == 0:
+            return []
+        query = np.asarray(encoding, dtype=np.float32).ravel()
+        if mask is not None:
+            # Pre-filtered candidate sets are small; score them exactly
+            rows = np.flatnonzero(mask)
+            dists = self._exact_dists(query, rows)
+        elif self.precision in ("int8", "float16"):
+            n_cand = min(len(self), max(k, self.rerank))
+            approx = self._approx_sq_dists(query)
+            rows = np.argpartition(approx, n_cand - 1)[:n_cand] if n_cand < len(self) else np.arange(len(self))
+            dists = self._exact_dists(query, rows)
+        else:
+            rows = np.arange(len(self))
+            dists = self._exact_dists(query)
+        order = np.argsort(dists)[:k]
+        return [(int(rows[i]), float(dists[i])) for i in order]
+
+    def search_many(self, encodings, k: int = 1, mask: np.ndarray | None = None) -> list[list[tuple[int, float]]]:
+        return [self.search(e, k, mask) for e in encodings]
+
+    def best_match(self, encoding, flt: MatchFilter | None = None) -> tuple[int | None, float]:
+        """Nearest row and its distance if it clears MATCH_THRESHOLD, else (None, distance)."""
+        return match_with_fallback(self, [encoding], flt)[0]
+
+    def best_matches(self, encodings, flt: MatchFilter | None = None) -> list[tuple[int | None, float]]:
+        """best_match for each encoding; sharded galleries answer the whole list in one scatter."""
+        return match_with_fallback(self, encodings, flt)
+
+
+_iterative_scan_ok: bool | None = None
+
+
+async def _enable_iterative_scan(db):
+    """Let filtered HNSW scans keep walking the graph until LIMIT rows pass the WHERE (pgvector >= 0.8)."""
+    global _iterative_scan_ok
+    if _iterative_scan_ok is False:
+        return
+    from sqlalchemy import text
+    try:
+        async with db.begin_nested():
+            await db.execute(text("SET LOCAL hnsw.iterative_scan = strict_order"))
+        _iterative_scan_ok = True
+    except Exception:
+        _iterative_scan_ok = False
+
+
+def _filter_clauses(flt: MatchFilter) -> list:
+    from sqlalchemy import func
+    from models import MissingPerson
+
+    clauses = []
+    if flt.high_priority_only:
+        clauses.append(MissingPerson.priority == "high")
+    if flt.registered_after is not None:
+        clauses.append(MissingPerson.registered_at >= flt.registered_after)
+    if flt.radius_km > 0:
+        lat_min, lat_max, lon_min, lon_max = flt.bbox()
+        # Bounding box first (indexable), then the exact great-circle distance
+        lat1, lon1 = func.radians(flt.latitude), func.radians(flt.longitude)
+        lat2, lon2 = func.radians(MissingPerson.latitude), func.radians(MissingPerson.longitude)
+        a = func.power(func.sin((lat2 - lat1) / 2), 2) + func.cos(lat1) * func.cos(lat2) * func.power(func.sin((lon2 - lon1) / 2), 2)
+        clauses += [
+            MissingPerson.latitude.between(lat_min, lat_max),
+            MissingPerson.longitude.between(lon_min, lon_max),
+            2 * EARTH_RADIUS_KM * func.asin(func.sqrt(a)) <= flt.radius_km,
+        ]
+    return clauses
+
+
+async def nearest_persons(db, encoding, k: int = 1, flt: MatchFilter | None = None) -> list[tuple[object, float]]:
+    """
+    Nearest registered persons by exact L2 distance, nearest first.
+
+    With a compact EMBEDDING_PRECISION the indexed first pass runs on the
+    halfvec column and the top RERANK_CANDIDATES are re-ranked in float32.
+    With a filter the search is restricted to its candidates first and, if
+    none clears MATCH_THRESHOLD, repeated over everyone (MATCH_GLOBAL_FALLBACK).
+    """
+    if flt is not None and flt.active:
+        await _enable_iterative_scan(db)
+        found = await _nearest_persons(db, encoding, k, _filter_clauses(flt))
+        prefilter_stats["filtered"] += 1
+        if found and found[0][1] < MATCH_THRESHOLD:
+            prefilter_stats["filtered_hits"] += 1
+            return found
+        if not settings.MATCH_GLOBAL_FALLBACK:
+            return found
+        prefilter_stats["fallbacks"] += 1
+    return await _nearest_persons(db, encoding, k, [])
+
+
+async def _nearest_persons(db, encoding, k: int, clauses: list) -> list[tuple[object, float]]:
+    from sqlalchemy import select
+    from models import MissingPerson
+
+    query = np.asarray(encoding, dtype=np.float32).ravel()
+    target = query.tolist()
+
+    if settings.EMBEDDING_PRECISION == "float32":
+        result = await db.execute(
+            select(MissingPerson, MissingPerson.encoding.l2_distance(target))
+            .where(MissingPerson.encoding != None, *clauses)
+            .order_by(MissingPerson.encoding.l2_distance(target))
+            .limit(k)
+        )
+        return [(p, float(d)) for p, d in result.all()]
+
+    result = await db.execute(
+        select(MissingPerson)
+        .where(MissingPerson.encoding_half != None, *clauses)
+        .order_by(MissingPerson.encoding_half.l2_distance(target))
+        .limit(max(k, settings.RERANK_CANDIDATES))
+    )
+    candidates = [p for p in result.scalars().all() if p.encoding is not None]
+    scored = [(p, float(np.linalg.norm(np.asarray(p.encoding, dtype=np.float32) - query))) for p in candidates]
+    scored.sort(key=lambda t: t[1])
+    return scored[:k]
+
+
+async def historical_sightings(db, encoding, limit: int | None = None) -> list[tuple[object, float]]:
+    """
+    Past detections whose stored face lies within MATCH_THRESHOLD of `encoding`,
+    nearest first. ORDER BY distance + LIMIT lets Postgres walk the HNSW index
+    on detections.encoding instead of scanning the table.
+    """
+    from sqlalchemy import select, text
+    from models import Detection
+
+    limit = max(1, min(int(limit or settings.REVERSE_SEARCH_LIMIT), _MAX_EF_SEARCH))
+    target = np.asarray(encoding, dtype=np.float32).ravel().tolist()
+    # The index only returns ef_search candidates, so widen it to the requested limit
+    await db.execute(text(f"SET LOCAL hnsw.ef_search = {max(40, limit)}"))
+    distance = Detection.encoding.l2_distance(target)
+    result = await db.execute(
+        select(Detection, distance)
+        .where(Detection.encoding != None)
+        .order_by(distance)
+        .limit(limit)
+    )
+    return [(d, float(dist)) for d, dist in result.all() if dist < MATCH_THRESHOLD]
@@ -0,0 +1,60 @@
+import os
+import sys
+import asyncio
+import argparse
+import logging
+
+# Add backend directory to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from sqlalchemy import select
+from database import AsyncSessionLocal, engine
+from models import User
+from auth import hash_password
+from migrations import MIGRATIONS, SCHEMA_VERSION, current_version, migrate
+
+async def seed_admin():
+    """Default admin account, created once (API workers no longer do this at boot)."""
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(User).where(User.username == "admin"))
+        if result.scalar_one_or_none():
+            return False
+        db.add(User(
+            username="admin",
+            password_hash=await hash_password("admin123"),
+            role="admin",
+            clearance_level=5,
+        ))
+        await db.commit()
+        return True
+
+async def status():
+    async with engine.connect() as conn:
+        version = await current_version(conn)
+    print(f"Database schema version {version}, this build {SCHEMA_VERSION}")
+    for v, description, _ in MIGRATIONS:
+        print(f"  {'applied' if v <= version else 'pending'}  {v}: {description}")
+    await engine.dispose()
+
+async def run(target: int | None, seed: bool):
+    for step in await migrate(target):
+        print(f"  {step}")
+    if seed and await seed_admin():
+        print("Seeded default admin user (admin / admin123) - change the password")
+    await engine.dispose()
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply database schema migrations, run before starting (or scaling) the API.")
+    parser.add_argument("--status", action="store_true", help="show applied and pending migrations and exit")
+    parser.add_argument("--target", type=int, default=None, help="migrate up to this version only")
+    parser.add_argument("--no-seed", action="store_true", help="don't create the default admin user")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    if args.status:
+        asyncio.run(status())
+        return
+    asyncio.run(run(args.target, not args.no_seed))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+"""
+Versioned schema migrations, run out of band with `python migrate.py` rather than on every API boot.
+
+Each step in MIGRATIONS runs in its own transaction together with its schema_version
+row, so a failed step leaves the version where it was. Steps must be idempotent
+(IF NOT EXISTS / backfills with a WHERE): databases created before versioning run
+every step once on their first migrate. REPEATABLE steps (partitions, indexes,
+functions and triggers) are re-applied by every migrate, after the versioned ones,
+so changes to DETECTION_PARTITIONING or ROLLUP_GEOHASH_PRECISION take effect there.
+API workers only compare SCHEMA_VERSION with the database (check_schema).
+"""
+import logging
+from typing import Awaitable, Callable
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+from database import Base, engine, _month, _is_partitioned, ensure_detection_partitions
+from config import get_settings
+
+import models  # noqa: F401  (registers every table on Base.metadata)
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Every change to a matchable registry field gets the next gallery version, a
+# gallery_changes row and a NOTIFY, so API workers can patch their in-memory galleries.
+_GALLERY_TRIGGER_SQL = [
+    """
+    CREATE OR REPLACE FUNCTION gallery_change_notify() RETURNS trigger AS $$
+    DECLARE
+        v BIGINT;
+        pid TEXT;
+        o TEXT;
+    BEGIN
+        IF TG_OP = 'UPDATE'
+           AND OLD.encoding IS NOT DISTINCT FROM NEW.encoding
+           AND OLD.name IS NOT DISTINCT FROM NEW.name
+           AND OLD.case_id IS NOT DISTINCT FROM NEW.case_id
+           AND OLD.priority IS NOT DISTINCT FROM NEW.priority
+           AND OLD.latitude IS NOT DISTINCT FROM NEW.latitude
+           AND OLD.longitude IS NOT DISTINCT FROM NEW.longitude THEN
+            RETURN NULL;
+        END IF;
+        IF TG_OP = 'DELETE' THEN pid := OLD.id; ELSE pid := NEW.id; END IF;
+        o := substr(TG_OP, 1, 1);
+        UPDATE gallery_state SET version = version + 1 WHERE id = 1 RETURNING version INTO v;
+        INSERT INTO gallery_changes (version, op, person_id, changed_at) VALUES (v, o, pid, now() at time zone 'utc');
+        PERFORM pg_notify('gallery_changes', json_build_object('version', v, 'op', o, 'id', pid)::text);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql;
+    """,
+    "INSERT INTO gallery_state (id, version) VALUES (1, 0) ON CONFLICT (id) DO NOTHING;",
+    "DROP TRIGGER IF EXISTS missing_persons_gallery_change ON missing_persons;",
+    """
+    CREATE TRIGGER missing_persons_gallery_change
+    AFTER INSERT OR UPDATE OR DELETE ON missing_persons
+    FOR EACH ROW EXECUTE FUNCTION gallery_change_notify();
+    """,
+]
+
+def _rollup_sql(precision: int) -> list[str]:
+    """
+    detection_rollups is kept in step with detections by row triggers: every row counts
+    once (and hit_count hits) in its (hour of timestamp, geohash cell, camera, status)
+    bucket, moving buckets when an update changes any of those. Deletes subtract too,
+    except in transactions that set rollups.keep_history (the retention job), so
+    archived detections stay in the trends.
+    """
+    return [
+        """
+        CREATE OR REPLACE FUNCTION geohash_encode(lat DOUBLE PRECISION, lon DOUBLE PRECISION, len INT) RETURNS TEXT AS $$
+        DECLARE
+            base32 CONSTANT TEXT := '0123456789bcdefghjkmnpqrstuvwxyz';
+            lat_lo DOUBLE PRECISION := -90;  lat_hi DOUBLE PRECISION := 90;
+            lon_lo DOUBLE PRECISION := -180; lon_hi DOUBLE PRECISION := 180;
+            mid DOUBLE PRECISION;
+            bits INT := 0;
+            ch INT := 0;
+            even BOOLEAN := TRUE;
+            hash TEXT := '';
+        BEGIN
+            IF lat IS NULL OR lon IS NULL THEN RETURN ''; END IF;
+            WHILE length(hash) < len LOOP
+                IF even THEN
+                    mid := (lon_lo + lon_hi) / 2;
+                    IF lon >= mid THEN ch := ch * 2 + 1; lon_lo := mid; ELSE ch := ch * 2; lon_hi := mid; END IF;
+                ELSE
+                    mid := (lat_lo + lat_hi) / 2;
+                    IF lat >= mid THEN ch := ch * 2 + 1; lat_lo := mid; ELSE ch := ch * 2; lat_hi := mid; END IF;
+                END IF;
+                even := NOT even;
+                bits := bits + 1;
+                IF bits = 5 THEN
+                    hash := hash || substr(base32, ch + 1, 1);
+                    bits := 0;
+                    ch := 0;
+                END IF;
+            END LOOP;
+            RETURN hash;
+        END
+        $$ LANGUAGE plpgsql IMMUTABLE;
+        """,
+        """
+        CREATE OR REPLACE FUNCTION detection_rollup_add(b TIMESTAMP, c TEXT, cam TEXT, st TEXT, n INT, h INT) RETURNS void AS $$
+            INSERT INTO detection_rollups (bucket, cell, camera_id, status, detections, hits)
+            VALUES (date_trunc('hour', b), c, coalesce(cam, ''), coalesce(st, ''), n, h)
+            ON CONFLICT (bucket, cell, camera_id, status) DO UPDATE
+            SET detections = detection_rollups.detections + EXCLUDED.detections,
+                hits = detection_rollups.hits + EXCLUDED.hits;
+        $$ LANGUAGE sql;
+        """,
+        f"""
+        CREATE OR REPLACE FUNCTION detection_rollup_change() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') AND NOT (TG_OP = 'DELETE' AND coalesce(current_setting('rollups.keep_history', true), '') = 'on') THEN
+                PERFORM detection_rollup_add(OLD.timestamp, geohash_encode(OLD.latitude, OLD.longitude, {precision}),
+                                             OLD.camera_id, OLD.status, -1, -coalesce(OLD.hit_count, 1));
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                PERFORM detection_rollup_add(NEW.timestamp, geohash_encode(NEW.latitude, NEW.longitude, {precision}),
+                                             NEW.camera_id, NEW.status, 1, coalesce(NEW.hit_count, 1));
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+        """,
+        "DROP TRIGGER IF EXISTS detections_rollup_insert_delete ON detections;",
+        """
+        CREATE TRIGGER detections_rollup_insert_delete
+        AFTER INSERT OR DELETE ON detections
+        FOR EACH ROW EXECUTE FUNCTION detection_rollup_change();
+        """,
+        "DROP TRIGGER IF EXISTS detections_rollup_update ON detections;",
+        """
+        CREATE TRIGGER detections_rollup_update
+        AFTER UPDATE ON detections
+        FOR EACH ROW
+        WHEN ((OLD.timestamp, OLD.latitude, OLD.longitude, OLD.camera_id, OLD.status, OLD.hit_count)
+              IS DISTINCT FROM (NEW.timestamp, NEW.latitude, NEW.longitude, NEW.camera_id, NEW.status, NEW.hit_count))
+        EXECUTE FUNCTION detection_rollup_change();
+        """,
+        # First run (or after a TRUNCATE to change the precision): build from what's in detections now
+        f"""
+        INSERT INTO detection_rollups (bucket, cell, camera_id, status, detections, hits)
+        SELECT date_trunc('hour', timestamp), geohash_encode(latitude, longitude, {precision}),
+               coalesce(camera_id, ''), coalesce(status, ''), count(*), sum(coalesce(hit_count, 1))
+        FROM detections
+        WHERE NOT EXISTS (SELECT 1 FROM detection_rollups)
+        GROUP BY 1, 2, 3, 4;
+        """,
+    ]
+
+
+_DETECTION_INDEX_SQL = [
+    # Newest-first listings and the retention scan
+    "CREATE INDEX IF NOT EXISTS ix_detections_timestamp ON detections (timestamp);",
+    "CREATE INDEX IF NOT EXISTS ix_detections_last_seen ON detections (last_seen);",
+    # Open-sighting lookup in sightings.record_sighting
+    "CREATE INDEX IF NOT EXISTS ix_detections_open_sighting "
+    "ON detections (person_id, camera_id, last_seen) WHERE status = 'pending';",
+    # Detection embeddings, so newly registered persons can be searched against past sightings
+    "CREATE INDEX IF NOT EXISTS ix_detections_encoding ON detections USING hnsw (encoding vector_l2_ops);",
+]
+
+
+
+async def _partition_detections(conn):
+    """
+    Rebuild a plain detections table as one range-partitioned by month on timestamp.
+    Partitioned primary keys must contain the partition key, so the key becomes
+    (id, timestamp) and detection_hits loses its foreign key to detections.id.
+    Rows outside the created months land in detections_default.
+    """
+    if await _is_partitioned(conn, "detections"):
+        return
+    await conn.execute(text("ALTER TABLE detection_hits DROP CONSTRAINT IF EXISTS detection_hits_detection_id_fkey;"))
+    await conn.execute(text("UPDATE detections SET timestamp = now() AT TIME ZONE 'utc' WHERE timestamp IS NULL;"))
+    oldest = (await conn.execute(text("SELECT min(timestamp) FROM detections"))).scalar()
+    await conn.execute(text("ALTER TABLE detections RENAME TO detections_unpartitioned;"))
+    await conn.execute(text("ALTER TABLE detections_unpartitioned RENAME CONSTRAINT detections_pkey TO detections_unpartitioned_pkey;"))
+    await conn.execute(text(
+        "CREATE TABLE detections (LIKE detections_unpartitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+        "PARTITION BY RANGE (timestamp);"
+    ))
+    await conn.execute(text("ALTER TABLE detections ALTER COLUMN timestamp SET NOT NULL;"))
+    await conn.execute(text("ALTER TABLE detections ADD PRIMARY KEY (id, timestamp);"))
+    await conn.execute(text(
+        "ALTER TABLE detections ADD FOREIGN KEY (person_id) REFERENCES missing_persons (id);"
+    ))
+    await ensure_detection_partitions(conn, _month(oldest) if oldest else None)
+    await conn.execute(text("CREATE TABLE IF NOT EXISTS detections_default PARTITION OF detections DEFAULT;"))
+    await conn.execute(text("INSERT INTO detections SELECT * FROM detections_unpartitioned;"))
+    await conn.execute(text("DROP TABLE detections_unpartitioned;"))
+
+
+async def _require_halfvec(conn):
+    """halfvec and its HNSW opclass need the pgvector server extension 0.7 or later."""
+    version = (await conn.execute(text("SELECT extversion FROM pg_extension WHERE extname = 'vector';"))).scalar()
+    if tuple(int(p) for p in version.split(".")[:2]) < (0, 7):
+        raise RuntimeError(
+            f"pgvector extension {version} is installed; halfvec needs 0.7 or later "
+            f"(upgrade the server package, then ALTER EXTENSION vector UPDATE)"
+        )
+
+
+async def _baseline(conn):
+    await conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector;"))
+    await _require_halfvec(conn)
+    await conn.run_sync(Base.metadata.create_all)
+
+
+async def _person_encoding_indexes(conn):
+    await _require_halfvec(conn)
+    # Compact halfvec copy of person encodings, backfilled and HNSW-indexed for first-pass search
+    await conn.execute(text("ALTER TABLE missing_persons ADD COLUMN IF NOT EXISTS encoding_half halfvec(128);"))
+    await conn.execute(text(
+        "UPDATE missing_persons SET encoding_half = encoding::halfvec(128) "
+        "WHERE encoding IS NOT NULL AND encoding_half IS NULL;"
+    ))
+    await conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_missing_persons_encoding_half "
+        "ON missing_persons USING hnsw (encoding_half halfvec_l2_ops);"
+    ))
+    # Exact-encoding index for the duplicate-case k-NN graph
+    await conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_missing_persons_encoding "
+        "ON missing_persons USING hnsw (encoding vector_l2_ops);"
+    ))
+    # Range predicates for the geographic match pre-filter
+    await conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_missing_persons_lat_lon "
+        "ON missing_persons (latitude, longitude);"
+    ))
+
+
+async def _detection_columns(conn):
+    # Where batch-search detections came from
+    await conn.execute(text("ALTER TABLE detections ADD COLUMN IF NOT EXISTS source TEXT;"))
+    await conn.execute(text("ALTER TABLE detections ADD COLUMN IF NOT EXISTS frame_offset DOUBLE PRECISION;"))
+    # Detection embeddings, so newly registered persons can be searched against past sightings
+    await conn.execute(text("ALTER TABLE detections ADD COLUMN IF NOT EXISTS encoding vector(128);"))
+    # Quality score of the face a detection was matched on
+    await conn.execute(text("ALTER TABLE detections ADD COLUMN IF NOT EXISTS quality DOUBLE PRECISION;"))
+    # Aggregated sightings: one row per (person, camera, time window) with a hit count
+    await conn.execute(text("ALTER TABLE detections ADD COLUMN IF NOT EXISTS last_seen TIMESTAMP WITHOUT TIME ZONE;"))
+    await conn.execute(text("ALTER TABLE detections ADD COLUMN IF NOT EXISTS hit_count INTEGER NOT NULL DEFAULT 1;"))
+    await conn.execute(text("UPDATE detections SET last_seen = timestamp WHERE last_seen IS NULL;"))
+    # Thumbnail / medium / face-crop derivatives of uploaded photos and snapshots
+    for table in ("missing_persons", "detections"):
+        for col in ("thumb_url", "medium_url", "face_url"):
+            await conn.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {col} TEXT;"))
+
+
+async def _detection_partitions(conn):
+    # Monthly range partitions on timestamp (one-off conversion of an existing table), then the months ahead
+    if settings.DETECTION_PARTITIONING:
+        await _partition_detections(conn)
+    await ensure_detection_partitions(conn)
+
+
+async def _detection_indexes(conn):
+    for stmt in _DETECTION_INDEX_SQL:
+        await conn.execute(text(stmt))
+
+
+async def _gallery_change_feed(conn):
+    # Gallery change feed for cross-worker cache invalidation
+    for stmt in _GALLERY_TRIGGER_SQL:
+        await conn.execute(text(stmt))
+
+
+async def _detection_rollups(conn):
+    # Hourly per-cell / camera / status counts for dashboard maps and trends; picks up ROLLUP_GEOHASH_PRECISION changes
+    for stmt in _rollup_sql(settings.ROLLUP_GEOHASH_PRECISION):
+        await conn.execute(text(stmt))
+
+
+async def _batch_job_heartbeat(conn):
+    # Last progress commit of a batch job, so jobs orphaned by a worker restart can be failed
+    await conn.execute(text("ALTER TABLE batch_jobs ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMP WITHOUT TIME ZONE;"))
+
+
+async def _detection_hit_ids(conn):
+    # UUID ids assigned when a hit is buffered (like every other table) instead of from a sequence
+    await conn.execute(text("ALTER TABLE detection_hits ALTER COLUMN id DROP DEFAULT;"))
+    await conn.execute(text("ALTER TABLE detection_hits ALTER COLUMN id TYPE VARCHAR(36) USING id::text;"))
+    await conn.execute(text("DROP SEQUENCE IF EXISTS detection_hits_id_seq;"))
+
+
+Migration = tuple[int, str, Callable[..., Awaitable[None]]]
+
+# Append only: never renumber or edit a step that has shipped
+MIGRATIONS: list[Migration] = [
+    (1, "baseline tables", _baseline),
+    (2, "person encoding halfvec and indexes", _person_encoding_indexes),
+    (3, "detection source, encoding, quality, sighting and derivative columns", _detection_columns),
+    (4, "batch job heartbeat", _batch_job_heartbeat),
+    (5, "detection hit uuid ids", _detection_hit_ids),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# In order: partitioning rebuilds the detections table, so its indexes and triggers come after it
+REPEATABLE: list[tuple[str, Callable[..., Awaitable[None]]]] = [
+    ("detection partitions", _detection_partitions),
+    ("detection indexes", _detection_indexes),
+    ("gallery change feed", _gallery_change_feed),
+    ("detection rollups", _detection_rollups),
+]
+
+_SCHEMA_VERSION_SQL = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    description TEXT NOT NULL,
+    applied_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT (now() AT TIME ZONE 'utc')
+);
+"""
+
+
+class SchemaOutOfDate(RuntimeError):
+    pass
+
+
+async def current_version(conn) -> int:
+    """Highest applied migration; 0 for a database that has never been migrated."""
+    try:
+        return (await conn.execute(text("SELECT coalesce(max(version), 0) FROM schema_version"))).scalar()
+    except ProgrammingError:
+        # No schema_version table yet
+        await conn.rollback()
+        return 0
+
+
+async def check_schema() -> int:
+    """The one query an API worker runs at startup. Raises SchemaOutOfDate when migrations are pending."""
+    async with engine.connect() as conn:
+        version = await current_version(conn)
+    if version < SCHEMA_VERSION:
+        raise SchemaOutOfDate(
+            f"Database schema is at version {version}, this build needs {SCHEMA_VERSION}: run `python migrate.py`"
+        )
+    if version > SCHEMA_VERSION:
+        logger.warning("Database schema version %s is newer than this build (%s)", version, SCHEMA_VERSION)
+    return version
+
+
+async def migrate(target: int | None = None) -> list[str]:
+    """Apply pending migrations up to `target` (default: all), then the repeatable steps. Returns what ran."""
+    target = SCHEMA_VERSION if target is None else target
+    applied = []
+    async with engine.begin() as conn:
+        await conn.execute(text(_SCHEMA_VERSION_SQL))
+    for version, description, step in MIGRATIONS:
+        if version > target:
+            break
+        async with engine.begin() as conn:
+            # Serializes concurrent migrate runs; the version is re-read under the lock
+            await conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('schema_version'))"))
+            if await current_version(conn) >= version:
+                continue
+            await step(conn)
+            await conn.execute(
+                text("INSERT INTO schema_version (version, description) VALUES (:v, :d)"),
+                {"v": version, "d": description},
+            )
+        logger.info("Applied migration %s: %s", version, description)
+        applied.append(f"{version}: {description}")
+    if target >= SCHEMA_VERSION:
+        for description, step in REPEATABLE:
+            async with engine.begin() as conn:
+                await conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('schema_version'))"))
+                await step(conn)
+            applied.append(f"repeatable: {description}")
+    return applied
@@ -1,9 +1,9 @@
 import uuid
 import json
 from datetime import datetime
-from sqlalchemy import String, Text, Integer, Float, Boolean, ForeignKey, DateTime, JSON
-from sqlalchemy.orm import Mapped, mapped_column, relationship
-from pgvector.sqlalchemy import Vector
+from sqlalchemy import String, Text, Integer, BigInteger, Float, Boolean, ForeignKey, DateTime, JSON
+from sqlalchemy.orm import Mapped, mapped_column, relationship, validates
+from pgvector.sqlalchemy import Vector, HALFVEC
 from database import Base
 
 class User(Base):
@@ -31,13 +31,23 @@ class MissingPerson(Base):
     latitude: Mapped[float | None] = mapped_column(Float, nullable=True)
     longitude: Mapped[float | None]= mapped_column(Float, nullable=True)
     photo_url: Mapped[str | None]  = mapped_column(Text, nullable=True)
+    thumb_url: Mapped[str | None]  = mapped_column(Text, nullable=True)   # size-bounded derivatives of photo_url
+    medium_url: Mapped[str | None] = mapped_column(Text, nullable=True)
+    face_url: Mapped[str | None]   = mapped_column(Text, nullable=True)
     encoding = mapped_column(Vector(128), nullable=True)  # pgvector embedding
+    encoding_half = mapped_column(HALFVEC(128), nullable=True)  # float16 copy for the compact first-pass search
     registered_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     registered_by_id: Mapped[str | None] = mapped_column(String(36), ForeignKey("users.id"), nullable=True)
 
     registered_by_user = relationship("User", back_populates="persons")
     detections = relationship("Detection", back_populates="person")
 
+    @validates("encoding")
+    def _sync_encoding_half(self, key, value):
+        # Keep the halfvec copy in step with every write to the exact encoding
+        self.encoding_half = value
+        return value
+
 
 class Detection(Base):
     __tablename__ = "detections"
@@ -50,10 +60,121 @@ class Detection(Base):
     latitude: Mapped[float | None]  = mapped_column(Float, nullable=True)
     longitude: Mapped[float | None] = mapped_column(Float, nullable=True)
     camera_id: Mapped[str | None]   = mapped_column(String(30), nullable=True)
-    timestamp: Mapped[datetime]     = mapped_column(DateTime, default=datetime.utcnow)
+    timestamp: Mapped[datetime]     = mapped_column(DateTime, default=datetime.utcnow)  # first seen
+    last_seen: Mapped[datetime | None] = mapped_column(DateTime, default=datetime.utcnow, index=True)
+    hit_count: Mapped[int]          = mapped_column(Integer, default=1)  # matches folded into this sighting
     snapshot_url: Mapped[str | None] = mapped_column(Text, nullable=True)
+    thumb_url: Mapped[str | None]    = mapped_column(Text, nullable=True)  # size-bounded derivatives of snapshot_url
+    medium_url: Mapped[str | None]   = mapped_column(Text, nullable=True)
+    face_url: Mapped[str | None]     = mapped_column(Text, nullable=True)
     confidence: Mapped[float | None] = mapped_column(Float, nullable=True)
     sms_sent: Mapped[bool]  = mapped_column(Boolean, default=False)
     status: Mapped[str]     = mapped_column(String(20), default="pending")
+    source: Mapped[str | None]        = mapped_column(Text, nullable=True)   # file a batch search read the frame from
+    frame_offset: Mapped[float | None] = mapped_column(Float, nullable=True) # seconds into that file
+    quality: Mapped[float | None]      = mapped_column(Float, nullable=True) # face quality score (0-1) of the matched crop
+    encoding = mapped_column(Vector(128), nullable=True)  # face seen in the snapshot, HNSW-indexed for reverse search
 
     person = relationship("MissingPerson", back_populates="detections")
+
+
+class DetectionHit(Base):
+    """Sampled raw hits behind an aggregated sighting (see sightings.record_sighting)."""
+    __tablename__ = "detection_hits"
+
+    # Client-side id, so a hit replayed from a write-behind spill segment is inserted once
+    id: Mapped[str]   = mapped_column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    detection_id: Mapped[str] = mapped_column(String(36), index=True)  # no FK: detections is partitioned on (id, timestamp)
+    timestamp: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    confidence: Mapped[float | None] = mapped_column(Float, nullable=True)
+    quality: Mapped[float | None]    = mapped_column(Float, nullable=True)
+    latitude: Mapped[float | None]   = mapped_column(Float, nullable=True)
+    longitude: Mapped[float | None]  = mapped_column(Float, nullable=True)
+    source: Mapped[str | None]       = mapped_column(Text, nullable=True)
+    frame_offset: Mapped[float | None] = mapped_column(Float, nullable=True)
+
+
+class DetectionRollup(Base):
+    """Detections per hour, geohash cell, camera and status; maintained by triggers on detections."""
+    __tablename__ = "detection_rollups"
+
+    bucket: Mapped[datetime] = mapped_column(DateTime, primary_key=True)       # hour of the detection's timestamp
+    cell: Mapped[str]        = mapped_column(String(12), primary_key=True)     # geohash, '' when no coordinates
+    camera_id: Mapped[str]   = mapped_column(String(30), primary_key=True)
+    status: Mapped[str]      = mapped_column(String(20), primary_key=True)
+    detections: Mapped[int]  = mapped_column(Integer, default=0)
+    hits: Mapped[int]        = mapped_column(BigInteger, default=0)
+
+
+class DetectionArchive(Base):
+    """One archive file of retired detections (gzipped JSONL) and the tar of their snapshots."""
+    __tablename__ = "detection_archives"
+
+    id: Mapped[str]   = mapped_column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    month: Mapped[str] = mapped_column(String(7), index=True)  # YYYY-MM of the rows' timestamps
+    rows_url: Mapped[str] = mapped_column(Text, nullable=False)
+    snapshots_url: Mapped[str | None] = mapped_column(Text, nullable=True)
+    row_count: Mapped[int] = mapped_column(Integer, default=0)
+    first_ts: Mapped[datetime] = mapped_column(DateTime, index=True)
+    last_ts: Mapped[datetime]  = mapped_column(DateTime, index=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+class BatchJob(Base):
+    __tablename__ = "batch_jobs"
+
+    id: Mapped[str]   = mapped_column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    source: Mapped[str]  = mapped_column(Text, nullable=False)
+    camera_id: Mapped[str | None]   = mapped_column(String(30), nullable=True)
+    status: Mapped[str]  = mapped_column(String(20), default="queued")  # queued / running / cancelling / cancelled / completed / failed
+    sample_every_s: Mapped[float] = mapped_column(Float, default=1.0)
+    total_frames: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    processed_frames: Mapped[int] = mapped_column(Integer, default=0)
+    faces_found: Mapped[int]  = mapped_column(Integer, default=0)
+    matches: Mapped[int]      = mapped_column(Integer, default=0)
+    frames_per_sec: Mapped[float | None] = mapped_column(Float, nullable=True)
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    started_at: Mapped[datetime | None]  = mapped_column(DateTime, nullable=True)
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    heartbeat_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)  # last progress commit
+    created_by_id: Mapped[str | None] = mapped_column(String(36), ForeignKey("users.id"), nullable=True)
+
+
+class DuplicateCluster(Base):
+    __tablename__ = "duplicate_clusters"
+
+    id: Mapped[str]   = mapped_column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    member_ids: Mapped[list] = mapped_column(JSON, nullable=False)   # missing_persons.id values
+    max_distance: Mapped[float] = mapped_column(Float, default=0.0)
+    status: Mapped[str] = mapped_column(String(20), default="open")  # open / merged / dismissed
+    merged_into_id: Mapped[str | None] = mapped_column(String(36), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    resolved_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
+
+class SyncState(Base):
+    __tablename__ = "sync_state"
+
+    feed: Mapped[str] = mapped_column(String(50), primary_key=True)
+    cursor: Mapped[str | None] = mapped_column(Text, nullable=True)
+    etag: Mapped[str | None]   = mapped_column(Text, nullable=True)
+    last_synced_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    last_stats: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+
+
+class GalleryState(Base):
+    """Single-row counter bumped by the missing_persons trigger; its row lock keeps versions gap-free and in commit order."""
+    __tablename__ = "gallery_state"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    version: Mapped[int] = mapped_column(BigInteger, default=0, nullable=False)
+
+
+class GalleryChange(Base):
+    __tablename__ = "gallery_changes"
+
+    version: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
+    op: Mapped[str]      = mapped_column(String(1), nullable=False)   # I / U / D
+    person_id: Mapped[str] = mapped_column(String(36), nullable=False)
+    changed_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
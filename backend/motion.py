@@ -0,0 +1,162 @@
+import threading
+from collections import OrderedDict
+import cv2
+import numpy as np
+from config import get_settings
+
+settings = get_settings()
+
+# Width the frame is shrunk to before differencing; motion only needs a coarse view
+_GATE_WIDTH = 160
+# Motion boxes are grown by this fraction so faces at their edges aren't cut off
+_REGION_PAD = 0.25
+# Above this share of the frame a single full-frame pass is cheaper than several crops
+_FULL_FRAME_PCT = 0.6
+
+
+class MotionGate:
+    """
+    Cheap frame-differencing stage in front of the face detector for one camera.
+
+    `check` returns None when nothing moved since the previous frame (skip
+    detection and reuse the last result), an empty list when the whole frame
+    should be scanned, or a list of (x0, y0, x1, y1) motion regions to scan.
+    """
+
+    def __init__(self, pixel_threshold: int, min_area_pct: float, refresh_frames: int):
+        self.pixel_threshold = pixel_threshold
+        self.min_area_pct = min_area_pct
+        self.refresh_frames = refresh_frames
+        self.lock = threading.Lock()
+        self._prev = None
+        self._since_full = 0
+        self.last_faces: list[dict] = []
+
+        self.frames = 0
+        self.skipped = 0
+        self.roi_frames = 0
+        self._full_ms = 0.0
+        self._full_runs = 0
+        self.detect_ms = 0.0
+
+    def check(self, image: np.ndarray) -> list[tuple[int, int, int, int]] | None:
+        (h, w) = image.shape[:2]
+        scale = _GATE_WIDTH / float(w)
+        small = cv2.resize(image, (_GATE_WIDTH, max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+
+        prev, self._prev = self._prev, gray
+        self.frames += 1
+        self._since_full += 1
+        if prev is None or prev.shape != gray.shape or self._since_full >= self.refresh_frames:
+            # First frame, resolution change, or periodic refresh so still faces are re-confirmed
+            self._since_full = 0
+            return []
+
+        diff = cv2.absdiff(prev, gray)
+        _, mask = cv2.threshold(diff, self.pixel_threshold, 255, cv2.THRESH_BINARY)
+        changed = cv2.countNonZero(mask) / float(mask.size)
+        if changed < self.min_area_pct:
+            self.skipped += 1
+            return None
+        if changed > _FULL_FRAME_PCT:
+            self._since_full = 0
+            return []
+
+        mask = cv2.dilate(mask, None, iterations=2)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        regions = []
+        for c in contours:
+            x, y, cw, ch = cv2.boundingRect(c)
+            px, py = int(cw * _REGION_PAD), int(ch * _REGION_PAD)
+            regions.append((
+                max(0, int((x - px) / scale)), max(0, int((y - py) / scale)),
+                min(w, int((x + cw + px) / scale)), min(h, int((y + ch + py) / scale)),
+            ))
+        regions = _merge_regions(regions)
+        if sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in regions) > _FULL_FRAME_PCT * w * h:
+            self._since_full = 0
+            return []
+        self.roi_frames += 1
+        return regions
+
+    def record(self, faces: list[dict], elapsed_ms: float, full_frame: bool,
+               regions: list[tuple[int, int, int, int]] | None = None):
+        """
+        Store a detection result. After a region-only pass, `faces` only covers the
+        motion `regions`, so previous faces lying wholly outside them (people standing
+        still) are carried over. Returns the merged faces.
+        """
+        if regions:
+            faces = faces + [f for f in self.last_faces if not any(_overlaps(f["box"], r) for r in regions)]
+        self.last_faces = faces
+        self.detect_ms += elapsed_ms
+        if full_frame:
+            self._full_ms += elapsed_ms
+            self._full_runs += 1
+        return faces
+
+    def stats(self) -> dict:
+        avg_full = self._full_ms / self._full_runs if self._full_runs else 0.0
+        # Every frame would otherwise have cost a full-frame pass
+        saved = max(0.0, avg_full * self.frames - self.detect_ms) if self._full_runs else 0.0
+        return {
+            "frames": self.frames,
+            "skipped": self.skipped,
+            "roi_frames": self.roi_frames,
+            "skip_rate": round(self.skipped / self.frames, 3) if self.frames else 0.0,
+            "avg_full_frame_ms": round(avg_full, 2),
+            "detect_ms": round(self.detect_ms, 1),
+            "cpu_saved_ms": round(saved, 1),
+        }
+
+
+def _overlaps(a, b) -> bool:
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def _merge_regions(regions: list[tuple[int, int, int, int]]) -> list[tuple[int, int, int, int]]:
+    """Union overlapping boxes until none overlap."""
+    merged = list(regions)
+    changed = True
+    while changed:
+        changed = False
+        out = []
+        while merged:
+            x0, y0, x1, y1 = merged.pop()
+            i = 0
+            while i < len(merged):
+                a0, b0, a1, b1 = merged[i]
+                if a0 <= x1 and x0 <= a1 and b0 <= y1 and y0 <= b1:
+                    x0, y0, x1, y1 = min(x0, a0), min(y0, b0), max(x1, a1), max(y1, b1)
+                    merged.pop(i)
+                    changed = True
+                else:
+                    i += 1
+            out.append((x0, y0, x1, y1))
+        merged = out
+    return merged
+
+
+# camera_id comes from the client, so gates are kept in a bounded LRU rather than one per id ever seen
+_gates: OrderedDict[str, MotionGate] = OrderedDict()
+_gates_lock = threading.Lock()
+
+
+def gate_for(camera_id: str) -> MotionGate:
+    with _gates_lock:
+        gate = _gates.get(camera_id)
+        if gate is None:
+            gate = MotionGate(settings.MOTION_PIXEL_THRESHOLD, settings.MOTION_MIN_AREA_PCT, settings.MOTION_REFRESH_FRAMES)
+            _gates[camera_id] = gate
+            while len(_gates) > settings.MOTION_MAX_CAMERAS:
+                # An evicted camera simply starts over with a full-frame pass
+                _gates.popitem(last=False)
+        else:
+            _gates.move_to_end(camera_id)
+        return gate
+
+
+def camera_stats() -> dict[str, dict]:
+    with _gates_lock:
+        return {cam: gate.stats() for cam, gate in _gates.items()}
@@ -0,0 +1,161 @@
+import os
+import re
+import sys
+import time
+import random
+import threading
+import collections
+from datetime import datetime
+import anyio
+from config import get_settings
+
+settings = get_settings()
+
+# Frames that mean "this thread is parked", not doing work for a request
+_IDLE_LEAVES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+_PROFILE_ID_RE = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+
+def _collapse(frame) -> str | None:
+    """Render a frame chain as a root-to-leaf collapsed stack ('a;b;c')."""
+    parts = []
+    leaf = (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name)
+    if leaf in _IDLE_LEAVES:
+        return None
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    parts.reverse()
+    return ";".join(parts)
+
+
+class StackSampler(threading.Thread):
+    """
+    Background thread that periodically snapshots the stacks of every other
+    thread into a ring buffer. Requests pick out the samples that fall inside
+    their own time window once they finish.
+    """
+
+    def __init__(self, interval_ms: float, buffer_seconds: float):
+        super().__init__(name="stack-sampler", daemon=True)
+        self.interval = interval_ms / 1000.0
+        self.samples = collections.deque(maxlen=max(1, int(buffer_seconds / self.interval)))
+        self._stop_event = threading.Event()
+
+    def run(self):
+        own_ident = threading.get_ident()
+        names = {}
+        while not self._stop_event.wait(self.interval):
+            now = time.perf_counter()
+            stacks = []
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = _collapse(frame)
+                if stack is None:
+                    continue
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stacks.append(f"{names.get(ident, ident)};{stack}")
+            if stacks:
+                self.samples.append((now, stacks))
+
+    def stop(self):
+        self._stop_event.set()
+
+    def collect(self, start: float, end: float) -> collections.Counter:
+        counts = collections.Counter()
+        for ts, stacks in list(self.samples):
+            if start <= ts <= end:
+                counts.update(stacks)
+        return counts
+
+
+def _endpoint_slug(method: str, path: str) -> str:
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", path).strip("_") or "root"
+    return f"{method.upper()}_{slug}"
+
+
+def _write_profile(endpoint: str, duration_ms: float, counts: collections.Counter):
+    os.makedirs(settings.PROFILER_DIR, exist_ok=True)
+    ts = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+    filename = f"{endpoint}__{ts}__{int(duration_ms)}ms.collapsed"
+    with open(os.path.join(settings.PROFILER_DIR, filename), "w") as f:
+        for stack, n in counts.most_common():
+            f.write(f"{stack} {n}\n")
+
+    # Keep only the newest profiles per endpoint
+    prefix = f"{endpoint}__"
+    existing = sorted(p for p in os.listdir(settings.PROFILER_DIR) if p.startswith(prefix))
+    for old in existing[:-settings.PROFILER_MAX_PER_ENDPOINT]:
+        try:
+            os.remove(os.path.join(settings.PROFILER_DIR, old))
+        except OSError:
+            pass
+
+
+class ProfilerMiddleware:
+    """
+    ASGI middleware that keeps the collapsed stacks for requests slower than
+    PROFILER_THRESHOLD_MS (or a random PROFILER_SAMPLE_RATE fraction).
+    Only installed when PROFILER_ENABLED is set, so it costs nothing when off.
+    Stacks from concurrent requests overlapping in time land in each other's
+    profile; the thread name at the root of each stack tells them apart.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.sampler = StackSampler(settings.PROFILER_INTERVAL_MS, settings.PROFILER_BUFFER_SECONDS)
+        self.sampler.start()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            t1 = time.perf_counter()
+            duration_ms = (t1 - t0) * 1000
+            if duration_ms >= settings.PROFILER_THRESHOLD_MS or random.random() < settings.PROFILER_SAMPLE_RATE:
+                counts = self.sampler.collect(t0, t1)
+                if counts:
+                    route = scope.get("route")
+                    endpoint = _endpoint_slug(scope["method"], getattr(route, "path", scope["path"]))
+                    await anyio.to_thread.run_sync(_write_profile, endpoint, duration_ms, counts)
+
+
+def list_profiles() -> list[dict]:
+    if not os.path.isdir(settings.PROFILER_DIR):
+        return []
+    out = []
+    for name in sorted(os.listdir(settings.PROFILER_DIR), reverse=True):
+        if not name.endswith(".collapsed"):
+            continue
+        profile_id = name[: -len(".collapsed")]
+        try:
+            endpoint, ts, duration = profile_id.split("__")
+        except ValueError:
+            continue
+        out.append({
+            "id": profile_id,
+            "endpoint": endpoint,
+            "created_at": datetime.strptime(ts, "%Y%m%dT%H%M%S%f"),
+            "duration_ms": int(duration.rstrip("ms")),
+        })
+    return out
+
+
+def profile_path(profile_id: str) -> str | None:
+    if not _PROFILE_ID_RE.match(profile_id):
+        return None
+    path = os.path.join(settings.PROFILER_DIR, f"{profile_id}.collapsed")
+    return path if os.path.isfile(path) else None
@@ -0,0 +1,113 @@
+import threading
+import cv2
+import numpy as np
+from config import get_settings
+
+settings = get_settings()
+
+# Crops are scored at the embedder's input size so blur scores don't depend on face size
+_SCORE_SIZE = (96, 96)
+_DETECTOR_FLOOR = 0.3
+
+_eyes = None
+_eyes_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+quality_stats = {"assessed": 0, "skipped": 0, "aligned": 0}
+
+
+def _count(key: str, n: int = 1):
+    with _stats_lock:
+        quality_stats[key] += n
+
+
+def face_quality(image: np.ndarray, box: list[int], confidence: float) -> dict:
+    """
+    Cheap per-crop quality scores in [0, 1] (sharpness from Laplacian variance,
+    size, exposure, detector confidence) and their geometric mean as `score`.
+    `passed` says whether the crop is worth an embedder pass.
+    """
+    x0, y0, x1, y1 = box
+    side = min(x1 - x0, y1 - y0)
+    crop = image[y0:y1, x0:x1]
+    if side <= 0 or crop.size == 0:
+        return {"score": 0.0, "sharpness": 0.0, "size": 0.0, "exposure": 0.0, "confidence": 0.0, "passed": False}
+
+    gray = cv2.cvtColor(cv2.resize(crop, _SCORE_SIZE, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+    sharpness = min(1.0, cv2.Laplacian(gray, cv2.CV_64F).var() / settings.QUALITY_BLUR_REF)
+    size = min(1.0, side / settings.QUALITY_SIZE_REF)
+    exposure = max(0.0, 1.0 - abs(float(gray.mean()) - 128.0) / 128.0)
+    conf = min(1.0, max(0.0, (confidence - _DETECTOR_FLOOR) / (1.0 - _DETECTOR_FLOOR)))
+
+    parts = np.array([sharpness, size, exposure, conf])
+    score = float(np.prod(np.maximum(parts, 1e-3)) ** (1 / len(parts)))
+    passed = side >= settings.QUALITY_MIN_FACE_PX and score >= settings.QUALITY_MIN_SCORE
+    _count("assessed")
+    return {
+        "score": round(score, 3), "sharpness": round(float(sharpness), 3), "size": round(size, 3),
+        "exposure": round(exposure, 3), "confidence": round(conf, 3), "passed": passed,
+    }
+
+
+def _eye_cascade():
+    """The bundled Haar eye cascade, or False if this OpenCV build doesn't ship one."""
+    global _eyes
+    with _eyes_lock:
+        if _eyes is None:
+            try:
+                _eyes = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_eye.xml")
+                if _eyes.empty():
+                    raise RuntimeError("haarcascade_eye.xml not found")
+            except (AttributeError, RuntimeError, cv2.error) as e:
+                print(f"[Quality] Warning: face alignment unavailable. {e}")
+                _eyes = False
+        return _eyes
+
+
+def align_face(image: np.ndarray, box: list[int]) -> np.ndarray:
+    """
+    Crop with the eyes levelled: the two strongest Haar eye hits in the upper
+    half of the box give the roll angle, and the frame is rotated about the
+    face centre before cropping. Returns the plain crop when eyes aren't found.
+    """
+    x0, y0, x1, y1 = box
+    crop = image[y0:y1, x0:x1]
+    cascade = _eye_cascade()
+    if cascade is False:
+        return crop
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+    upper = gray[: max(1, gray.shape[0] // 2)]
+    min_eye = max(8, (x1 - x0) // 8)
+    eyes = cascade.detectMultiScale(upper, scaleFactor=1.1, minNeighbors=5, minSize=(min_eye, min_eye))
+    if len(eyes) < 2:
+        return crop
+
+    eyes = sorted(eyes, key=lambda e: e[2] * e[3], reverse=True)[:2]
+    (lx, ly), (rx, ry) = sorted((ex + ew / 2, ey + eh / 2) for ex, ey, ew, eh in eyes)
+    angle = float(np.degrees(np.arctan2(ry - ly, rx - lx)))
+    if abs(angle) < 2 or abs(angle) > 30:
+        # Already level, or implausible (two hits on one eye, eyebrows): leave it
+        return crop
+
+    centre = ((x0 + x1) / 2, (y0 + y1) / 2)
+    m = cv2.getRotationMatrix2D(centre, angle, 1.0)
+    rotated = cv2.warpAffine(image, m, (image.shape[1], image.shape[0]), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+    _count("aligned")
+    return rotated[y0:y1, x0:x1]
+
+
+def select_faces(image: np.ndarray, found: list[tuple[list[int], float]], gate: bool = True) -> list[tuple[list[int], float, dict, np.ndarray]]:
+    """
+    (box, confidence, quality, crop) for each detected face worth embedding.
+    With `gate` off every face is kept, but still scored.
+    """
+    out = []
+    for box, confidence in found:
+        q = face_quality(image, box, confidence)
+        if gate and not q["passed"]:
+            _count("skipped")
+            continue
+        x0, y0, x1, y1 = box
+        crop = align_face(image, box) if settings.QUALITY_ALIGN else image[y0:y1, x0:x1]
+        out.append((box, confidence, q, crop))
+    return out
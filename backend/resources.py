@@ -0,0 +1,78 @@
+import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from config import get_settings
+
+settings = get_settings()
+
+# Env vars read by the BLAS/OpenMP runtimes when NumPy and OpenCV load them
+_THREAD_ENV_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+
+def _available_cores() -> int:
+    """Cores this process may use: affinity mask, capped by a cgroup v2 CPU quota if one is set."""
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cores = min(cores, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return max(1, cores)
+
+
+def plan_resources() -> dict:
+    """
+    Split the box's cores between uvicorn workers, then between concurrent
+    inference calls inside a worker, so pool_size × inference_threads per
+    worker never exceeds its share.
+    """
+    cores = settings.CPU_CORES or _available_cores()
+    workers = max(1, settings.WEB_CONCURRENCY)
+    per_worker = max(1, cores // workers)
+    pool_size = settings.INFERENCE_POOL_SIZE or max(1, per_worker // 2)
+    pool_size = min(pool_size, per_worker)
+    inference_threads = settings.INFERENCE_THREADS or max(1, per_worker // pool_size)
+    return {
+        "cores": cores,
+        "workers": workers,
+        "cores_per_worker": per_worker,
+        "inference_pool_size": pool_size,
+        "inference_threads": inference_threads,
+        "blas_threads": settings.BLAS_THREADS,
+    }
+
+
+plan = plan_resources()
+
+
+def apply_thread_env():
+    """Pin BLAS/OpenMP pool sizes. Must run before NumPy or OpenCV are first imported."""
+    for var in _THREAD_ENV_VARS:
+        os.environ.setdefault(var, str(plan["blas_threads"]))
+
+
+def effective_config() -> dict:
+    """The plan plus what the libraries actually ended up with."""
+    out = dict(plan)
+    out["env"] = {var: os.environ.get(var) for var in _THREAD_ENV_VARS}
+    try:
+        import cv2
+        out["cv2_threads"] = cv2.getNumThreads()
+    except ImportError:
+        pass
+    return out
+
+
+inference_pool = ThreadPoolExecutor(max_workers=plan["inference_pool_size"], thread_name_prefix="inference")
+
+
+async def run_inference(fn, *args, **kwargs):
+    """Run a blocking face_utils call on the bounded inference pool, off the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(inference_pool, functools.partial(fn, *args, **kwargs))
@@ -0,0 +1,211 @@
+import io
+import gzip
+import json
+import uuid
+import asyncio
+import logging
+import tarfile
+import tempfile
+from datetime import datetime, timedelta
+from sqlalchemy import select, delete, text
+from database import AsyncSessionLocal, engine, ensure_detection_partitions
+from models import Detection, DetectionHit, DetectionArchive
+from storage import read_media, remove_media, put_archive, get_archive
+from utils import naive_utc
+from config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+_MEDIA_COLUMNS = ("snapshot_url", "thumb_url", "medium_url", "face_url")
+_SNAPSHOT_TYPES = {"jpg": "image/jpeg", "webp": "image/webp", "png": "image/png"}
+
+
+def _snapshot_ext(data: bytes) -> str:
+    """File extension for a stored snapshot, from its magic bytes (scan snapshots may be WebP or PNG)."""
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    return "jpg"
+
+
+def _row(det: Detection) -> dict:
+    row = {}
+    for col in Detection.__table__.columns:
+        value = getattr(det, col.key)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        elif hasattr(value, "tolist"):
+            value = value.tolist()
+        row[col.key] = value
+    return row
+
+
+async def _write_archive(month: str, dets: list[Detection]) -> DetectionArchive:
+    """gzipped JSONL of the rows plus an (uncompressed, encoded images don't shrink) tar of their snapshots."""
+    base = f"detections/{month}/{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:6]}"
+    with tempfile.TemporaryFile() as rows_f, tempfile.TemporaryFile() as tar_f:
+        snapshots = 0
+        with gzip.GzipFile(fileobj=rows_f, mode="wb") as gz, tarfile.open(fileobj=tar_f, mode="w") as tar:
+            for det in dets:
+                row = _row(det)
+                data = await read_media(det.snapshot_url) if det.snapshot_url else None
+                if data:
+                    ext = _snapshot_ext(data)
+                    info = tarfile.TarInfo(f"{det.id}.{ext}")
+                    info.size = len(data)
+                    info.mtime = int(det.timestamp.timestamp())
+                    tar.addfile(info, io.BytesIO(data))
+                    row["archived_snapshot"] = info.name
+                    row["archived_snapshot_type"] = _SNAPSHOT_TYPES[ext]
+                    snapshots += 1
+                gz.write((json.dumps(row) + "\n").encode())
+        rows_url = await put_archive(f"{base}.jsonl.gz", rows_f)
+        snapshots_url = await put_archive(f"{base}.snapshots.tar", tar_f) if snapshots else None
+    return DetectionArchive(
+        month=month,
+        rows_url=rows_url,
+        snapshots_url=snapshots_url,
+        row_count=len(dets),
+        first_ts=min(d.timestamp for d in dets),
+        last_ts=max(d.last_seen or d.timestamp for d in dets),
+    )
+
+
+async def _drop_empty_partitions(cutoff: datetime) -> list[str]:
+    """Detach and drop monthly partitions that ended before the cutoff and have nothing left in them."""
+    dropped = []
+    async with engine.begin() as conn:
+        names = (await conn.execute(text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass('detections') AND c.relname ~ '^detections_[0-9]{4}_[0-9]{2}$'"
+        ))).scalars().all()
+        for name in sorted(names):
+            year, month = int(name[11:15]), int(name[16:18])
+            end = datetime(year + month // 12, month % 12 + 1, 1)
+            if end > cutoff:
+                continue
+            if (await conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {name})"))).scalar():
+                continue
+            await conn.execute(text(f"ALTER TABLE detections DETACH PARTITION {name};"))
+            await conn.execute(text(f"DROP TABLE {name};"))
+            dropped.append(name)
+        await ensure_detection_partitions(conn)
+    return dropped
+
+
+async def archive_detections(now: datetime | None = None) -> dict:
+    """
+    Move dismissed detections last seen more than DETECTION_RETENTION_DAYS ago into
+    archive files, one per month per batch, then delete the rows, their sampled hits
+    and their media. Archive files are written before the rows are deleted, and media
+    only removed after that commit, so a failure part-way never loses data.
+    """
+    stats = {"archived": 0, "archives": 0, "dropped_partitions": []}
+    if settings.DETECTION_RETENTION_DAYS <= 0:
+        return stats
+    cutoff = (now or datetime.utcnow()) - timedelta(days=settings.DETECTION_RETENTION_DAYS)
+
+    async with AsyncSessionLocal() as db:
+        while True:
+            dets = (await db.execute(
+                select(Detection)
+                .where(
+                    Detection.status == "dismissed",
+                    Detection.timestamp < cutoff,   # timestamp <= last_seen; lets Postgres prune partitions
+                    Detection.last_seen < cutoff,
+                )
+                .order_by(Detection.timestamp)
+                .limit(settings.DETECTION_ARCHIVE_BATCH)
+                # Held until the delete commits, so a reviewer can't re-open a row that is being archived
+                .with_for_update(skip_locked=True)
+            )).scalars().all()
+            if not dets:
+                break
+
+            by_month: dict[str, list[Detection]] = {}
+            for det in dets:
+                by_month.setdefault(f"{det.timestamp:%Y-%m}", []).append(det)
+            for month, group in by_month.items():
+                archive = await _write_archive(month, group)
+                db.add(archive)
+                stats["archives"] += 1
+
+            # Archived detections still count in the dashboard rollups
+            await db.execute(text("SET LOCAL rollups.keep_history = 'on'"))
+            ids = set((await db.execute(
+                delete(Detection)
+                .where(Detection.id.in_([d.id for d in dets]), Detection.status == "dismissed")
+                .returning(Detection.id)
+            )).scalars().all())
+            await db.execute(delete(DetectionHit).where(DetectionHit.detection_id.in_(ids)))
+            await db.commit()
+            stats["archived"] += len(ids)
+
+            for det in dets:
+                if det.id not in ids:
+                    continue
+                for col in _MEDIA_COLUMNS:
+                    if getattr(det, col):
+                        await asyncio.to_thread(remove_media, getattr(det, col))
+            db.expunge_all()
+
+    if settings.DETECTION_PARTITIONING:
+        stats["dropped_partitions"] = await _drop_empty_partitions(cutoff)
+    logger.info(f"Retention: archived {stats['archived']} detections into {stats['archives']} archives")
+    return stats
+
+
+def _load_rows(archive: DetectionArchive) -> list[dict]:
+    return [json.loads(line) for line in gzip.decompress(get_archive(archive.rows_url)).splitlines() if line]
+
+
+async def search_archive(
+    db,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    person_id: str | None = None,
+    case_id: str | None = None,
+    camera_id: str | None = None,
+    limit: int = 100,
+) -> list[dict]:
+    """Archived detection rows matching the filters, newest archives first. Only archives overlapping [start, end] are opened."""
+    start, end = naive_utc(start), naive_utc(end)
+    q = select(DetectionArchive).order_by(DetectionArchive.first_ts.desc())
+    if start:
+        q = q.where(DetectionArchive.last_ts >= start)
+    if end:
+        q = q.where(DetectionArchive.first_ts <= end)
+    out = []
+    for archive in (await db.execute(q)).scalars():
+        for row in await asyncio.to_thread(_load_rows, archive):
+            ts = datetime.fromisoformat(row["timestamp"])
+            if (start and ts < start) or (end and ts > end):
+                continue
+            if (person_id and row["person_id"] != person_id) or (case_id and row["case_id"] != case_id) \
+                    or (camera_id and row["camera_id"] != camera_id):
+                continue
+            row["archive_id"] = archive.id
+            out.append(row)
+            if len(out) >= limit:
+                return out
+    return out
+
+
+def _extract(location: str, det_id: str) -> tuple[bytes, str] | None:
+    with tarfile.open(fileobj=io.BytesIO(get_archive(location))) as tar:
+        for ext, mime in _SNAPSHOT_TYPES.items():
+            try:
+                return tar.extractfile(f"{det_id}.{ext}").read(), mime
+            except KeyError:
+                continue
+    return None
+
+
+async def archived_snapshot(db, archive_id: str, det_id: str) -> tuple[bytes, str] | None:
+    """(image bytes, MIME type) of an archived detection's snapshot, or None."""
+    archive = (await db.execute(select(DetectionArchive).where(DetectionArchive.id == archive_id))).scalar_one_or_none()
+    if not archive or not archive.snapshots_url:
+        return None
+    return await asyncio.to_thread(_extract, archive.snapshots_url, det_id)
@@ -0,0 +1,35 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import logging
+
+# Add backend directory to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from config import get_settings
+from retention import archive_detections
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive old dismissed detections and drop emptied partitions, run outside the API process.")
+    parser.add_argument("--once", action="store_true", help="run one retention pass and exit instead of repeating")
+    parser.add_argument("--days", type=int, default=None, help="overrides DETECTION_RETENTION_DAYS")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    settings = get_settings()
+    if args.days is not None:
+        settings.DETECTION_RETENTION_DAYS = args.days
+    if settings.DETECTION_RETENTION_DAYS <= 0:
+        print("DETECTION_RETENTION_DAYS is 0; nothing to archive.")
+        return
+
+    while True:
+        print(asyncio.run(archive_detections()))
+        if args.once:
+            return
+        time.sleep(settings.RETENTION_INTERVAL_SECONDS)
+
+if __name__ == "__main__":
+    main()
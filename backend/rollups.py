@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta
+from typing import Literal
+from sqlalchemy import select, func
+from models import DetectionRollup
+from utils import naive_utc
+from config import get_settings
+
+settings = get_settings()
+
+RollupGroup = Literal["cell", "hour", "day", "camera", "status"]
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def decode_geohash(cell: str) -> tuple[float, float]:
+    """Centre (lat, lon) of a geohash cell."""
+    lat_lo, lat_hi, lon_lo, lon_hi = -90.0, 90.0, -180.0, 180.0
+    even = True
+    for ch in cell:
+        bits = _BASE32.index(ch)
+        for shift in range(4, -1, -1):
+            bit = (bits >> shift) & 1
+            if even:
+                mid = (lon_lo + lon_hi) / 2
+                lon_lo, lon_hi = (mid, lon_hi) if bit else (lon_lo, mid)
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                lat_lo, lat_hi = (mid, lat_hi) if bit else (lat_lo, mid)
+            even = not even
+    return (lat_lo + lat_hi) / 2, (lon_lo + lon_hi) / 2
+
+
+async def query_rollups(
+    db,
+    group_by: RollupGroup = "day",
+    start: datetime | None = None,
+    end: datetime | None = None,
+    precision: int | None = None,
+    status: str | None = None,
+    camera_id: str | None = None,
+    cell: str | None = None,
+) -> list[dict]:
+    """
+    Detection and hit totals from detection_rollups, grouped for a map (by geohash
+    cell, coarsened to `precision`) or a trend (by hour/day, camera or status).
+    Defaults to the last 7 days.
+    """
+    end = naive_utc(end) or datetime.utcnow()
+    start = naive_utc(start) or end - timedelta(days=7)
+    precision = min(precision or settings.ROLLUP_GEOHASH_PRECISION, settings.ROLLUP_GEOHASH_PRECISION)
+
+    R = DetectionRollup
+    key = {
+        "cell": func.substr(R.cell, 1, precision),
+        "hour": R.bucket,
+        "day": func.date_trunc("day", R.bucket),
+        "camera": R.camera_id,
+        "status": R.status,
+    }[group_by].label("key")
+    query = (
+        select(key, func.sum(R.detections).label("detections"), func.sum(R.hits).label("hits"))
+        .where(R.bucket >= start, R.bucket < end)
+        .group_by(key)
+        .order_by(key)
+    )
+    if status:
+        query = query.where(R.status == status)
+    if camera_id:
+        query = query.where(R.camera_id == camera_id)
+    if cell:
+        query = query.where(R.cell.startswith(cell))
+    if group_by == "cell":
+        query = query.where(R.cell != "")
+
+    out = []
+    for k, detections, hits in (await db.execute(query)).all():
+        if not detections:
+            continue  # buckets emptied by status changes / deletes
+        row = {"key": k.isoformat() if isinstance(k, datetime) else k, "detections": int(detections), "hits": int(hits)}
+        if group_by == "cell":
+            row["latitude"], row["longitude"] = decode_geohash(k)
+        out.append(row)
+    return out
@@ -1 +1 @@
-from routers import auth, persons, detections, dashboard
+from routers import auth, persons, detections, dashboard, admin, jobs
@@ -0,0 +1,82 @@
+from datetime import datetime
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+from fastapi.responses import FileResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from database import get_db
+from models import DuplicateCluster, MissingPerson
+from auth import require_admin
+from schemas import ProfileOut, DuplicateClusterOut, MergeRequest, PersonOut
+from profiling import list_profiles, profile_path
+from dedup import run_dedup_scan, merge_cluster
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_admin)])
+
+@router.get("/profiles", response_model=list[ProfileOut])
+async def get_profiles(endpoint: str | None = None):
+    profiles = list_profiles()
+    if endpoint:
+        profiles = [p for p in profiles if p["endpoint"] == endpoint]
+    return profiles
+
+@router.get("/profiles/{profile_id}")
+async def download_profile(profile_id: str):
+    """Collapsed stacks, one 'frame;frame;frame count' line each (flamegraph.pl / speedscope input)."""
+    path = profile_path(profile_id)
+    if not path:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain", filename=f"{profile_id}.collapsed")
+
+async def _cluster_out(db: AsyncSession, cluster: DuplicateCluster) -> DuplicateClusterOut:
+    result = await db.execute(select(MissingPerson).where(MissingPerson.id.in_(cluster.member_ids)))
+    return DuplicateClusterOut(
+        id=cluster.id,
+        status=cluster.status,
+        max_distance=cluster.max_distance,
+        merged_into_id=cluster.merged_into_id,
+        created_at=cluster.created_at,
+        resolved_at=cluster.resolved_at,
+        members=[PersonOut.model_validate(p) for p in result.scalars().all()],
+    )
+
+async def _get_cluster(db: AsyncSession, cluster_id: str) -> DuplicateCluster:
+    # Row lock, so a concurrent merge/dismiss of the same cluster waits and then sees its status
+    cluster = await db.get(DuplicateCluster, cluster_id, with_for_update=True)
+    if not cluster:
+        raise HTTPException(status_code=404, detail="Cluster not found")
+    if cluster.status != "open":
+        raise HTTPException(status_code=409, detail=f"Cluster already {cluster.status}")
+    return cluster
+
+@router.post("/duplicates/scan", status_code=202)
+async def scan_duplicates(background_tasks: BackgroundTasks):
+    background_tasks.add_task(run_dedup_scan)
+    return {"message": "Duplicate scan started"}
+
+@router.get("/duplicates", response_model=list[DuplicateClusterOut])
+async def list_duplicates(status: str = "open", limit: int = 50, db: AsyncSession = Depends(get_db)):
+    result = await db.execute(
+        select(DuplicateCluster)
+        .where(DuplicateCluster.status == status)
+        .order_by(DuplicateCluster.max_distance)
+        .limit(limit)
+    )
+    return [await _cluster_out(db, c) for c in result.scalars().all()]
+
+@router.post("/duplicates/{cluster_id}/merge", response_model=PersonOut)
+async def merge_duplicates(cluster_id: str, body: MergeRequest, db: AsyncSession = Depends(get_db)):
+    cluster = await _get_cluster(db, cluster_id)
+    if body.keep_id not in cluster.member_ids:
+        raise HTTPException(status_code=400, detail="keep_id is not a member of this cluster")
+    keep = await merge_cluster(db, cluster, body.keep_id)
+    if keep is None:
+        raise HTTPException(status_code=404, detail="keep_id no longer exists")
+    return keep
+
+@router.post("/duplicates/{cluster_id}/dismiss", response_model=DuplicateClusterOut)
+async def dismiss_duplicates(cluster_id: str, db: AsyncSession = Depends(get_db)):
+    cluster = await _get_cluster(db, cluster_id)
+    cluster.status = "dismissed"
+    cluster.resolved_at = datetime.utcnow()
+    await db.commit()
+    return await _cluster_out(db, cluster)
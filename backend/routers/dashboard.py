@@ -1,12 +1,22 @@
 import time
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
 from database import get_db
 from models import MissingPerson, Detection, User
-from schemas import DashboardStats, SystemHealth
+from schemas import DashboardStats, SystemHealth, CameraStats, RollupBucket
 from auth import get_current_user
 from storage import AZURE_AVAILABLE
+from embedding_cache import embedding_cache
+from motion import camera_stats
+from resources import effective_config
+from gallery import shared_gallery
+from detection_writer import detection_writer
+from frames import frame_stats
+from uploads import upload_stats
+from startup import startup_phases
+from quality import quality_stats
+from rollups import RollupGroup, query_rollups
 from datetime import datetime, timedelta
 
 router = APIRouter(prefix="/dashboard", tags=["dashboard"])
@@ -53,4 +63,32 @@ async def get_health(
         storage_connected=AZURE_AVAILABLE,
         api_latency_ms=latency,
         storage_used_pct=42,   # real impl: query Azure metrics
+        embedding_cache=embedding_cache.stats(),
+        resources=effective_config(),
+        gallery=shared_gallery.stats(),
+        frames=dict(frame_stats),
+        face_quality=dict(quality_stats),
+        detection_writer=detection_writer.stats(),
+        uploads=dict(upload_stats),
+        startup=dict(startup_phases),
     )
+
+@router.get("/rollups", response_model=list[RollupBucket])
+async def get_rollups(
+    group_by: RollupGroup = "day",
+    start: datetime | None = None,
+    end: datetime | None = None,
+    precision: int | None = Query(None, ge=1, le=12),
+    status: str | None = None,
+    camera_id: str | None = None,
+    cell: str | None = None,
+    db: AsyncSession = Depends(get_db),
+    _: User = Depends(get_current_user),
+):
+    """Pre-aggregated detection counts for heatmaps (group_by=cell) and trends (hour/day/camera/status)."""
+    return await query_rollups(db, group_by, start, end, precision, status, camera_id, cell)
+
+@router.get("/cameras", response_model=list[CameraStats])
+async def get_camera_stats(_: User = Depends(get_current_user)):
+    """Per-camera motion-gating skip rate and detector time saved (this worker only)."""
+    return [CameraStats(camera_id=cam, **stats) for cam, stats in camera_stats().items()]
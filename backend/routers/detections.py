@@ -1,26 +1,40 @@
+import asyncio
 import uuid
-from fastapi import APIRouter, Depends, HTTPException, Form, File, UploadFile
+from datetime import datetime
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Form, File, UploadFile, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
 from database import get_db
 from models import Detection, User
-from schemas import DetectionOut
+from schemas import DetectionOut, ArchivedDetectionOut, FrameSpec
 from auth import get_current_user
-from utils import send_sms_alert
+from utils import send_sms_alert, naive_utc
 from models import MissingPerson
 from storage import upload_photo
+from derivatives import derive_detection_snapshot
+from sightings import record_sighting, buffer_hits
+from retention import search_archive, archived_snapshot
+from exports import ExportFormat, DETECTION_COLUMNS, export_response
+from detection_writer import detection_writer
+from config import get_settings
+from matching import MATCH_THRESHOLD, MatchFilter, nearest_persons
+from gallery import get_gallery
+from frames import read_frame, frame_spec
+from resources import run_inference
 import json
 import random
 import os
 
 try:
-    from face_utils import get_face_encoding
+    from face_utils import analyze_face
     import numpy as np
     FR_AVAILABLE = True
 except ImportError as e:
     print(f"Face extraction unavailable: {e}")
     FR_AVAILABLE = False
 
+settings = get_settings()
+
 router = APIRouter(prefix="/detections", tags=["detections"])
 
 @router.get("", response_model=list[DetectionOut])
@@ -28,12 +42,15 @@ async def list_detections(
     lat: float | None = None,
     lon: float | None = None,
     limit: int = 50,
+    since: datetime | None = None,
     db: AsyncSession = Depends(get_db),
     _: User = Depends(get_current_user),
 ):
-    result = await db.execute(
-        select(Detection).order_by(Detection.timestamp.desc()).limit(limit)
-    )
+    query = select(Detection).order_by(Detection.last_seen.desc()).limit(limit)
+    if since:
+        # Bounding timestamp lets Postgres skip older monthly partitions
+        query = query.where(Detection.timestamp >= naive_utc(since))
+    result = await db.execute(query)
     detections = result.scalars().all()
     
     if lat is not None and lon is not None:
@@ -50,78 +67,153 @@ async def list_detections(
         
     return detections
 
+@router.get("/export")
+async def export_detections(
+    format: ExportFormat = "csv",
+    start: datetime | None = None,
+    end: datetime | None = None,
+    status: str | None = None,
+    case_id: str | None = None,
+    _: User = Depends(get_current_user),
+):
+    """Every matching detection as CSV, NDJSON or GeoJSON, streamed oldest first."""
+    start, end = naive_utc(start), naive_utc(end)
+    query = select(Detection).order_by(Detection.timestamp)
+    if start:
+        query = query.where(Detection.timestamp >= start)
+    if end:
+        query = query.where(Detection.timestamp < end)
+    if status:
+        query = query.where(Detection.status == status)
+    if case_id:
+        query = query.where(Detection.case_id == case_id)
+    return export_response(query, DETECTION_COLUMNS, format, "detections")
+
+@router.get("/archive", response_model=list[ArchivedDetectionOut])
+async def list_archived_detections(
+    start: datetime | None = None,
+    end: datetime | None = None,
+    person_id: str | None = None,
+    case_id: str | None = None,
+    camera_id: str | None = None,
+    limit: int = 100,
+    db: AsyncSession = Depends(get_db),
+    _: User = Depends(get_current_user),
+):
+    """Detections moved out of the live table by the retention job."""
+    return await search_archive(db, start, end, person_id, case_id, camera_id, min(limit, 1000))
+
+@router.get("/archive/{archive_id}/{det_id}/snapshot")
+async def get_archived_snapshot(
+    archive_id: str,
+    det_id: str,
+    db: AsyncSession = Depends(get_db),
+    _: User = Depends(get_current_user),
+):
+    found = await archived_snapshot(db, archive_id, det_id)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Snapshot not found in archive")
+    data, media_type = found
+    return Response(content=data, media_type=media_type)
+
+@router.get("/frame_spec", response_model=FrameSpec)
+async def get_frame_spec():
+    """Size, format and quality clients should capture scan frames at."""
+    return FrameSpec(**frame_spec())
+
+async def _derive_when_written(seq: int, det_id: str, snapshot_url: str, image_bytes: bytes):
+    # The derivative UPDATE needs the row, so wait for the flush that covers it
+    if not await detection_writer.wait(seq, timeout=60):
+        print(f"Detection {det_id} not written within 60s; skipping its derivatives")
+        return
+    await derive_detection_snapshot(det_id, snapshot_url, image_bytes)
+
 @router.post("", response_model=DetectionOut)
 async def create_detection(
+    background_tasks: BackgroundTasks,
     latitude: float | None = Form(None),
     longitude: float | None = Form(None),
     photo: UploadFile | None = File(None),
     db: AsyncSession = Depends(get_db),
     _: User = Depends(get_current_user)
 ):
-    snapshot_url = None
+    image_bytes = None
     target_encoding = None
+    quality = None
+
+    async def upload_snapshot():
+        if image_bytes is None:
+            return None
+        ext = {"image/jpeg": "jpg", "image/webp": "webp", "image/png": "png"}[mime]
+        return await upload_photo(image_bytes, f"scan-{uuid.uuid4().hex[:8]}.{ext}", mime)
 
     if photo:
-        image_bytes = await photo.read()
-        ext = (photo.filename or "snapshot.jpg").rsplit(".", 1)[-1].lower()
-        filename = f"scan-{uuid.uuid4().hex[:8]}.{ext}"
-        snapshot_url = await upload_photo(image_bytes, filename, photo.content_type or "image/jpeg")
-        
+        image_bytes, mime = await read_frame(photo)
+
         # Extract embedding
         if FR_AVAILABLE:
-            target_encoding = get_face_encoding(image_bytes)
+            # Only faces that pass the quality gate are embedded and matched
+            face = await run_inference(analyze_face, image_bytes)
+            if face:
+                target_encoding, quality = face["encoding"], face["quality"]
 
     matched_person = None
     confidence = None
 
     if target_encoding:
-        # Provide the list of floats directly to <->
-        # Note: In latest pgvector + sqlalchemy, we can use MissingPerson.encoding.l2_distance(target_encoding)
-        # We'll use scalar raw text query approach for simplicity or l2_distance
-        result = await db.execute(
-            select(MissingPerson)
-            .where(MissingPerson.encoding != None)
-            .order_by(MissingPerson.encoding.l2_distance(target_encoding))
-            .limit(1)
-        )
-        closest_person = result.scalar_one_or_none()
-        
-        if closest_person:
-            # Re-fetch the distance to compute confidence
-            dist_result = await db.execute(
-                select(MissingPerson.encoding.l2_distance(target_encoding))
-                .where(MissingPerson.id == closest_person.id)
-            )
-            dist = dist_result.scalar()
-            
+        # Indexed nearest-neighbour query (halfvec first pass + float32 re-rank when enabled)
+        nearest = await nearest_persons(db, target_encoding, k=1, flt=MatchFilter.from_settings(latitude, longitude))
+        if nearest:
+            closest_person, dist = nearest[0]
             # Threshold Check
-            if dist is not None and dist < 0.6:
+            if dist < MATCH_THRESHOLD:
                 matched_person = closest_person
                 # confidence is roughly 1 - dist (for example, distance of 0.3 -> 70% confidence)
                 confidence = max(0.0, 1.0 - dist)
 
-    det = Detection(
-        latitude=latitude,
-        longitude=longitude,
-        snapshot_url=snapshot_url,
-        confidence=confidence,
-        status="pending" if confidence and confidence > 0.4 else "dismissed",
-        person_id=matched_person.id if matched_person else None,
-        person_name=matched_person.name if matched_person else None,
-        case_id=matched_person.case_id if matched_person else None,
-        location=f"Lat {latitude:.2f}, Lon {longitude:.2f}" if latitude else "Unknown Scanned Location",
-        camera_id="MANUAL-SCAN",
-        sms_sent=False
-    )
-    db.add(det)
+    location = f"Lat {latitude:.2f}, Lon {longitude:.2f}" if latitude else "Unknown Scanned Location"
+    if matched_person and confidence > 0.4:
+        # Repeat scans of the same person fold into one pending sighting; the snapshot
+        # is only uploaded when this scan is the best one so far
+        det, snapshot_changed, hit = await record_sighting(
+            db, matched_person.id, matched_person.name, matched_person.case_id, "MANUAL-SCAN",
+            confidence, upload_snapshot,
+            latitude=latitude, longitude=longitude, location=location,
+            encoding=target_encoding, quality=quality,
+        )
+    else:
+        fields = dict(
+            latitude=latitude,
+            longitude=longitude,
+            snapshot_url=await upload_snapshot(),
+            confidence=confidence,
+            status="dismissed",
+            person_id=matched_person.id if matched_person else None,
+            person_name=matched_person.name if matched_person else None,
+            case_id=matched_person.case_id if matched_person else None,
+            location=location,
+            camera_id="MANUAL-SCAN",
+            sms_sent=False,
+            encoding=target_encoding,
+            quality=quality,
+        )
+        if settings.DETECTION_WRITE_BEHIND:
+            # Insert-only row: acknowledged once buffered, written with the next batch
+            row = detection_writer.add(Detection, **fields)
+            if row["snapshot_url"]:
+                background_tasks.add_task(_derive_when_written, detection_writer.seq, row["id"], row["snapshot_url"], image_bytes)
+            return DetectionOut.model_validate(row).model_copy(update={"face_detected": target_encoding is not None})
+        det = Detection(**fields)
+        db.add(det)
+        snapshot_changed, hit = det.snapshot_url is not None, None
     await db.commit()
+    buffer_hits([hit])
     await db.refresh(det)
+    if snapshot_changed:
+        background_tasks.add_task(derive_detection_snapshot, det.id, det.snapshot_url, image_bytes)
     
     # Bundle response with face_detected flag
-    from fastapi.encoders import jsonable_encoder
-    resp = jsonable_encoder(det)
-    resp["face_detected"] = (target_encoding is not None)
-    return resp
+    return DetectionOut.model_validate(det).model_copy(update={"face_detected": target_encoding is not None})
 
 @router.get("/recent", response_model=list[DetectionOut])
 async def recent_detections(
@@ -129,7 +221,7 @@ async def recent_detections(
     _: User = Depends(get_current_user),
 ):
     result = await db.execute(
-        select(Detection).order_by(Detection.timestamp.desc()).limit(10)
+        select(Detection).order_by(Detection.last_seen.desc()).limit(10)
     )
     return result.scalars().all()
 
@@ -160,7 +252,7 @@ async def update_status(
                     det.sms_sent = True
 
             # 2. Continuous Learning: Average new encoding
-            if FR_AVAILABLE and det.snapshot_url and person.encoding:
+            if FR_AVAILABLE and det.snapshot_url and person.encoding is not None:
                 import httpx
                 
                 try:
@@ -177,7 +269,9 @@ async def update_status(
                             img_bytes = resp.content
 
                     if img_bytes:
-                        new_enc_list = get_face_encoding(img_bytes)
+                        # Gated, so a blurry confirmation snapshot doesn't drag the registry encoding
+                        face = await run_inference(analyze_face, img_bytes)
+                        new_enc_list = face["encoding"] if face else None
                         if new_enc_list:
                             if person.encoding is not None:
                                 old_enc = np.array(person.encoding)
@@ -195,49 +289,45 @@ async def update_status(
 @router.post("/live_scan")
 async def process_live_scan(
     photo: UploadFile = File(...),
+    camera_id: str | None = Form(None),
+    latitude: float | None = Form(None),
+    longitude: float | None = Form(None),
     db: AsyncSession = Depends(get_db)
 ):
     if not FR_AVAILABLE:
         return {"faces": []}
         
-    image_bytes = await photo.read()
+    image_bytes, _ = await read_frame(photo)
     from face_utils import scan_frame
-    faces_data = scan_frame(image_bytes)
+    faces_data = await run_inference(scan_frame, image_bytes, camera_id)
     
     if not faces_data:
         return {"faces": []}
         
-    result = await db.execute(select(MissingPerson).where(MissingPerson.encoding != None))
-    persons = result.scalars().all()
+    gallery = await get_gallery()
+    # One call for all faces: a sharded gallery scatters them to its matchers together
+    flt = MatchFilter.from_settings(latitude, longitude)
+    matches = await asyncio.to_thread(gallery.best_matches, [face["encoding"] for face in faces_data], flt)
     
     out_faces = []
-    import numpy as np
     
-    for face in faces_data:
-        vec = np.array(face["encoding"])
-        best_dist = float('inf')
-        best_match = None
-        
-        for p in persons:
-            known_vec = np.array(p.encoding)
-            dist = np.linalg.norm(known_vec - vec)
-            if dist < best_dist:
-                best_dist = dist
-                best_match = p
+    for face, (row, best_dist) in zip(faces_data, matches):
                 
-        if best_dist < 0.6 and best_match:
+        if row is not None:
             conf_pct = max(0.0, 1.0 - best_dist)
             out_faces.append({
                 "box": face["box"],
+                "quality": face.get("quality"),
                 "match": {
-                    "name": best_match.name,
+                    "name": gallery.names[row],
                     "confidence": float(conf_pct),
-                    "person_id": best_match.id
+                    "person_id": gallery.ids[row]
                 }
             })
         else:
             out_faces.append({
                 "box": face["box"],
+                "quality": face.get("quality"),
                 "match": None
             })
             
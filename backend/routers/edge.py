@@ -0,0 +1,27 @@
+from fastapi import APIRouter, Depends, Request, Response
+from fastapi.responses import FileResponse
+from models import User
+from schemas import GalleryDelta
+from auth import get_current_user
+from gallery import build_snapshot, gallery_delta
+
+router = APIRouter(prefix="/gallery", tags=["gallery"])
+
+@router.get("/snapshot")
+async def get_snapshot(request: Request, _: User = Depends(get_current_user)):
+    """Binary gallery snapshot (see gallery_snapshot.py) at the current version. ETag is its sha256."""
+    path, info = await build_snapshot()
+    headers = {
+        "ETag": f'"{info["checksum"]}"',
+        "X-Gallery-Version": str(info["version"]),
+        "X-Gallery-Checksum": info["checksum"],
+    }
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type="application/octet-stream", headers=headers,
+                        filename=f"gallery.{info['version']}.snap")
+
+@router.get("/delta", response_model=GalleryDelta)
+async def get_delta(since: int, _: User = Depends(get_current_user)):
+    """Changes after version `since`; `reset` asks the client to fetch a fresh snapshot instead."""
+    return await gallery_delta(since)
@@ -0,0 +1,68 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from database import get_db
+from models import BatchJob, User
+from schemas import BatchSearchRequest, BatchJobOut
+from auth import get_current_user
+from batch_jobs import resolve_source, start_batch_job
+from utils import naive_utc
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+@router.post("/batch_search", response_model=BatchJobOut, status_code=202)
+async def create_batch_search(
+    body: BatchSearchRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    try:
+        source = resolve_source(body.path)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    job = BatchJob(
+        source=source,
+        camera_id=body.camera_id,
+        sample_every_s=body.sample_every_s,
+        created_by_id=current_user.id,
+    )
+    db.add(job)
+    await db.commit()
+    await db.refresh(job)
+    start_batch_job(job.id, recorded_at=naive_utc(body.recorded_at), latitude=body.latitude, longitude=body.longitude)
+    return job
+
+@router.get("", response_model=list[BatchJobOut])
+async def list_jobs(
+    limit: int = 20,
+    db: AsyncSession = Depends(get_db),
+    _: User = Depends(get_current_user),
+):
+    result = await db.execute(select(BatchJob).order_by(BatchJob.created_at.desc()).limit(limit))
+    return result.scalars().all()
+
+@router.get("/{job_id}", response_model=BatchJobOut)
+async def get_job(
+    job_id: str,
+    db: AsyncSession = Depends(get_db),
+    _: User = Depends(get_current_user),
+):
+    job = await db.get(BatchJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.post("/{job_id}/cancel", response_model=BatchJobOut)
+async def cancel_job(
+    job_id: str,
+    db: AsyncSession = Depends(get_db),
+    _: User = Depends(get_current_user),
+):
+    job = await db.get(BatchJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status in ("queued", "running"):
+        job.status = "cancelling"
+        await db.commit()
+        await db.refresh(job)
+    return job
@@ -1,13 +1,21 @@
 import uuid
+from datetime import datetime
 from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, UploadFile, File, Form, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from database import get_db
 from models import MissingPerson
-from schemas import PersonOut
+from schemas import PersonOut, DetectionOut, SightingOut
 from auth import get_current_user, require_admin, User
 from storage import upload_photo, delete_blob
+from resources import run_inference
+from matching import historical_sightings
+from tasks import reverse_search_person
+from derivatives import derive_person_photo
+from uploads import read_upload
+from exports import ExportFormat, PERSON_COLUMNS, export_response
+from utils import naive_utc
 import random
 
 try:
@@ -64,8 +72,30 @@ async def list_persons(
         
     return persons
 
+@router.get("/export", dependencies=[Depends(require_admin)])
+async def export_persons(
+    format: ExportFormat = "csv",
+    start: datetime | None = None,
+    end: datetime | None = None,
+    priority: str | None = None,
+    case_id: str | None = None,
+):
+    """The registry (registered in [start, end)) as CSV, NDJSON or GeoJSON, streamed. Admin only: it includes contacts."""
+    start, end = naive_utc(start), naive_utc(end)
+    query = select(MissingPerson).order_by(MissingPerson.registered_at)
+    if start:
+        query = query.where(MissingPerson.registered_at >= start)
+    if end:
+        query = query.where(MissingPerson.registered_at < end)
+    if priority:
+        query = query.where(MissingPerson.priority == priority)
+    if case_id:
+        query = query.where(MissingPerson.case_id == case_id)
+    return export_response(query, PERSON_COLUMNS, format, "registry")
+
 @router.post("", response_model=PersonOut)
 async def register_person(
+    background_tasks: BackgroundTasks,
     name: str = Form(...),
     age: Optional[str] = Form(None),
     contact: Optional[str] = Form(None),
@@ -81,11 +111,12 @@ async def register_person(
     encoding = None
 
     if photo:
-        image_bytes = await photo.read()
+        # Size-capped; shared by the uploader, the embedder and the derivative task without copies
+        image_bytes = read_upload(photo)
         ext = (photo.filename or "photo.jpg").rsplit(".", 1)[-1].lower()
         filename = f"{case_id}.{ext}"
         photo_url = await upload_photo(image_bytes, filename, photo.content_type or "image/jpeg")
-        encoding = _encode_image_bytes(image_bytes)
+        encoding = await run_inference(_encode_image_bytes, image_bytes)
 
     person = MissingPerson(
         case_id=case_id,
@@ -102,16 +133,39 @@ async def register_person(
     db.add(person)
     await db.commit()
     await db.refresh(person)
+    if photo_url:
+        background_tasks.add_task(derive_person_photo, person.id, photo_url, image_bytes)
+    if person.encoding is not None:
+        # Check whether this face already turned up in earlier sightings
+        background_tasks.add_task(reverse_search_person, person.id)
     return person
 
+@router.get("/{person_id}/sightings", response_model=list[SightingOut])
+async def person_sightings(
+    person_id: str,
+    limit: int = Query(50, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+    _: User = Depends(get_current_user),
+):
+    """Past detections whose face is within the match threshold of this person, nearest first."""
+    result = await db.execute(select(MissingPerson).where(MissingPerson.id == person_id))
+    person = result.scalar_one_or_none()
+    if not person:
+        raise HTTPException(status_code=404, detail="Person not found")
+    if person.encoding is None:
+        return []
+    sightings = await historical_sightings(db, person.encoding, limit)
+    return [SightingOut(**DetectionOut.model_validate(det).model_dump(), distance=dist) for det, dist in sightings]
+
 @router.delete("/{person_id}", dependencies=[Depends(require_admin)])
 async def delete_person(person_id: str, db: AsyncSession = Depends(get_db)):
     result = await db.execute(select(MissingPerson).where(MissingPerson.id == person_id))
     person = result.scalar_one_or_none()
     if not person:
         raise HTTPException(status_code=404, detail="Person not found")
-    if person.photo_url:
-        delete_blob(person.photo_url)
+    for url in (person.photo_url, person.thumb_url, person.medium_url, person.face_url):
+        if url:
+            delete_blob(url)
     await db.delete(person)
     await db.commit()
     return {"message": "Person deleted"}
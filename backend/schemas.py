@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional
 from datetime import datetime
 
@@ -45,6 +45,9 @@ class PersonOut(BaseModel):
     latitude: Optional[float] = None
     longitude: Optional[float] = None
     photo_url: Optional[str] = None
+    thumb_url: Optional[str] = None
+    medium_url: Optional[str] = None
+    face_url: Optional[str] = None
     registered_at: datetime
     class Config: from_attributes = True
 
@@ -58,11 +61,54 @@ class DetectionOut(BaseModel):
     longitude: Optional[float] = None
     camera_id: Optional[str] = None
     timestamp: datetime
+    last_seen: Optional[datetime] = None
+    hit_count: int = 1
     snapshot_url: Optional[str] = None
+    thumb_url: Optional[str] = None
+    medium_url: Optional[str] = None
+    face_url: Optional[str] = None
     confidence: Optional[float] = None
     sms_sent: bool
     status: str
     face_detected: Optional[bool] = None
+    source: Optional[str] = None
+    frame_offset: Optional[float] = None
+    quality: Optional[float] = None
+    class Config: from_attributes = True
+
+class ArchivedDetectionOut(DetectionOut):
+    archive_id: str
+    person_id: Optional[str] = None
+    archived_snapshot: Optional[str] = None  # member name in the archive's snapshot tar
+    archived_snapshot_type: Optional[str] = None  # its MIME type
+
+class SightingOut(DetectionOut):
+    distance: float
+
+# ── Batch Search Jobs ─────────────────────────
+class BatchSearchRequest(BaseModel):
+    path: str                      # video file or image folder, relative to BATCH_INPUT_DIR
+    sample_every_s: float = 1.0    # video only: seconds between sampled frames
+    camera_id: Optional[str] = Field(None, max_length=30)  # batch_jobs / detections.camera_id are String(30)
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    recorded_at: Optional[datetime] = None  # wall-clock start of the footage, for detection timestamps
+
+class BatchJobOut(BaseModel):
+    id: str
+    source: str
+    camera_id: Optional[str] = None
+    status: str
+    sample_every_s: float
+    total_frames: Optional[int] = None
+    processed_frames: int
+    faces_found: int
+    matches: int
+    frames_per_sec: Optional[float] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
     class Config: from_attributes = True
 
 # ── Dashboard Stats ───────────────────────────
@@ -72,9 +118,69 @@ class DashboardStats(BaseModel):
     alerts_dispatched: int
     daily_new_records: int
 
+# ── Live Frames ───────────────────────────────
+class FrameSpec(BaseModel):
+    max_side: int                  # downscale so the longer side is at most this
+    mime_types: list[str]          # preferred first
+    quality: float                 # canvas.toBlob quality for lossy types
+    max_bytes: int
+    max_pixels: int
+
+# ── Camera Gating ─────────────────────────────
+class CameraStats(BaseModel):
+    camera_id: str
+    frames: int
+    skipped: int
+    roi_frames: int
+    skip_rate: float
+    avg_full_frame_ms: float
+    detect_ms: float
+    cpu_saved_ms: float
+
+class RollupBucket(BaseModel):
+    key: str              # geohash cell, ISO hour/day, camera id or status, per group_by
+    detections: int
+    hits: int
+    latitude: Optional[float] = None   # cell centre, when grouped by cell
+    longitude: Optional[float] = None
+
+# ── Edge gallery sync ─────────────────────────
+class GalleryDelta(BaseModel):
+    version: int
+    reset: bool
+    upserts: list[dict]   # person records, encoding as base64 little-endian float32
+    removed: list[str]
+
 # ── System Health ─────────────────────────────
 class SystemHealth(BaseModel):
     db_connected: bool
     storage_connected: bool
     api_latency_ms: float
     storage_used_pct: int
+    embedding_cache: Optional[dict] = None
+    resources: Optional[dict] = None
+    gallery: Optional[dict] = None
+    frames: Optional[dict] = None
+    face_quality: Optional[dict] = None
+    detection_writer: Optional[dict] = None
+    uploads: Optional[dict] = None
+    startup: Optional[dict] = None
+
+# ── Admin ─────────────────────────────────────
+class ProfileOut(BaseModel):
+    id: str
+    endpoint: str
+    created_at: datetime
+    duration_ms: int
+
+class DuplicateClusterOut(BaseModel):
+    id: str
+    status: str
+    max_distance: float
+    merged_into_id: Optional[str] = None
+    created_at: datetime
+    resolved_at: Optional[datetime] = None
+    members: list[PersonOut] = []
+
+class MergeRequest(BaseModel):
+    keep_id: str
@@ -0,0 +1,400 @@
+import os
+import json
+import time
+import uuid
+import zlib
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+from matching import EMBEDDING_DIM, _CHUNK_ROWS, MatchFilter, person_attrs, match_with_fallback
+from config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Region shards group people by a coarse lat/lon cell (degrees)
+_REGION_CELL_DEG = 5.0
+
+# Shard files are [n, EMBEDDING_DIM + 1] float32: the vectors with their squared norms as the last column
+_FORMAT = 2
+# Unreferenced files younger than this may belong to a save still in progress in another worker
+_PRUNE_GRACE_SECONDS = 600
+
+
+def shard_of(person, n_shards: int, shard_by: str) -> int:
+    """Stable shard for a registry row under GALLERY_SHARD_BY."""
+    if n_shards <= 1:
+        return 0
+    if shard_by == "priority":
+        # High-priority cases get a shard (and a matcher process) of their own
+        if person.priority == "high":
+            return 0
+        return 1 + zlib.crc32(person.id.encode()) % (n_shards - 1)
+    if shard_by == "region" and person.latitude is not None and person.longitude is not None:
+        cell = f"{int(person.latitude // _REGION_CELL_DEG)}:{int(person.longitude // _REGION_CELL_DEG)}"
+        return zlib.crc32(cell.encode()) % n_shards
+    return zlib.crc32(person.id.encode()) % n_shards
+
+
+# ── Matcher process side ──────────────────────
+# Each matcher process keeps its shard memory-mapped; a new version of the
+# shard is a new file, so a changed path is all it takes to pick it up.
+_mapped: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+
+
+def _open_shard(path: str) -> tuple[np.ndarray, np.ndarray]:
+    m = _mapped.get(path)
+    if m is None:
+        if len(_mapped) >= 4:
+            _mapped.clear()
+        arr = np.load(path, mmap_mode="r")
+        m = _mapped[path] = (arr[:, :EMBEDDING_DIM], arr[:, EMBEDDING_DIM])
+    return m
+
+
+def _search_shard(path: str, queries: np.ndarray, k: int, rows: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """Top-k local rows and exact L2 distances per query, nearest first: two [m, k'] arrays. `rows` limits the candidates."""
+    vectors, norms = _open_shard(path)
+    if rows is not None:
+        # Pre-filtered candidates: gather just those rows, then score them like a whole shard
+        local, d = _top_k(np.asarray(vectors[rows]), np.asarray(norms[rows]), queries, k)
+        return rows[local], d
+    return _top_k(vectors, norms, queries, k)
+
+
+def _top_k(vectors, norms, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    n = len(vectors)
+    k = min(k, n)
+    if k == 0:
+        return np.empty((len(queries), 0), dtype=np.int64), np.empty((len(queries), 0), dtype=np.float32)
+    # ||x||² - 2·x·q over the rows in chunks, keeping a running top-k per query, so temporaries stay [m, _CHUNK_ROWS]
+    best_rows = np.empty((len(queries), 0), dtype=np.int64)
+    best_d = np.empty((len(queries), 0), dtype=np.float32)
+    for s in range(0, n, _CHUNK_ROWS):
+        d = norms[s:s + _CHUNK_ROWS][None, :] - 2.0 * (queries @ np.asarray(vectors[s:s + _CHUNK_ROWS]).T)
+        rows = np.broadcast_to(np.arange(s, s + d.shape[1]), d.shape)
+        d = np.concatenate([best_d, d], axis=1)
+        rows = np.concatenate([best_rows, rows], axis=1)
+        if d.shape[1] > k:
+            keep = np.argpartition(d, k - 1, axis=1)[:, :k]
+            d = np.take_along_axis(d, keep, axis=1)
+            rows = np.take_along_axis(rows, keep, axis=1)
+        best_d, best_rows = d, rows
+    # Re-score the survivors exactly; the expansion above loses precision near zero
+    exact = np.linalg.norm(np.asarray(vectors[best_rows.ravel()]).reshape(*best_rows.shape, -1) - queries[:, None, :], axis=2)
+    order = np.argsort(exact, axis=1)
+    return np.take_along_axis(best_rows, order, axis=1), np.take_along_axis(exact, order, axis=1)
+
+
+def _warm_shard(path: str) -> int:
+    return len(_open_shard(path)[0])
+
+
+# ── API worker side ───────────────────────────
+class ShardPool:
+    """One single-process executor per shard, so each shard stays resident in exactly one matcher."""
+
+    def __init__(self, n_shards: int):
+        self._ctx = multiprocessing.get_context("spawn")
+        self.executors = [self._new() for _ in range(n_shards)]
+
+    def _new(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=1, mp_context=self._ctx)
+
+    def submit(self, shard: int, fn, *args):
+        try:
+            return self.executors[shard].submit(fn, *args)
+        except BrokenProcessPool:
+            logger.warning(f"Shards: matcher for shard {shard} died, restarting it")
+            self.executors[shard] = self._new()
+            return self.executors[shard].submit(fn, *args)
+
+    def shutdown(self):
+        for ex in self.executors:
+            ex.shutdown(wait=False, cancel_futures=True)
+
+
+_pool: ShardPool | None = None
+
+
+def get_pool(n_shards: int) -> ShardPool:
+    global _pool
+    if _pool is None or len(_pool.executors) != n_shards:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool = ShardPool(n_shards)
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+
+
+class ShardedGallery:
+    """
+    Gallery split into GALLERY_SHARDS memory-mapped shard files, each searched
+    by its own matcher process. Queries are scattered to every shard and the
+    per-shard top-k merged; shards that miss GALLERY_SHARD_DEADLINE_MS are
+    left out of that answer rather than holding it up.
+
+    Only ids/names/case_ids live in the API worker, so global row numbers work
+    exactly as with Gallery. Files are written per version and never modified
+    in place, which is what lets a restarted worker map them straight back in.
+    Every save writes files named for that writer (pid + random suffix) and a
+    metadata file listing them, so workers sharing GALLERY_SHARD_DIR, whose row
+    orders differ, never read each other's vectors against their own ids.
+    """
+
+    def __init__(self, ids, names, case_ids, shard_by: str, shard_rows: list[np.ndarray],
+                 files: list[str | None], version: int = 0, pending: dict | None = None, attrs: dict | None = None):
+        self.ids = list(ids)
+        self.names = list(names)
+        self.case_ids = list(case_ids)
+        self.attrs = attrs                    # filter attributes per global row (see matching.person_attrs)
+        self.shard_by = shard_by
+        self.shard_rows = shard_rows          # per shard: local row -> global row
+        self.files = files                    # per shard: .npy path (None if empty)
+        self.version = version
+        self._pending = pending or {}         # shard -> vectors not yet written by save()
+        self._rows = {pid: i for i, pid in enumerate(self.ids)}
+        self.timeouts = 0
+
+    # ── Build / persist ──
+    @classmethod
+    def from_persons(cls, persons, n_shards: int | None = None, shard_by: str | None = None) -> "ShardedGallery":
+        n_shards = n_shards or settings.GALLERY_SHARDS
+        shard_by = shard_by or settings.GALLERY_SHARD_BY
+        buckets = [[] for _ in range(n_shards)]
+        for p in persons:
+            if p.encoding is not None:
+                buckets[shard_of(p, n_shards, shard_by)].append(p)
+        return cls._from_buckets(buckets, shard_by)
+
+    @classmethod
+    def _from_buckets(cls, buckets, shard_by) -> "ShardedGallery":
+        # Global rows run shard by shard, so each shard's rows are one contiguous range
+        ids, names, case_ids, shard_rows, pending = [], [], [], [], {}
+        for s, members in enumerate(buckets):
+            shard_rows.append(np.arange(len(ids), len(ids) + len(members), dtype=np.int64))
+            ids += [p.id for p in members]
+            names += [p.name for p in members]
+            case_ids += [p.case_id for p in members]
+            pending[s] = np.array([np.asarray(p.encoding, dtype=np.float32) for p in members], dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+        attrs = person_attrs([p for members in buckets for p in members])
+        return cls(ids, names, case_ids, shard_by, shard_rows, [None] * len(buckets), pending=pending, attrs=attrs)
+
+    @staticmethod
+    def _meta_path(version: int, writer: str) -> str:
+        return os.path.join(settings.GALLERY_SHARD_DIR, f"gallery.{version}.{writer}.json")
+
+    @staticmethod
+    def _metas() -> list[tuple[int, str]]:
+        """(version, path) of every metadata file in the shard dir."""
+        root = settings.GALLERY_SHARD_DIR
+        out = []
+        for f in os.listdir(root) if os.path.isdir(root) else ():
+            parts = f.split(".")
+            if len(parts) == 4 and parts[0] == "gallery" and parts[1].isdigit() and parts[3] == "json":
+                out.append((int(parts[1]), os.path.join(root, f)))
+        return out
+
+    @classmethod
+    def load(cls, version: int) -> "ShardedGallery | None":
+        """A shard set saved for this gallery version, if any; vectors stay on disk."""
+        for v, path in sorted(cls._metas(), key=lambda m: os.path.getmtime(m[1]), reverse=True):
+            if v != version:
+                continue
+            try:
+                with open(path) as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if meta.get("format") != _FORMAT or meta["n_shards"] != settings.GALLERY_SHARDS \
+                    or meta["shard_by"] != settings.GALLERY_SHARD_BY:
+                continue
+            if not all(fp is None or os.path.exists(fp) for fp in meta["files"]):
+                continue
+            shard_rows = [np.asarray(r, dtype=np.int64) for r in meta["shard_rows"]]
+            dtypes = {"high": bool, "lat": np.float32, "lon": np.float32, "registered": np.float64}
+            attrs = {key: np.asarray(col, dtype=dtypes[key]) for key, col in meta["attrs"].items()}
+            return cls(meta["ids"], meta["names"], meta["case_ids"], meta["shard_by"], shard_rows, meta["files"], version, attrs=attrs)
+        return None
+
+    def save(self, version: int):
+        """Write shards changed since the last save, then the metadata naming every shard's file."""
+        os.makedirs(settings.GALLERY_SHARD_DIR, exist_ok=True)
+        writer = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        for s, vectors in self._pending.items():
+            if len(vectors) == 0:
+                self.files[s] = None
+                continue
+            path = os.path.join(settings.GALLERY_SHARD_DIR, f"shard_{s}.{version}.{writer}.npy")
+            norms = np.einsum("ij,ij->i", vectors, vectors).astype(np.float32)
+            # Vectors and norms in one file, so they can't come from different writers
+            tmp = f"{path}.tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, np.hstack([vectors, norms[:, None]]))
+            os.replace(tmp, path)
+            self.files[s] = path
+        self._pending = {}
+        self.version = version
+
+        meta = {
+            "format": _FORMAT, "version": version, "n_shards": len(self.files), "shard_by": self.shard_by,
+            "ids": self.ids, "names": self.names, "case_ids": self.case_ids,
+            "shard_rows": [r.tolist() for r in self.shard_rows], "files": self.files,
+            "attrs": {key: col.tolist() for key, col in self.attrs.items()},
+        }
+        path = self._meta_path(version, writer)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(f"{path}.tmp", path)
+        self._prune()
+        self.warm()
+
+    def _prune(self, keep_versions: int = 2):
+        """
+        Drop metadata older than the newest `keep_versions` versions (and the grace
+        period), then shard files no remaining metadata references. Files of this
+        gallery are always kept, whatever its version.
+        """
+        root = settings.GALLERY_SHARD_DIR
+        now = time.time()
+        metas = self._metas()
+        newest = sorted({v for v, _ in metas}, reverse=True)[:keep_versions]
+        live = {fp for fp in self.files if fp}
+        for v, path in metas:
+            try:
+                if v not in newest and now - os.path.getmtime(path) > _PRUNE_GRACE_SECONDS:
+                    os.remove(path)
+                    continue
+                with open(path) as f:
+                    live.update(fp for fp in json.load(f)["files"] if fp)
+            except (OSError, ValueError):
+                continue
+        for f in os.listdir(root):
+            path = os.path.join(root, f)
+            if not f.startswith("shard_") or path in live:
+                continue
+            try:
+                if now - os.path.getmtime(path) > _PRUNE_GRACE_SECONDS:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def warm(self):
+        """Have every matcher start and map its current shard now rather than on the first query."""
+        pool = get_pool(len(self.files))
+        futures = [pool.submit(s, _warm_shard, fp) for s, fp in enumerate(self.files) if fp]
+        wait(futures)
+
+    # ── Gallery interface ──
+    def __len__(self):
+        return len(self.ids)
+
+    def row_of(self, person_id: str) -> int | None:
+        return self._rows.get(person_id)
+
+    def _shard_of_row(self, row: int) -> int:
+        return next(s for s, rows in enumerate(self.shard_rows) if len(rows) and rows[0] <= row <= rows[-1])
+
+    def apply(self, upserts=(), removed=()) -> "ShardedGallery":
+        """Copy with these persons added/overwritten and `removed` dropped; only touched shards are rewritten on save()."""
+        upserts = [p for p in upserts if p.encoding is not None]
+        n_shards = len(self.files)
+        drop_rows = {self.row_of(pid) for pid in set(removed) | {p.id for p in upserts}} - {None}
+        touched = {shard_of(p, n_shards, self.shard_by) for p in upserts} | {self._shard_of_row(r) for r in drop_rows}
+        added = {s: [p for p in upserts if shard_of(p, n_shards, self.shard_by) == s] for s in touched}
+
+        ids, names, case_ids, shard_rows, pending, attr_parts = [], [], [], [], {}, []
+        for s, rows in enumerate(self.shard_rows):
+            lo, hi = (int(rows[0]), int(rows[-1]) + 1) if len(rows) else (0, 0)
+            start = len(ids)
+            if s not in touched:
+                ids += self.ids[lo:hi]
+                names += self.names[lo:hi]
+                case_ids += self.case_ids[lo:hi]
+                attr_parts.append({key: col[lo:hi] for key, col in self.attrs.items()})
+            else:
+                keep = [r for r in range(lo, hi) if r not in drop_rows]
+                ids += [self.ids[r] for r in keep] + [p.id for p in added[s]]
+                names += [self.names[r] for r in keep] + [p.name for p in added[s]]
+                case_ids += [self.case_ids[r] for r in keep] + [p.case_id for p in added[s]]
+                old = np.load(self.files[s], mmap_mode="r")[:, :EMBEDDING_DIM] if self.files[s] else np.empty((0, EMBEDDING_DIM), np.float32)
+                new = np.array([np.asarray(p.encoding, dtype=np.float32) for p in added[s]], dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+                pending[s] = np.vstack([np.asarray(old[[r - lo for r in keep]]), new])
+                attr_parts.append({key: col[keep] for key, col in self.attrs.items()})
+                attr_parts.append(person_attrs(added[s]))
+            shard_rows.append(np.arange(start, len(ids), dtype=np.int64))
+        files = [None if s in touched else fp for s, fp in enumerate(self.files)]
+        attrs = {key: np.concatenate([part[key] for part in attr_parts]) for key in self.attrs}
+        out = ShardedGallery(ids, names, case_ids, self.shard_by, shard_rows, files, self.version, pending, attrs)
+        out.timeouts = self.timeouts
+        return out
+
+    def nbytes(self) -> dict:
+        return {"shard_files": sum(os.path.getsize(fp) for fp in self.files if fp)}
+
+    def search_many(self, encodings, k: int = 1, mask: np.ndarray | None = None) -> list[list[tuple[int, float]]]:
+        """
+        Scatter every query to every shard, gather what arrives by the deadline,
+        merge top-k per query. With a `mask` only shards holding candidates are
+        asked, and only for those rows.
+        """
+        queries = np.asarray(encodings, dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+        if len(self) == 0 or len(queries) == 0:
+            return [[] for _ in range(len(queries))]
+        pool = get_pool(len(self.files))
+        futures = {}
+        for s, fp in enumerate(self.files):
+            if not fp:
+                continue
+            rows = None
+            if mask is not None:
+                rows = np.flatnonzero(mask[self.shard_rows[s]])
+                if len(rows) == 0:
+                    continue
+                if len(rows) == len(self.shard_rows[s]):
+                    rows = None
+            futures[pool.submit(s, _search_shard, fp, queries, k, rows)] = s
+        done, late = wait(futures, timeout=settings.GALLERY_SHARD_DEADLINE_MS / 1000)
+        if late:
+            self.timeouts += len(late)
+            logger.warning(f"Shards: {len(late)}/{len(futures)} shards missed the {settings.GALLERY_SHARD_DEADLINE_MS}ms deadline")
+            for f in late:
+                f.cancel()
+
+        merged = [[] for _ in range(len(queries))]
+        for f in done:
+            s = futures[f]
+            try:
+                rows, dists = f.result()
+            except Exception as e:
+                logger.error(f"Shards: shard {s} search failed: {e}")
+                continue
+            to_global = self.shard_rows[s]
+            for q in range(len(queries)):
+                merged[q].extend((int(to_global[r]), float(d)) for r, d in zip(rows[q], dists[q]))
+        return [sorted(hits, key=lambda t: t[1])[:k] for hits in merged]
+
+    def search(self, encoding, k: int = 1, mask: np.ndarray | None = None) -> list[tuple[int, float]]:
+        return self.search_many([encoding], k, mask)[0]
+
+    def best_matches(self, encodings, flt: MatchFilter | None = None) -> list[tuple[int | None, float]]:
+        return match_with_fallback(self, encodings, flt)
+
+    def best_match(self, encoding, flt: MatchFilter | None = None) -> tuple[int | None, float]:
+        return match_with_fallback(self, [encoding], flt)[0]
+
+    def stats(self) -> dict:
+        return {
+            "shards": len(self.files),
+            "shard_by": self.shard_by,
+            "shard_sizes": [len(r) for r in self.shard_rows],
+            "deadline_misses": self.timeouts,
+        }
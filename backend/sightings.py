@@ -0,0 +1,112 @@
+import random
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+from sqlalchemy import select, text
+from models import Detection, DetectionHit
+from detection_writer import detection_writer
+from config import get_settings
+
+settings = get_settings()
+
+
+async def _lock_key(db, person_id: str, camera_id: str):
+    # Serialise concurrent hits for one (person, camera) so they can't both open a sighting
+    await db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:k))"), {"k": f"sighting:{person_id}:{camera_id}"})
+
+
+async def record_sighting(
+    db,
+    person_id: str,
+    person_name: str,
+    case_id: str | None,
+    camera_id: str,
+    confidence: float,
+    snapshot: Callable[[], Awaitable[str | None]],
+    timestamp: datetime | None = None,
+    **fields,
+) -> tuple[Detection, bool, dict | None]:
+    """
+    Fold one match into the open sighting of this person on this camera, or open a new one.
+
+    A sighting stays open while it is pending review and hits keep arriving within
+    SIGHTING_WINDOW_SECONDS of it. Each hit bumps hit_count and the first/last-seen
+    range; the snapshot (uploaded lazily through `snapshot`) and face fields are only
+    replaced when the hit beats the sighting's best confidence. Returns the row,
+    whether its snapshot changed, and the sampled hit left for the write-behind
+    buffer (None otherwise). The caller commits, then passes the hit to buffer_hits.
+    """
+    timestamp = timestamp or datetime.utcnow()
+    window = timedelta(seconds=settings.SIGHTING_WINDOW_SECONDS)
+    det = None
+    if settings.SIGHTING_AGGREGATION_ENABLED:
+        await _lock_key(db, person_id, camera_id)
+        result = await db.execute(
+            select(Detection)
+            .where(
+                Detection.person_id == person_id,
+                Detection.camera_id == camera_id,
+                Detection.status == "pending",
+                Detection.last_seen >= timestamp - window,
+                Detection.timestamp <= timestamp + window,
+            )
+            .order_by(Detection.last_seen.desc())
+            .limit(1)
+        )
+        det = result.scalar_one_or_none()
+
+    if det is None:
+        det = Detection(
+            person_id=person_id,
+            person_name=person_name,
+            case_id=case_id,
+            camera_id=camera_id,
+            timestamp=timestamp,
+            last_seen=timestamp,
+            hit_count=1,
+            confidence=confidence,
+            snapshot_url=await snapshot(),
+            status="pending",
+            sms_sent=False,
+            **fields,
+        )
+        db.add(det)
+        await db.flush()
+        snapshot_changed = det.snapshot_url is not None
+    else:
+        det.hit_count += 1
+        det.timestamp = min(det.timestamp, timestamp)
+        det.last_seen = max(det.last_seen, timestamp)
+        snapshot_changed = False
+        if confidence > (det.confidence or 0.0):
+            url = await snapshot()
+            det.confidence = confidence
+            for key, value in fields.items():
+                setattr(det, key, value)
+            if url:
+                det.snapshot_url = url
+                det.thumb_url = det.medium_url = det.face_url = None
+                snapshot_changed = True
+
+    if det.hit_count == 1 or random.random() < settings.SIGHTING_HIT_SAMPLE_RATE:
+        hit = dict(
+            detection_id=det.id,
+            timestamp=timestamp,
+            confidence=confidence,
+            quality=fields.get("quality"),
+            latitude=fields.get("latitude"),
+            longitude=fields.get("longitude"),
+            source=fields.get("source"),
+            frame_offset=fields.get("frame_offset"),
+        )
+        if settings.DETECTION_WRITE_BEHIND:
+            # Buffered by the caller only once its commit has made the sighting visible
+            return det, snapshot_changed, hit
+        db.add(DetectionHit(**hit))
+    return det, snapshot_changed, None
+
+
+def buffer_hits(hits: list[dict | None]):
+    """Queue the sampled hits record_sighting returned; call after the sightings' transaction has committed."""
+    for hit in hits:
+        if hit:
+            detection_writer.add(DetectionHit, **hit)
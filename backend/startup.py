@@ -0,0 +1,28 @@
+import time
+import logging
+from contextlib import contextmanager
+
+# uvicorn configures this logger, so the breakdown shows up next to "Application startup complete"
+logger = logging.getLogger("uvicorn.error")
+
+# Per-worker startup breakdown in ms, in phase order, for the log and /dashboard/health.
+# "ready" is the total from main's first import; background phases overlap it and come after
+startup_phases: dict[str, float] = {}
+
+
+@contextmanager
+def phase(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, t0)
+
+
+def record(name: str, t0: float):
+    """Time from perf_counter() value `t0` until now, as phase `name`."""
+    startup_phases[name] = round((time.perf_counter() - t0) * 1000, 1)
+
+
+def log_phases(prefix: str = "Startup"):
+    logger.info("%s: %s", prefix, ", ".join(f"{k} {v:.0f} ms" for k, v in startup_phases.items()))
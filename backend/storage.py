@@ -1,6 +1,10 @@
-import io
+import os
+import re
 import uuid
+import shutil
 from datetime import datetime
+from starlette.staticfiles import StaticFiles
+from uploads import BufferReader
 from config import get_settings
 
 settings = get_settings()
@@ -34,7 +38,8 @@ async def upload_photo(file_bytes: bytes, filename: str, content_type: str = "im
     container = _get_container()
     container.upload_blob(
         name=blob_name,
-        data=io.BytesIO(file_bytes),
+        data=BufferReader(file_bytes),
+        length=len(file_bytes),
         overwrite=True,
         content_settings=ContentSettings(content_type=content_type),
     )
@@ -59,7 +64,8 @@ async def upload_snapshot(file_bytes: bytes, case_id: str) -> str:
     container = _get_container()
     container.upload_blob(
         name=filename,
-        data=io.BytesIO(file_bytes),
+        data=BufferReader(file_bytes),
+        length=len(file_bytes),
         overwrite=True,
         content_settings=ContentSettings(content_type="image/jpeg"),
     )
@@ -67,13 +73,107 @@ async def upload_snapshot(file_bytes: bytes, case_id: str) -> str:
     return f"https://{account_name}.blob.core.windows.net/{settings.AZURE_CONTAINER_NAME}/{filename}"
 
 
+# Derivative names carry a digest of the original's bytes, so a URL never changes content
+DERIVATIVE_RE = re.compile(r"\.(thumb|medium|face)\.[0-9a-f]{12}\.jpg$")
+
+
+def _blob_name(url: str) -> str:
+    blob_name = "/".join(url.split("/")[4:])  # strip account/container
+    return blob_name.replace(f"{settings.AZURE_CONTAINER_NAME}/", "", 1)
+
+
+async def upload_derivative(original_url: str, kind: str, digest: str, file_bytes: bytes) -> str:
+    """Store a derivative JPEG next to the original (`<stem>.<kind>.<digest>.jpg`) and return its URL."""
+    stem = original_url.rsplit(".", 1)[0] if "." in original_url.rsplit("/", 1)[-1] else original_url
+    url = f"{stem}.{kind}.{digest}.jpg"
+
+    if not url.startswith("https://"):
+        local_path = "." + url
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        with open(local_path, "wb") as f:
+            f.write(file_bytes)
+        return url
+
+    _get_container().upload_blob(
+        name=_blob_name(url),
+        data=BufferReader(file_bytes),
+        length=len(file_bytes),
+        overwrite=True,
+        content_settings=ContentSettings(
+            content_type="image/jpeg",
+            cache_control=f"public, max-age={settings.MEDIA_CACHE_MAX_AGE}, immutable",
+        ),
+    )
+    return url
+
+
 def delete_blob(url: str):
     """Delete a blob by URL."""
     if not AZURE_AVAILABLE or not url.startswith("https://"):
         return
     try:
-        blob_name = "/".join(url.split("/")[4:])  # strip account/container
-        blob_name = blob_name.replace(f"{settings.AZURE_CONTAINER_NAME}/", "", 1)
-        _get_container().delete_blob(blob_name)
+        _get_container().delete_blob(_blob_name(url))
+    except Exception:
+        pass
+
+
+async def read_media(url: str) -> bytes | None:
+    """Bytes of an uploaded photo or snapshot, local or on Azure; None if it is gone."""
+    try:
+        if url.startswith("https://"):
+            return _get_container().download_blob(_blob_name(url)).readall()
+        with open("." + url, "rb") as f:
+            return f.read()
     except Exception:
+        return None
+
+
+def remove_media(url: str):
+    """Delete an uploaded file, local or on Azure."""
+    if url.startswith("https://"):
+        delete_blob(url)
+        return
+    try:
+        os.remove("." + url)
+    except OSError:
         pass
+
+
+async def put_archive(name: str, fileobj) -> str:
+    """Store an archive file under `archive/` (Azure) or DETECTION_ARCHIVE_DIR and return where it went."""
+    fileobj.seek(0)
+    if not AZURE_AVAILABLE:
+        path = os.path.join(settings.DETECTION_ARCHIVE_DIR, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            shutil.copyfileobj(fileobj, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        return path
+
+    blob_name = f"archive/{name}"
+    _get_container().upload_blob(name=blob_name, data=fileobj, overwrite=True)
+    return f"https://{_client.account_name}.blob.core.windows.net/{settings.AZURE_CONTAINER_NAME}/{blob_name}"
+
+
+def get_archive(location: str) -> bytes:
+    if location.startswith("https://"):
+        return _get_container().download_blob(_blob_name(location)).readall()
+    with open(location, "rb") as f:
+        return f.read()
+
+
+class CachedStaticFiles(StaticFiles):
+    """
+    /uploads with cache headers: content-addressed derivatives are immutable,
+    originals (which can be overwritten) revalidate via the ETag StaticFiles sends.
+    """
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if DERIVATIVE_RE.search(str(full_path)):
+            response.headers["Cache-Control"] = f"public, max-age={settings.MEDIA_CACHE_MAX_AGE}, immutable"
+        else:
+            response.headers["Cache-Control"] = "no-cache"
+        return response
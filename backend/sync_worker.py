@@ -0,0 +1,36 @@
+import os
+import sys
+import asyncio
+import argparse
+import logging
+
+# Add backend directory to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from resources import apply_thread_env
+apply_thread_env()
+
+from config import get_settings
+from tasks import fetch_external_databases, sync_external_feed
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental external registry sync, run outside the API process.")
+    parser.add_argument("--once", action="store_true", help="sync once and exit instead of polling")
+    parser.add_argument("--feed-url", default=None, help="overrides EXTERNAL_FEED_URL")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    settings = get_settings()
+    if args.feed_url:
+        settings.EXTERNAL_FEED_URL = args.feed_url
+    if not settings.EXTERNAL_FEED_URL:
+        print("EXTERNAL_FEED_URL is not set; nothing to sync.")
+        return
+
+    if args.once:
+        print(asyncio.run(sync_external_feed(settings.EXTERNAL_FEED_URL)))
+    else:
+        asyncio.run(fetch_external_databases())
+
+if __name__ == "__main__":
+    main()
@@ -1,58 +1,175 @@
 import asyncio
 import logging
-from sqlalchemy import select
-from database import AsyncSessionLocal
-from models import MissingPerson
+import time
 import uuid
-import random
+from datetime import datetime
+import httpx
+from sqlalchemy import select, update, literal_column
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from database import AsyncSessionLocal
+from models import MissingPerson, SyncState
+from matching import historical_sightings
+from storage import upload_photo
+from derivatives import store_derivatives
+from resources import run_inference
+from config import get_settings
+
+try:
+    from face_utils import get_face_encoding
+    FR_AVAILABLE = True
+except ImportError as e:
+    print(f"Face extraction unavailable: {e}")
+    FR_AVAILABLE = False
 
+settings = get_settings()
 logger = logging.getLogger(__name__)
 
+async def _fetch_photo(client: httpx.AsyncClient, sem: asyncio.Semaphore, person_id: str, case_id: str, url: str) -> dict | None:
+    """Download one feed photo, store it and embed it. Concurrency is capped by `sem`."""
+    async with sem:
+        try:
+            resp = await client.get(url)
+            resp.raise_for_status()
+            image_bytes = resp.content
+        except httpx.HTTPError as e:
+            logger.warning(f"External DB Sync: photo for {case_id} failed: {e}")
+            return None
+    ext = url.rsplit(".", 1)[-1].lower() if "." in url.rsplit("/", 1)[-1] else "jpg"
+    photo_url = await upload_photo(image_bytes, f"{case_id}.{ext}", resp.headers.get("content-type", "image/jpeg"))
+    encoding = await run_inference(get_face_encoding, image_bytes) if FR_AVAILABLE else None
+    derived = await store_derivatives(photo_url, image_bytes)
+    # Bulk UPDATE bypasses the ORM validator, so set the halfvec copy explicitly
+    return {"id": person_id, "photo_url": photo_url, "encoding": encoding, "encoding_half": encoding, **derived}
+
+async def _upsert_records(db, records: list[dict]) -> list[tuple]:
+    """One INSERT ... ON CONFLICT (case_id) DO UPDATE for the whole page; returns (id, case_id, inserted, needs_photo)."""
+    # A row can only be updated once per statement, so a case repeated within the page keeps its last version
+    records = list({r["case_id"]: r for r in records}.values())
+    rows = [{
+        "id": str(uuid.uuid4()),
+        "case_id": r["case_id"],
+        "name": r["name"],
+        "age": r.get("age"),
+        "contact": r.get("contact") or "external_api@example.com",
+        "priority": r.get("priority") or "normal",
+        "latitude": r.get("latitude"),
+        "longitude": r.get("longitude"),
+        "registered_at": datetime.utcnow(),
+    } for r in records]
+    stmt = pg_insert(MissingPerson).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[MissingPerson.case_id],
+        set_={c: stmt.excluded[c] for c in ("name", "age", "contact", "priority", "latitude", "longitude")},
+    ).returning(
+        MissingPerson.id,
+        MissingPerson.case_id,
+        literal_column("(xmax = 0)").label("inserted"),
+        MissingPerson.encoding.is_(None).label("needs_photo"),
+    )
+    return (await db.execute(stmt)).all()
+
+async def sync_external_feed(feed_url: str, feed: str = "default") -> dict:
+    """
+    Pull everything the feed has changed since the stored cursor, page by page.
+    The feed answers GET ?cursor=&limit= with {"records", "next_cursor", "has_more"}
+    and honours If-None-Match (see fake_feed_server.py).
+    Each page is upserted in bulk and its photos downloaded and embedded with
+    bounded concurrency; the cursor is saved after every page so a crash resumes.
+    """
+    stats = {"pages": 0, "fetched": 0, "inserted": 0, "updated": 0, "photos": 0, "photo_failures": 0}
+    t0 = time.monotonic()
+    sem = asyncio.Semaphore(settings.SYNC_DOWNLOAD_CONCURRENCY)
+
+    async with AsyncSessionLocal() as db, httpx.AsyncClient(timeout=30) as client:
+        state = await db.get(SyncState, feed)
+        if state is None:
+            state = SyncState(feed=feed)
+            db.add(state)
+
+        while True:
+            headers = {"If-None-Match": state.etag} if state.etag else {}
+            params = {"limit": settings.SYNC_PAGE_SIZE}
+            if state.cursor:
+                params["cursor"] = state.cursor
+            resp = await client.get(feed_url, params=params, headers=headers)
+            if resp.status_code == 304:
+                break
+            resp.raise_for_status()
+            body = resp.json()
+            records = [r for r in body.get("records", []) if r.get("case_id") and r.get("name")]
+            stats["pages"] += 1
+            stats["fetched"] += len(records)
+
+            if records:
+                upserted = await _upsert_records(db, records)
+                stats["inserted"] += sum(1 for r in upserted if r.inserted)
+                stats["updated"] += sum(1 for r in upserted if not r.inserted)
+
+                photo_urls = {r["case_id"]: r.get("photo_url") for r in records}
+                jobs = [
+                    _fetch_photo(client, sem, r.id, r.case_id, photo_urls[r.case_id])
+                    for r in upserted if r.needs_photo and photo_urls.get(r.case_id)
+                ]
+                photos = [p for p in await asyncio.gather(*jobs) if p]
+                stats["photos"] += len(photos)
+                stats["photo_failures"] += len(jobs) - len(photos)
+                if photos:
+                    await db.execute(update(MissingPerson), photos)
+
+            if body.get("next_cursor"):
+                state.cursor = body["next_cursor"]
+            has_more = bool(body.get("has_more")) and bool(records)
+            # The ETag answers "anything after this cursor?", so it's only worth keeping once caught up
+            state.etag = None if has_more else resp.headers.get("etag")
+            state.last_synced_at = datetime.utcnow()
+            await db.commit()
+            if not has_more:
+                break
+
+        stats["duration_s"] = round(time.monotonic() - t0, 2)
+        state.last_stats = stats
+        await db.commit()
+
+    logger.info(f"External DB Sync: {stats}")
+    return stats
+
 async def fetch_external_databases():
     """
-    Simulated background task that runs periodically to fetch data from
-    external humanitarian databases like Google Person Finder or Interpol RSS.
+    Periodic incremental sync with the external humanitarian feed
+    (EXTERNAL_FEED_URL). Runs in its own process via sync_worker.py,
+    not inside the API workers.
     """
     logger.info("External DB Sync: Worker started.")
     
     while True:
         try:
-            logger.info("External DB Sync: Fetching new humanitarian records...")
-            # Simulate network request delay
-            await asyncio.sleep(5)
-            
-            # Simulated dummy data from an external API
-            mock_external_data = [
-                {
-                    "case_id": f"EXT-{random.randint(10000, 99999)}",
-                    "name": "Jane Doe (External Database Match)",
-                    "age": "20-30",
-                    "priority": "high",
-                    "latitude": 34.0522 + random.uniform(-1, 1),
-                    "longitude": -118.2437 + random.uniform(-1, 1)
-                }
-            ]
-            
-            async with AsyncSessionLocal() as db:
-                for ext in mock_external_data:
-                    # Check if already exists
-                    result = await db.execute(select(MissingPerson).where(MissingPerson.case_id == ext["case_id"]))
-                    if not result.scalar_one_or_none():
-                        new_person = MissingPerson(
-                            case_id=ext["case_id"],
-                            name=ext["name"],
-                            age=ext["age"],
-                            priority=ext["priority"],
-                            latitude=ext["latitude"],
-                            longitude=ext["longitude"],
-                            contact="external_api@example.com"
-                        )
-                        db.add(new_person)
-                        logger.info(f"External DB Sync: Imported new record {ext['case_id']}")
-                await db.commit()
-                
+            await sync_external_feed(settings.EXTERNAL_FEED_URL)
         except Exception as e:
             logger.error(f"External DB Sync Error: {e}")
             
-        # Run every 24 hours (for demonstration, we use 1 hour)
-        await asyncio.sleep(3600)
+        await asyncio.sleep(settings.SYNC_INTERVAL_SECONDS)
+
+async def reverse_search_person(person_id: str):
+    """
+    Run a newly registered person against stored detection embeddings and
+    attach unclaimed historical sightings to them for review.
+    """
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(MissingPerson).where(MissingPerson.id == person_id))
+        person = result.scalar_one_or_none()
+        if not person or person.encoding is None:
+            return
+
+        claimed = 0
+        for det, dist in await historical_sightings(db, person.encoding):
+            if det.person_id is not None:
+                continue
+            det.person_id = person.id
+            det.person_name = person.name
+            det.case_id = person.case_id
+            det.confidence = max(0.0, 1.0 - dist)
+            det.status = "pending"
+            claimed += 1
+        await db.commit()
+        if claimed:
+            logger.info(f"Reverse search: {claimed} past sightings linked to {person.case_id}")
@@ -0,0 +1,117 @@
+import io
+import mmap
+from tempfile import SpooledTemporaryFile
+from fastapi import HTTPException, UploadFile
+from starlette.formparsers import MultiPartParser
+from starlette.responses import JSONResponse
+from config import get_settings
+
+settings = get_settings()
+
+# File parts larger than this are spooled to a temp file by the multipart parser instead of held in memory
+MultiPartParser.spool_max_size = settings.UPLOAD_SPOOL_BYTES
+
+# Per-worker counters for /dashboard/health
+upload_stats = {"in_memory": 0, "mapped": 0, "rejected": 0, "bytes": 0}
+
+
+class BodyTooLarge(HTTPException):
+    def __init__(self, limit: int):
+        upload_stats["rejected"] += 1
+        super().__init__(status_code=413, detail=f"Request body exceeds {limit} bytes")
+
+
+class BodyLimitMiddleware:
+    """
+    Refuse request bodies over a byte limit while they stream in, before the
+    multipart parser buffers or spools them. `limits` maps path prefixes to their
+    own caps (longest prefix wins); everything else gets `default`.
+    """
+
+    def __init__(self, app, default: int, limits: dict[str, int] | None = None):
+        self.app = app
+        self.default = default
+        self.limits = sorted((limits or {}).items(), key=lambda kv: len(kv[0]), reverse=True)
+
+    def _limit(self, path: str) -> int:
+        for prefix, limit in self.limits:
+            if path.startswith(prefix):
+                return limit
+        return self.default
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in ("GET", "HEAD", "OPTIONS"):
+            await self.app(scope, receive, send)
+            return
+        limit = self._limit(scope["path"])
+        declared = dict(scope["headers"]).get(b"content-length")
+        if declared and declared.isdigit() and int(declared) > limit:
+            exc = BodyTooLarge(limit)
+            await JSONResponse({"detail": exc.detail}, status_code=413)(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # An HTTPException, so FastAPI's body parsing passes it through as a 413
+                    raise BodyTooLarge(limit)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+class BufferReader(io.RawIOBase):
+    """Seekable, read-only file view over a bytes-like buffer (bytes, mmap) that doesn't copy it."""
+
+    def __init__(self, buf):
+        self._view = memoryview(buf)
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        n = max(0, min(len(b), len(self._view) - self._pos))
+        b[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._view)}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+
+def read_upload(photo: UploadFile, max_bytes: int | None = None) -> bytes | mmap.mmap:
+    """
+    An uploaded file as one buffer for the decoder, the hasher and the storage
+    uploader to share. Parts small enough to stay in memory are read out as bytes;
+    parts the parser spooled to disk are memory-mapped, so their pages are loaded
+    on demand rather than copied onto the heap. 413 over `max_bytes`.
+    """
+    max_bytes = max_bytes or settings.UPLOAD_MAX_BYTES
+    f = photo.file
+    size = photo.size
+    if size is None:
+        size = f.seek(0, io.SEEK_END)
+    if size > max_bytes:
+        raise BodyTooLarge(max_bytes)
+    f.seek(0)
+    upload_stats["bytes"] += size
+    if isinstance(f, SpooledTemporaryFile) and f._rolled and size > 0:
+        upload_stats["mapped"] += 1
+        # The mapping outlives the temp file's close, so background tasks can keep using it
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    upload_stats["in_memory"] += 1
+    return f.read()
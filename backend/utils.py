@@ -1,4 +1,5 @@
 import logging
+from datetime import datetime, timezone
 from config import get_settings
 from twilio.rest import Client
 from twilio.base.exceptions import TwilioRestException
@@ -6,6 +7,10 @@ from twilio.base.exceptions import TwilioRestException
 settings = get_settings()
 logger = logging.getLogger(__name__)
 
+def naive_utc(dt: datetime | None) -> datetime | None:
+    """Timestamp columns are naive UTC; query parameters and request bodies may carry an offset."""
+    return dt.astimezone(timezone.utc).replace(tzinfo=None) if dt and dt.tzinfo else dt
+
 def send_sms_alert(to_number: str, message_body: str) -> bool:
     """
     Sends an SMS alert using Twilio.
@@ -71,6 +71,9 @@ export const detectionsApi = {
   list: (limit = 50) => api.get('/detections', { params: { limit } }),
   create: (formData: FormData) =>
     api.post('/detections', formData, { headers: { 'Content-Type': undefined } }),
+  frameSpec: () => api.get('/detections/frame_spec'),
+  export: (params: { format?: 'csv' | 'ndjson' | 'geojson'; start?: string; end?: string; status?: string; case_id?: string }) =>
+    api.get('/detections/export', { params, responseType: 'blob' }),
   liveScan: (formData: FormData) =>
     api.post('/detections/live_scan', formData, { headers: { 'Content-Type': undefined } }),
   recent: () => api.get('/detections/recent'),
@@ -1,3 +1,43 @@
+/**
+ * Size that fits within maxWidth × maxHeight, keeping aspect ratio and never upscaling.
+ */
+export function fitWithin(width: number, height: number, maxWidth: number, maxHeight: number): { width: number; height: number } {
+  const scale = Math.min(1, maxWidth / width, maxHeight / height);
+  return { width: Math.round(width * scale), height: Math.round(height * scale) };
+}
+
+/**
+ * Encode a canvas as a Blob. Browsers that can't produce `type` silently fall
+ * back to PNG, so in that case retry as JPEG.
+ */
+export function canvasToBlob(canvas: HTMLCanvasElement, type: string, quality: number): Promise<Blob> {
+  return new Promise((resolve, reject) => {
+    canvas.toBlob((blob) => {
+      if (!blob) {
+        reject(new Error('Canvas to Blob failed'));
+      } else if (blob.type !== type && type !== 'image/jpeg') {
+        canvasToBlob(canvas, 'image/jpeg', quality).then(resolve, reject);
+      } else {
+        resolve(blob);
+      }
+    }, type, quality);
+  });
+}
+
+/**
+ * Draw a video frame onto `canvas` downscaled so its longer side is at most
+ * maxSide, and encode it with the first supported type.
+ */
+export function captureFrame(video: HTMLVideoElement, canvas: HTMLCanvasElement, maxSide: number, type = 'image/jpeg', quality = 0.8): Promise<Blob> {
+  const { width, height } = fitWithin(video.videoWidth, video.videoHeight, maxSide, maxSide);
+  canvas.width = width;
+  canvas.height = height;
+  const ctx = canvas.getContext('2d');
+  if (!ctx) return Promise.reject(new Error('Failed to get canvas context'));
+  ctx.drawImage(video, 0, 0, width, height);
+  return canvasToBlob(canvas, type, quality);
+}
+
 /**
  * Compress an image file to a maximum dimension while maintaining aspect ratio,
  * using canvas. Returns a Blob.
@@ -10,20 +50,7 @@ export async function compressImage(file: File, maxWidth = 1000, maxHeight = 100
       const img = new Image();
       img.src = event.target?.result as string;
       img.onload = () => {
-        let width = img.width;
-        let height = img.height;
-
-        if (width > height) {
-          if (width > maxWidth) {
-            height = Math.round((height *= maxWidth / width));
-            width = maxWidth;
-          }
-        } else {
-          if (height > maxHeight) {
-            width = Math.round((width *= maxHeight / height));
-            height = maxHeight;
-          }
-        }
+        const { width, height } = fitWithin(img.width, img.height, maxWidth, maxHeight);
 
         const canvas = document.createElement('canvas');
         canvas.width = width;
@@ -28,6 +28,7 @@ interface Detection {
   confidence: number | null
   status: string
   snapshot_url: string | null
+  thumb_url: string | null
 }
 
 const priorityColor: Record<string, string> = {
@@ -170,7 +171,7 @@ export default function Dashboard() {
                       <div className="flex items-center gap-4">
                         <div className="w-10 h-10 bg-slate-200 shrink-0 flex items-center justify-center p-0.5" style={{ borderRadius: '2px' }}>
                           {d.snapshot_url
-                            ? <img src={d.snapshot_url} className="w-full h-full object-cover" alt="" />
+                            ? <img src={d.thumb_url ?? d.snapshot_url} loading="lazy" className="w-full h-full object-cover" alt="" />
                             : <img src="https://api.dicebear.com/7.x/initials/svg?seed=JD&backgroundColor=e2e8f0" alt="Placeholder" />
                           }
                         </div>
@@ -1,6 +1,15 @@
 import { useState, useRef, useEffect } from 'react'
 import { Video, Camera, StopCircle, RefreshCw, ScanFace } from 'lucide-react'
 import { detectionsApi } from '@/lib/api'
+import { captureFrame } from '@/lib/imageUtils'
+
+interface FrameSpec {
+  max_side: number; mime_types: string[]; quality: number
+  max_bytes: number; max_pixels: number
+}
+
+// Used until the server's spec arrives (or if it can't be fetched)
+const DEFAULT_FRAME_SPEC: FrameSpec = { max_side: 640, mime_types: ['image/jpeg'], quality: 0.8, max_bytes: 2_000_000, max_pixels: 3840 * 2160 }
 
 export default function Live() {
   const videoRef = useRef<HTMLVideoElement>(null)
@@ -10,6 +19,13 @@ export default function Live() {
   const [isScanning, setIsScanning] = useState(false)
   const [logs, setLogs] = useState<string[]>([])
   const [location, setLocation] = useState<{lat: number, lng: number} | null>(null)
+  const [frameSpec, setFrameSpec] = useState<FrameSpec>(DEFAULT_FRAME_SPEC)
+
+  useEffect(() => {
+    detectionsApi.frameSpec()
+      .then(res => setFrameSpec(res.data))
+      .catch(() => console.warn('Frame spec unavailable, using defaults'))
+  }, [])
 
   useEffect(() => {
     if ('geolocation' in navigator) {
@@ -68,49 +84,50 @@ export default function Live() {
         
         const video = videoRef.current
         const canvas = canvasRef.current
-        const w = video.videoWidth
-        const h = video.videoHeight
-        if (w === 0 || h === 0) {
+        if (video.videoWidth === 0 || video.videoHeight === 0) {
             setIsScanning(false)
             return
         }
         
-        canvas.width = w
-        canvas.height = h
-        const ctx = canvas.getContext('2d')
-        if (ctx) {
-          ctx.drawImage(video, 0, 0, w, h)
-          canvas.toBlob(async (blob) => {
-            if (blob) {
-              addLog('Transmitting payload to National Registry Database...')
-              const fd = new FormData()
-              fd.append('photo', blob, 'scan.jpg')
-              if (location) {
-                fd.append('latitude', location.lat.toString())
-                fd.append('longitude', location.lng.toString())
-                addLog(`Geotag attached: ${location.lat.toFixed(2)}, ${location.lng.toFixed(2)}`)
-              }
-              
-              try {
-                const res = await detectionsApi.create(fd)
-                if (res.data.face_detected === false) {
-                   addLog(`WARNING: No face detected. Please align the subject properly inside the frame.`)
-                } else {
-                   if (res.data.person_id) {
-                     addLog(`🚨 MATCH FOUND: ${res.data.person_name} (${res.data.confidence ? (res.data.confidence*100).toFixed(1) : ''}% confidence)`)
-                   } else {
-                     addLog(`Subject evaluated: NO MATCH in registry.`)
-                   }
-                }
-              } catch (e) {
-                addLog('ERROR: Connection to main server failed.')
-              } finally {
-                setIsScanning(false)
-                addLog('Scan cycle completed.')
+        // Downscaled, lossy frame sized to what the detector actually uses
+        captureFrame(video, canvas, frameSpec.max_side, frameSpec.mime_types[0], frameSpec.quality)
+          .then(async (blob) => {
+            if (blob.size > frameSpec.max_bytes) {
+              addLog('ERROR: Captured frame exceeds the server size limit.')
+              setIsScanning(false)
+              return
+            }
+            addLog(`Transmitting payload to National Registry Database (${(blob.size / 1024).toFixed(0)} KB)...`)
+            const fd = new FormData()
+            fd.append('photo', blob, blob.type === 'image/webp' ? 'scan.webp' : 'scan.jpg')
+            if (location) {
+              fd.append('latitude', location.lat.toString())
+              fd.append('longitude', location.lng.toString())
+              addLog(`Geotag attached: ${location.lat.toFixed(2)}, ${location.lng.toFixed(2)}`)
+            }
+            
+            try {
+              const res = await detectionsApi.create(fd)
+              if (res.data.face_detected === false) {
+                 addLog(`WARNING: No face detected. Please align the subject properly inside the frame.`)
+              } else {
+                 if (res.data.person_id) {
+                   addLog(`🚨 MATCH FOUND: ${res.data.person_name} (${res.data.confidence ? (res.data.confidence*100).toFixed(1) : ''}% confidence)`)
+                 } else {
+                   addLog(`Subject evaluated: NO MATCH in registry.`)
+                 }
               }
+            } catch (e) {
+              addLog('ERROR: Connection to main server failed.')
+            } finally {
+              setIsScanning(false)
+              addLog('Scan cycle completed.')
             }
-          }, 'image/jpeg', 1.0)
-        }
+          })
+          .catch(() => {
+            addLog('ERROR: Could not capture frame.')
+            setIsScanning(false)
+          })
       }, 2000)
       
       return () => clearTimeout(timer)
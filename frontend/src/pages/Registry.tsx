@@ -8,7 +8,7 @@ import { compressImage } from '@/lib/imageUtils'
 interface Person {
   id: string; case_id: string; name: string; age: string | null
   contact: string | null; priority: string; photo_url: string | null
-  registered_at: string
+  thumb_url: string | null; registered_at: string
 }
 
 export default function Registry() {
@@ -233,7 +233,7 @@ export default function Registry() {
                     <td className="px-5 py-3">
                       <div className="w-10 h-10 bg-slate-200 flex items-center justify-center p-0.5" style={{ borderRadius: '2px' }}>
                         {p.photo_url
-                          ? <img src={p.photo_url} className="w-full h-full object-cover" alt="" />
+                          ? <img src={p.thumb_url ?? p.photo_url} loading="lazy" className="w-full h-full object-cover" alt="" />
                           : <img src="https://api.dicebear.com/7.x/initials/svg?seed=MP&backgroundColor=e2e8f0" alt="Placeholder" />}
                       </div>
                     </td>
@@ -6,7 +6,8 @@ interface Detection {
   id: string; case_id: string | null; person_name: string | null
   location: string | null; camera_id: string | null; timestamp: string
   confidence: number | null; status: string; sms_sent: boolean
-  snapshot_url: string | null
+  snapshot_url: string | null; thumb_url: string | null
+  hit_count?: number
 }
 
 const priorityColor: Record<string, string> = {
@@ -23,21 +24,14 @@ const priorityLabel: Record<string, string> = {
 export default function Reports() {
   const { data: detections, loading } = useFetch<Detection[]>('/detections?limit=100', [])
 
-  const exportCsv = () => {
-    if (!detections?.length) return
-    const rows = [
-      ['Case ID', 'Name', 'Location', 'Camera', 'Timestamp', 'Confidence', 'Status', 'SMS Sent'],
-      ...detections.map(d => [
-        d.case_id || '', d.person_name || '', d.location || '', d.camera_id || '',
-        d.timestamp, d.confidence != null ? ((1 - d.confidence) * 100).toFixed(1) + '%' : '',
-        d.status, d.sms_sent ? 'Yes' : 'No',
-      ])
-    ]
-    const csv = rows.map(r => r.join(',')).join('\n')
+  // Full export streamed by the server, not just the rows loaded on this page
+  const exportCsv = async () => {
+    const { data } = await detectionsApi.export({ format: 'csv' })
     const a = document.createElement('a')
-    a.href = URL.createObjectURL(new Blob([csv], { type: 'text/csv' }))
+    a.href = URL.createObjectURL(data)
     a.download = `detections_${new Date().toISOString().slice(0,10)}.csv`
     a.click()
+    URL.revokeObjectURL(a.href)
   }
 
   const confColor = (c: number | null) => {
@@ -101,7 +95,7 @@ export default function Reports() {
                   <td className="px-5 py-3">
                     <div className="w-8 h-8 bg-slate-200 flex items-center justify-center p-px" style={{ borderRadius: '2px' }}>
                       {d.snapshot_url
-                        ? <img src={d.snapshot_url} className="w-full h-full object-cover" alt="" />
+                        ? <img src={d.thumb_url ?? d.snapshot_url} loading="lazy" className="w-full h-full object-cover" alt="" />
                         : <ScanFace size={16} className="text-slate-400" />}
                     </div>
                   </td>
@@ -109,7 +103,9 @@ export default function Reports() {
                   <td className="px-5 py-3 text-slate-800 font-bold whitespace-nowrap">{d.person_name || 'Unknown'}</td>
                   <td className="px-5 py-3 text-slate-600 font-medium whitespace-nowrap">{d.location || '—'}</td>
                   <td className="px-5 py-3 text-slate-500 font-mono whitespace-nowrap">{d.camera_id || '—'}</td>
-                  <td className="px-5 py-3 text-slate-600 font-mono text-xs whitespace-nowrap">{new Date(d.timestamp).toLocaleString('en-GB')}</td>
+                  <td className="px-5 py-3 text-slate-600 font-mono text-xs whitespace-nowrap">{new Date(d.timestamp).toLocaleString('en-GB')}
+                    {(d.hit_count ?? 1) > 1 && <span className="ml-2 text-slate-400">×{d.hit_count}</span>}
+                  </td>
                   <td className="px-5 py-3 font-bold text-center" style={{ color: confColor(d.confidence) }}>
                     {d.confidence != null ? ((1 - d.confidence) * 100).toFixed(1) + '%' : '—'}
                   </td>